@@ -6,8 +6,11 @@ Routes are organized in separate blueprint modules in the routes package.
 """
 
 from flask import Flask
-from database import init_database, add_sample_data
+from database import init_database, add_sample_data, close_request_connection
 from routes import register_blueprints
+from commands import register_commands
+from services.overdue_sweep import start_overdue_scheduler
+from services.payment_jobs import start_payment_workers
 
 
 def create_app():
@@ -29,6 +32,21 @@ def create_app():
     # Register all route blueprints
     register_blueprints(app)
     
+    # Register command line tools (flask import-books, ...)
+    register_commands(app)
+    
+    # Hand the request-scoped database connection back to the pool
+    app.teardown_appcontext(close_request_connection)
+    
+    # Background threads start with a process's first request, so CLI commands never run them:
+    # - keep overdue_loans current (LIBRARY_SWEEP_INTERVAL seconds, 0 = off)
+    # - process queued payments and refunds (LIBRARY_PAYMENT_WORKERS threads, default 2; with 0,
+    #   jobs wait until a separate `flask payment-worker` process takes them)
+    @app.before_request
+    def start_background_workers():
+        start_overdue_scheduler()
+        start_payment_workers()
+    
     return app
 
 
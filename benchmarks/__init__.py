@@ -0,0 +1,4 @@
+"""
+Benchmarks Package - performance measurements for the Library Management System
+Scripts are run from the repository root, e.g. ``python -m benchmarks.bench_db_profile``
+"""
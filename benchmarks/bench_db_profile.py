@@ -0,0 +1,98 @@
+"""
+Read/write concurrency benchmark for the SQLite PRAGMA profiles.
+
+Runs catalog readers alongside borrow/return writers against a fresh database
+for each profile in database.PRAGMA_PROFILES and reports operations per second.
+
+    python -m benchmarks.bench_db_profile --books 2000 --readers 8 --writers 2 --seconds 5
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+import database
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+
+def seed_books(count: int) -> None:
+    with database.db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [(f"Book {i:07d}", f"Author {i % 500}", f"{i:013d}", 3, 3) for i in range(1, count + 1)])
+        conn.commit()
+
+
+def run_profile(profile: str, books: int, readers: int, writers: int, seconds: float) -> dict:
+    """Run the mixed workload against a fresh database using the given profile."""
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_all_connections()
+        database.DATABASE = os.path.join(tmp, "bench.db")
+        database.DB_PROFILE = profile
+        database.init_database()
+        seed_books(books)
+
+        counts = {"reads": 0, "writes": 0}
+        lock = threading.Lock()
+        stop = time.perf_counter() + seconds
+
+        def reader(seed):
+            rng = random.Random(seed)
+            done = 0
+            while time.perf_counter() < stop:
+                database.get_book_by_id(rng.randint(1, books))
+                database.get_patron_borrowed_books(f"{rng.randint(1, 50):06d}")
+                done += 2
+            with lock:
+                counts["reads"] += done
+
+        def writer(seed):
+            rng = random.Random(seed)
+            patron = f"{900000 + seed:06d}"
+            done = 0
+            while time.perf_counter() < stop:
+                book_id = rng.randint(1, books)
+                if borrow_book_by_patron(patron, book_id)[0]:
+                    return_book_by_patron(patron, book_id)
+                    done += 2
+                else:
+                    done += 1
+            with lock:
+                counts["writes"] += done
+
+        threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        database.close_all_connections()
+
+    return {
+        "profile": profile,
+        "reads_per_sec": counts["reads"] / seconds,
+        "writes_per_sec": counts["writes"] / seconds,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=2000)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--profiles", nargs="+", default=list(database.PRAGMA_PROFILES))
+    args = parser.parse_args(argv)
+
+    print(f"{'profile':<12} {'reads/s':>10} {'writes/s':>10}")
+    for profile in args.profiles:
+        result = run_profile(profile, args.books, args.readers, args.writers, args.seconds)
+        print(f"{result['profile']:<12} {result['reads_per_sec']:>10.0f} {result['writes_per_sec']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+ISBN search benchmark: indexed exact/prefix lookups vs. the old full-catalog scan.
+
+    python -m benchmarks.bench_isbn_search --books 1000000 --queries 2000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import database
+from services.library_service import search_books_in_catalog
+
+
+def seed_books(count: int, rng: random.Random) -> list:
+    """Insert ``count`` books with random 13-digit ISBNs, returning the ISBNs."""
+    isbns = list({f"978{rng.randrange(10**10):010d}" for _ in range(count)})
+    with database.db_connection() as conn:
+        for start in range(0, len(isbns), 50_000):
+            conn.executemany('''
+                INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                VALUES (?, ?, ?, 1, 1)
+            ''', [(f"Book {isbn}", "Author", isbn) for isbn in isbns[start:start + 50_000]])
+            conn.commit()
+    return isbns
+
+
+def time_per_call(fn, args_list) -> float:
+    start = time.perf_counter()
+    for args in args_list:
+        fn(*args)
+    return (time.perf_counter() - start) / len(args_list)
+
+
+def old_substring_scan(term: str) -> list:
+    """The pre-index ISBN path: load the whole catalog and filter in Python."""
+    return [b for b in database.get_all_books() if term in b["isbn"].lower()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_all_connections()
+        database.DATABASE = os.path.join(tmp, "bench.db")
+        database.init_database()
+
+        start = time.perf_counter()
+        isbns = seed_books(args.books, rng)
+        print(f"seeded {len(isbns)} books in {time.perf_counter() - start:.1f}s")
+
+        exact = [(rng.choice(isbns), "isbn") for _ in range(args.queries)]
+        prefix = [(rng.choice(isbns)[:7], "isbn") for _ in range(args.queries)]
+
+        print(f"{'query':<22} {'ms/query':>10}")
+        print(f"{'exact (indexed)':<22} {time_per_call(search_books_in_catalog, exact) * 1000:>10.3f}")
+        print(f"{'prefix 7 (indexed)':<22} {time_per_call(search_books_in_catalog, prefix) * 1000:>10.3f}")
+        print(f"{'substring scan (old)':<22} {time_per_call(old_substring_scan, [(exact[0][0],)]) * 1000:>10.3f}")
+        database.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Nightly billing benchmark: batch SQL late fees vs. per-loan calculate_late_fee_for_book.
+
+Seeds open loans with due dates spread over the last 60 days (and some in the
+future), checks the batch fees against find_late_fee, and times both paths.
+The per-loan path is timed on a sample and extrapolated.
+
+    python -m benchmarks.bench_late_fees --loans 10000000 --patrons 200000
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from services.library_service import (
+    calculate_late_fee_for_book, calculate_late_fees_batch, calculate_late_fees_by_loan, find_late_fee
+)
+
+
+def seed_loans(loans: int, patrons: int, rng: random.Random) -> None:
+    now = datetime.now()
+    with database.db_connection() as conn:
+        conn.executemany('''
+            INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, 'Author', ?, 1000000, 1000000)
+        ''', [(f"Book {i}", f"{i:013d}") for i in range(1, 1001)])
+        for start in range(0, loans, 100_000):
+            rows = []
+            for _ in range(min(100_000, loans - start)):
+                due = now - timedelta(days=rng.randint(-14, 60), hours=rng.randint(0, 23))
+                rows.append((f"{rng.randint(1, patrons):06d}", rng.randint(1, 1000),
+                             (due - timedelta(days=14)).isoformat(), due.isoformat()))
+            conn.executemany('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date) VALUES (?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--loans", type=int, default=10_000_000)
+    parser.add_argument("--patrons", type=int, default=200_000)
+    parser.add_argument("--sample", type=int, default=500, help="loans timed on the per-loan path")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_all_connections()
+        database.DATABASE = os.path.join(tmp, "bench.db")
+        database.init_database()
+
+        start = time.perf_counter()
+        seed_loans(args.loans, args.patrons, rng)
+        print(f"seeded {args.loans} loans in {time.perf_counter() - start:.1f}s")
+
+        start = time.perf_counter()
+        totals = calculate_late_fees_batch()
+        batch_seconds = time.perf_counter() - start
+        print(f"batch totals: {len(totals)} patrons, ${sum(totals.values()):,.2f} in {batch_seconds:.2f}s")
+
+        # Check the SQL tiers against find_late_fee on a sample of loans
+        today = datetime.now().date()
+        loans = calculate_late_fees_by_loan(rng.sample(sorted(totals), min(len(totals), 1000)))
+        for loan in loans:
+            days = max(0, (today - datetime.fromisoformat(loan["due_date"]).date()).days)
+            assert loan["fee_amount"] == find_late_fee(days), loan
+        print(f"verified {len(loans)} loans against find_late_fee")
+
+        sample = loans[:args.sample]
+        start = time.perf_counter()
+        for loan in sample:
+            calculate_late_fee_for_book(loan["patron_id"], loan["book_id"])
+        per_loan = (time.perf_counter() - start) / max(len(sample), 1)
+        print(f"per-loan path: {per_loan * 1000:.3f} ms/loan, ~{per_loan * args.loans:.0f}s for all loans "
+              f"({per_loan * args.loans / batch_seconds:.0f}x slower)")
+        database.close_all_connections()
+
+
+if __name__ == "__main__":
+    main()
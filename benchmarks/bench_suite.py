@@ -0,0 +1,439 @@
+"""
+Microbenchmarks for the service layer (services/library_service.py) and the
+database helpers (database.py), with JSON results for comparing commits.
+
+Builds a synthetic dataset (see benchmarks.datagen) in a temporary database,
+times every benchmark in BENCHMARKS and writes per-call latencies as JSON.
+Given a baseline from an earlier run, lists the benchmarks whose median got
+slower by more than --threshold and exits with status 1 if there are any.
+
+The book and catalog caches are off unless --cache is given, so the numbers
+measure the code and queries rather than cache hits. The payment gateway is
+an in-process stub.
+
+    python -m benchmarks.bench_suite --books 100000 --patrons 20000 --loans 500000 --output base.json
+    python -m benchmarks.bench_suite --books 100000 --patrons 20000 --loans 500000 --baseline base.json
+"""
+
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import database
+from benchmarks.datagen import generate_dataset, patron_id, TITLE_WORDS, LAST_NAMES
+from services import library_service
+from services.cache import Cache, set_cache
+from services.overdue_sweep import run_overdue_sweep
+from services.payment_service import PaymentGateway
+
+# name -> (setup, run, undo); see benchmark()
+BENCHMARKS: Dict[str, tuple] = {}
+
+
+def benchmark(name: str, setup: Optional[Callable] = None, undo: Optional[Callable] = None):
+    """
+    Register run(ctx, arg) as a benchmark. Only run is timed: setup(ctx) makes
+    its argument first, and undo(ctx, result) reverts any write it made so
+    every iteration sees the same database.
+    """
+    def register(run):
+        BENCHMARKS[name] = (setup, run, undo)
+        return run
+    return register
+
+
+class StubGateway(PaymentGateway):
+    """Gateway that answers at once, so payment benchmarks time the library's side."""
+
+    def process_payment(self, patron_id, amount, description=""):
+        return True, f"txn_{patron_id}_bench", f"Payment of ${amount:.2f} processed successfully"
+
+    def refund_payment(self, transaction_id, amount):
+        return True, f"Refund of ${amount:.2f} processed successfully"
+
+    def verify_payment_status(self, transaction_id):
+        return {"transaction_id": transaction_id, "status": "completed", "amount": 1.0}
+
+
+def build_context(dataset: Dict, seed: int) -> Dict:
+    """Sample the ids benchmarks draw from (patrons with loans, open and overdue loans)."""
+    with database.db_connection() as conn:
+        open_loans = [dict(row) for row in conn.execute('''
+            SELECT id, patron_id, book_id, due_date FROM borrow_records
+            WHERE return_date IS NULL ORDER BY id LIMIT 5000
+        ''')]
+        last_title = conn.execute('SELECT title FROM books ORDER BY title DESC, id DESC LIMIT 1').fetchone()
+    now = datetime.now().isoformat()
+    return {
+        'rng': random.Random(seed),
+        'dataset': dataset,
+        'gateway': StubGateway(),
+        'patrons': [loan['patron_id'] for loan in open_loans] or [patron_id(0)],
+        'open_loans': open_loans,
+        'overdue_loans': [loan for loan in open_loans if loan['due_date'] < now] or open_loans,
+        'last_title': last_title['title'] if last_title else '',
+        'counter': itertools.count(),
+    }
+
+
+def pick(ctx: Dict, key: str):
+    return ctx['rng'].choice(ctx[key])
+
+
+def bench_patrons(ctx: Dict, count: int = 100) -> List[str]:
+    return [pick(ctx, 'patrons') for _ in range(count)]
+
+
+def fresh_patron(ctx: Dict) -> str:
+    """A patron id outside the generated range, with no loans."""
+    return f"{999999 - next(ctx['counter']) % 1000:06d}"
+
+
+def fresh_isbn(ctx: Dict) -> str:
+    return f"999{next(ctx['counter']):010d}"
+
+
+def random_book(ctx: Dict) -> int:
+    return ctx['rng'].randint(1, max(1, ctx['dataset']['books']))
+
+
+def delete_payments(ctx: Dict, patron_ids: List[str]) -> None:
+    with database.db_connection() as conn:
+        conn.executemany('DELETE FROM payments WHERE patron_id = ?', [(p,) for p in patron_ids])
+        conn.commit()
+
+
+def undo_borrow(ctx: Dict, result) -> None:
+    patron, book_id, borrowed = result
+    if borrowed:
+        database.return_book_transaction(patron, book_id, datetime.now())
+
+
+def borrow_setup(ctx: Dict):
+    return fresh_patron(ctx), random_book(ctx)
+
+
+def return_setup(ctx: Dict):
+    patron, book_id = fresh_patron(ctx), random_book(ctx)
+    now = datetime.now()
+    database.borrow_book_transaction(patron, book_id, now, now + timedelta(days=14), library_service.MAX_BORROWED_BOOKS)
+    return patron, book_id
+
+
+#---------------------------------------------------------------------------------------------------------
+# services/library_service.py
+#---------------------------------------------------------------------------------------------------------
+
+@benchmark("library_service.validate_book")
+def _(ctx, arg):
+    return library_service.validate_book("The Benchmark", "Author", "9780000000001", 3)
+
+@benchmark("library_service.find_late_fee")
+def _(ctx, arg):
+    return library_service.find_late_fee(ctx['rng'].randint(0, 60))
+
+@benchmark("library_service.add_book_to_catalog", setup=fresh_isbn)
+def _(ctx, isbn):
+    return library_service.add_book_to_catalog("Benchmark Book", "Author", isbn, 2)
+
+@benchmark("library_service.borrow_book_by_patron", setup=borrow_setup, undo=undo_borrow)
+def _(ctx, arg):
+    return arg[0], arg[1], library_service.borrow_book_by_patron(*arg)[0]
+
+@benchmark("library_service.return_book_by_patron", setup=return_setup)
+def _(ctx, arg):
+    return library_service.return_book_by_patron(*arg)
+
+@benchmark("library_service.calculate_late_fee_for_book", setup=lambda ctx: pick(ctx, 'open_loans'))
+def _(ctx, loan):
+    return library_service.calculate_late_fee_for_book(loan['patron_id'], loan['book_id'])
+
+@benchmark("library_service.calculate_late_fees_batch (100 patrons)", setup=bench_patrons)
+def _(ctx, patrons):
+    return library_service.calculate_late_fees_batch(patrons)
+
+@benchmark("library_service.calculate_late_fees_by_loan (100 patrons)", setup=bench_patrons)
+def _(ctx, patrons):
+    return library_service.calculate_late_fees_by_loan(patrons)
+
+@benchmark("library_service.get_catalog_page (first)")
+def _(ctx, arg):
+    return library_service.get_catalog_page()
+
+@benchmark("library_service.get_catalog_page (last)")
+def _(ctx, arg):
+    return library_service.get_catalog_page(before_title=ctx['last_title'] + "~", before_id=0)
+
+@benchmark("library_service.search_books_in_catalog (title)", setup=lambda ctx: ctx['rng'].choice(TITLE_WORDS))
+def _(ctx, word):
+    return library_service.search_books_in_catalog(word, "title")
+
+@benchmark("library_service.search_books_in_catalog (author)", setup=lambda ctx: ctx['rng'].choice(LAST_NAMES))
+def _(ctx, name):
+    return library_service.search_books_in_catalog(name, "author")
+
+@benchmark("library_service.search_books_in_catalog (isbn)", setup=lambda ctx: f"978{random_book(ctx):010d}")
+def _(ctx, isbn):
+    return library_service.search_books_in_catalog(isbn, "isbn")
+
+@benchmark("library_service.search_books_in_catalog (isbn prefix)", setup=lambda ctx: f"978{random_book(ctx):010d}"[:8])
+def _(ctx, prefix):
+    return library_service.search_books_in_catalog(prefix, "isbn")
+
+@benchmark("library_service.get_patron_status_report", setup=lambda ctx: pick(ctx, 'patrons'))
+def _(ctx, patron):
+    return library_service.get_patron_status_report(patron)
+
+@benchmark("library_service.get_patron_status_reports (50 patrons)", setup=lambda ctx: bench_patrons(ctx, 50))
+def _(ctx, patrons):
+    return library_service.get_patron_status_reports(patrons)
+
+@benchmark("library_service.pay_late_fees", setup=lambda ctx: pick(ctx, 'overdue_loans'),
+           undo=lambda ctx, loan: delete_payments(ctx, [loan['patron_id']]))
+def _(ctx, loan):
+    library_service.pay_late_fees(loan['patron_id'], loan['book_id'], ctx['gateway'])
+    return loan
+
+@benchmark("library_service.pay_late_fees_batch (20 loans)",
+           setup=lambda ctx: [pick(ctx, 'overdue_loans') for _ in range(20)],
+           undo=lambda ctx, loans: delete_payments(ctx, [loan['patron_id'] for loan in loans]))
+def _(ctx, loans):
+    library_service.pay_late_fees_batch([(loan['patron_id'], loan['book_id']) for loan in loans], ctx['gateway'])
+    return loans
+
+@benchmark("library_service.refund_late_fee_payment")
+def _(ctx, arg):
+    return library_service.refund_late_fee_payment("txn_100000_bench", 1.0, ctx['gateway'])
+
+@benchmark("library_service.get_payment_status")
+def _(ctx, arg):
+    return library_service.get_payment_status("txn_100000_bench", ctx['gateway'])
+
+#---------------------------------------------------------------------------------------------------------
+# database.py
+#---------------------------------------------------------------------------------------------------------
+
+@benchmark("database.get_book_by_id", setup=random_book)
+def _(ctx, book_id):
+    return database.get_book_by_id(book_id)
+
+@benchmark("database.get_book_by_isbn", setup=lambda ctx: f"978{random_book(ctx):010d}")
+def _(ctx, isbn):
+    return database.get_book_by_isbn(isbn)
+
+@benchmark("database.search_books (title)", setup=lambda ctx: ctx['rng'].choice(TITLE_WORDS))
+def _(ctx, word):
+    return database.search_books(word, "title", library_service.SEARCH_RESULT_LIMIT)
+
+@benchmark("database.get_books_by_isbn_prefix", setup=lambda ctx: f"978{random_book(ctx):010d}"[:8])
+def _(ctx, prefix):
+    return database.get_books_by_isbn_prefix(prefix, library_service.SEARCH_RESULT_LIMIT)
+
+@benchmark("database.get_books_page (first)")
+def _(ctx, arg):
+    return database.get_books_page()
+
+@benchmark("database.iter_books (first 1000)")
+def _(ctx, arg):
+    return sum(1 for _ in itertools.islice(database.iter_books(), 1000))
+
+@benchmark("database.get_patron_borrowed_books", setup=lambda ctx: pick(ctx, 'patrons'))
+def _(ctx, patron):
+    return database.get_patron_borrowed_books(patron)
+
+@benchmark("database.get_patron_borrow_count", setup=lambda ctx: pick(ctx, 'patrons'))
+def _(ctx, patron):
+    return database.get_patron_borrow_count(patron)
+
+@benchmark("database.get_patron_loan_records (100 patrons)", setup=bench_patrons)
+def _(ctx, patrons):
+    return database.get_patron_loan_records(patrons)
+
+@benchmark("database.get_late_fee_totals (100 patrons)", setup=bench_patrons)
+def _(ctx, patrons):
+    return database.get_late_fee_totals(datetime.now().date(), library_service.DAILY_FEE_FIRST_7,
+                                        library_service.DAILY_FEE_AFTER_7, library_service.MAX_LATE_FEE, patrons)
+
+@benchmark("database.get_overdue_loans", setup=lambda ctx: pick(ctx, 'patrons'))
+def _(ctx, patron):
+    return database.get_overdue_loans(patron)
+
+@benchmark("database.get_open_loan", setup=lambda ctx: pick(ctx, 'open_loans'))
+def _(ctx, loan):
+    return database.get_open_loan(loan['patron_id'], loan['book_id'])
+
+@benchmark("database.get_catalog_state")
+def _(ctx, arg):
+    return database.get_catalog_state()
+
+@benchmark("database.insert_book", setup=fresh_isbn)
+def _(ctx, isbn):
+    return database.insert_book("Benchmark Book", "Author", isbn, 2, 2)
+
+@benchmark("database.borrow_book_transaction", setup=borrow_setup, undo=undo_borrow)
+def _(ctx, arg):
+    now = datetime.now()
+    status, _ = database.borrow_book_transaction(*arg, now, now + timedelta(days=14), library_service.MAX_BORROWED_BOOKS)
+    return arg[0], arg[1], status == 'borrowed'
+
+@benchmark("database.return_book_transaction", setup=return_setup)
+def _(ctx, arg):
+    return database.return_book_transaction(*arg, datetime.now())
+
+@benchmark("database.enqueue_payment_job + claim_payment_job")
+def _(ctx, arg):
+    database.enqueue_payment_job('payment', {'patron_id': patron_id(0), 'book_id': 1}, 5)
+    return database.claim_payment_job('bench')
+
+#---------------------------------------------------------------------------------------------------------
+# Running and comparing
+#---------------------------------------------------------------------------------------------------------
+
+def time_benchmark(ctx: Dict, name: str, iterations: int, warmup: int) -> Dict:
+    """Time ``iterations`` calls of one benchmark (after ``warmup`` untimed ones)."""
+    setup, run, undo = BENCHMARKS[name]
+    timings = []
+    for i in range(warmup + iterations):
+        arg = setup(ctx) if setup else None
+        start = time.perf_counter()
+        result = run(ctx, arg)
+        elapsed = time.perf_counter() - start
+        if undo:
+            undo(ctx, result)
+        if i >= warmup:
+            timings.append(elapsed)
+
+    timings.sort()
+    mean = statistics.fmean(timings)
+    return {
+        'iterations': iterations,
+        'median_us': statistics.median(timings) * 1e6,
+        'mean_us': mean * 1e6,
+        'p95_us': timings[min(len(timings) - 1, int(len(timings) * 0.95))] * 1e6,
+        'min_us': timings[0] * 1e6,
+        'ops_per_sec': 1 / mean if mean else 0.0,
+    }
+
+
+def run_benchmarks(ctx: Dict, iterations: int = 200, warmup: int = 20,
+                   patterns: Optional[List[str]] = None, progress: Optional[Callable] = None) -> Dict[str, Dict]:
+    """Run the benchmarks whose names match any of ``patterns`` (shell-style; default all)."""
+    results = {}
+    for name in BENCHMARKS:
+        if patterns and not any(fnmatch.fnmatch(name, pattern) for pattern in patterns):
+            continue
+        results[name] = time_benchmark(ctx, name, iterations, warmup)
+        if progress:
+            progress(name, results[name])
+    return results
+
+
+def compare_results(baseline: Dict, current: Dict, threshold: float) -> List[Dict]:
+    """
+    Benchmarks in both result files whose median is more than ``threshold``
+    (e.g. 0.1 for 10%) slower in ``current``, slowest first.
+    """
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if not before or not before['median_us']:
+            continue
+        change = result['median_us'] / before['median_us'] - 1
+        if change > threshold:
+            regressions.append({'name': name, 'baseline_us': before['median_us'],
+                                'current_us': result['median_us'], 'change': change})
+    return sorted(regressions, key=lambda r: r['change'], reverse=True)
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'db_profile': database.DB_PROFILE,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--patrons", type=int, default=5_000)
+    parser.add_argument("--loans", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", nargs="+", metavar="PATTERN", help="run matching benchmarks, e.g. 'database.*'")
+    parser.add_argument("--cache", action="store_true", help="leave the book and catalog caches on")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown of the median (0.10 = 10%%)")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return 0
+    if not args.cache:
+        database.book_cache.size = 0
+        set_cache(Cache())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_all_connections()
+        database.DATABASE = os.path.join(tmp, "bench.db")
+        database.init_database()
+
+        dataset = generate_dataset(args.books, args.patrons, args.loans, args.seed)
+        run_overdue_sweep()
+        print(f"generated {args.books} books, {args.patrons} patrons, {args.loans} loans "
+              f"in {dataset['seconds']:.1f}s", file=sys.stderr)
+
+        print(f"{'benchmark':<62} {'median us':>10} {'p95 us':>10} {'ops/s':>10}")
+        results = run_benchmarks(
+            build_context(dataset, args.seed), args.iterations, args.warmup, args.only,
+            lambda name, r: print(f"{name:<62} {r['median_us']:>10.1f} {r['p95_us']:>10.1f} {r['ops_per_sec']:>10.0f}"))
+        database.close_all_connections()
+
+    report = {
+        'environment': environment(),
+        'dataset': {key: dataset[key] for key in ('books', 'patrons', 'loans', 'seed')},
+        'settings': {'iterations': args.iterations, 'warmup': args.warmup, 'cache': args.cache},
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if not args.baseline:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('dataset') != report['dataset']:
+        print(f"warning: baseline dataset {baseline.get('dataset')} differs from {report['dataset']}", file=sys.stderr)
+    regressions = compare_results(baseline, report, args.threshold)
+    for r in regressions:
+        print(f"REGRESSION {r['name']}: {r['baseline_us']:.1f} -> {r['current_us']:.1f} us (+{r['change']:.0%})")
+    print(f"{len(regressions)} of {len(results)} benchmarks slower than baseline by more than {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
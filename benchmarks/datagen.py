@@ -0,0 +1,23 @@
+"""
+Synthetic dataset for benchmarks: books, patrons and their loan history.
+
+A thin wrapper over services.seed_data (the generator behind ``flask seed``),
+so benchmarks and local reproductions run against the same distributions.
+To build a standalone database at scale, use the command instead:
+
+    LIBRARY_DB_PATH=big.db flask --app app seed --books 2000000 --patrons 50000 --loans 10000000 --yes
+"""
+
+from typing import Dict
+
+from services.seed_data import seed_library, seed_patron_id as patron_id, TITLE_WORDS, LAST_NAMES
+
+
+def generate_dataset(books: int, patrons: int, loans: int, seed: int = 42) -> Dict:
+    """
+    Replace the current database's data with a generated catalog and loans.
+
+    Returns:
+        dict: the arguments plus open_loans, overdue_loans and seconds taken
+    """
+    return dict(seed_library(books, patrons, loans, seed), seed=seed)
@@ -0,0 +1,325 @@
+"""
+HTTP load test: many concurrent clients against an app from create_app().
+
+Builds a synthetic dataset (see benchmarks.datagen) in a temporary database,
+starts the app and runs --clients virtual clients for --duration seconds.
+Each client repeatedly picks a task from the mix (by weight) and records the
+latency of every request it makes. Borrowing clients use their own patron ids
+and return what they borrowed, so the writes can run indefinitely; whether a
+borrow or return went through is read from the message it flashed.
+
+Two transports, neither leaving the machine:
+    wsgi  Flask test clients calling the app in-process (default)
+    http  a threaded werkzeug server on 127.0.0.1, one keep-alive session per client
+
+Reports requests per second and latency percentiles per route, optionally as JSON.
+
+    python -m benchmarks.load_test --clients 16 --duration 30 --transport http --output load.json
+    python -m benchmarks.load_test --mix catalog=1,search=1 --clients 4
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import database
+from app import create_app
+from benchmarks.bench_suite import environment
+from benchmarks.datagen import generate_dataset, patron_id, TITLE_WORDS, LAST_NAMES
+from services.library_service import MAX_BORROWED_BOOKS
+
+# task -> weight; reads dominate, as in a library's day
+DEFAULT_MIX = {
+    'catalog': 30,
+    'catalog_next_page': 10,
+    'search': 20,
+    'api_search': 10,
+    'late_fee': 15,
+    'borrow': 8,
+    'return': 7,
+}
+
+
+FLASH_PATTERN = re.compile(r'<div class="flash-(\w+)">(.*?)</div>', re.S)
+
+def last_flash(app, body: str, cookie: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    The latest (category, message) flashed by a form post. Posts either
+    render a page showing their flashes (/return) or redirect with them left
+    in the session cookie (/borrow); the status code is 200 or 302 either way.
+    """
+    rendered = FLASH_PATTERN.findall(body)
+    if rendered:
+        return rendered[-1]
+    if not cookie:
+        return None
+    flashes = app.session_interface.get_signing_serializer(app).loads(cookie).get('_flashes')
+    return tuple(flashes[-1]) if flashes else None
+
+
+class WsgiTransport:
+    """Requests through Flask's test client: no sockets, measures the app alone."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def session(self):
+        client = self.app.test_client()
+        def send(method, path, params=None, data=None):
+            response = client.open(path, method=method, query_string=params, data=data)
+            if method == 'GET':
+                return response.status_code, None
+            cookie = client.get_cookie('session')
+            return response.status_code, last_flash(self.app, response.get_data(as_text=True),
+                                                    cookie.value if cookie else None)
+        return send
+
+    def close(self):
+        pass
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args):
+        pass
+
+
+class HttpTransport:
+    """Requests over loopback HTTP to a threaded werkzeug server running the app."""
+
+    def __init__(self, app):
+        self.app = app
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}"
+        self.thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def session(self):
+        http = requests.Session()
+        def send(method, path, params=None, data=None):
+            response = http.request(method, self.base_url + path, params=params, data=data,
+                                    allow_redirects=False, timeout=30)
+            if method == 'GET':
+                return response.status_code, None
+            return response.status_code, last_flash(self.app, response.text, http.cookies.get('session'))
+        return send
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+TRANSPORTS = {'wsgi': WsgiTransport, 'http': HttpTransport}
+
+
+class VirtualClient:
+    """One simulated user: a session, a patron id and the books it has out."""
+
+    def __init__(self, send: Callable, patron: str, books: int, seed: int):
+        self.send = send
+        self.patron = patron
+        self.books = books
+        self.rng = random.Random(seed)
+        self.borrowed: List[int] = []
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    def request(self, route: str, method: str, path: str, params=None, data=None) -> bool:
+        """Make one timed request; whether it succeeded (by status, and by its flash for form posts)."""
+        start = time.perf_counter()
+        try:
+            status, flash = self.send(method, path, params, data)
+        except Exception:
+            status, flash = 599, None
+        self.latencies[route].append(time.perf_counter() - start)
+        if status >= 400:
+            self.errors[route] += 1
+            return False
+        return method == 'GET' or (flash is not None and flash[0] == 'success')
+
+    def random_book(self) -> int:
+        return self.rng.randint(1, self.books)
+
+    # Tasks ---------------------------------------------------------------------------------------------
+
+    def catalog(self):
+        self.request('GET /catalog', 'GET', '/catalog')
+
+    def catalog_next_page(self):
+        word = self.rng.choice(TITLE_WORDS).title()
+        self.request('GET /catalog?after_title', 'GET', '/catalog',
+                     params={'after_title': f"The {word}", 'after_id': 0})
+
+    def search(self):
+        search_type = self.rng.choice(('title', 'author', 'isbn'))
+        term = {'title': lambda: self.rng.choice(TITLE_WORDS),
+                'author': lambda: self.rng.choice(LAST_NAMES),
+                'isbn': lambda: f"978{self.random_book():010d}"}[search_type]()
+        self.request('GET /search', 'GET', '/search', params={'q': term, 'type': search_type})
+
+    def api_search(self):
+        self.request('GET /api/search', 'GET', '/api/search', params={'q': self.rng.choice(TITLE_WORDS)})
+
+    def late_fee(self):
+        self.request('GET /api/late_fee', 'GET',
+                     f"/api/late_fee/{patron_id(self.rng.randrange(1000))}/{self.random_book()}")
+
+    def borrow(self):
+        if len(self.borrowed) >= MAX_BORROWED_BOOKS:
+            return self.return_()
+        book_id = self.random_book()
+        # unavailable books and repeat borrows are refused; only books actually lent are returned later
+        if self.request('POST /borrow', 'POST', '/borrow', data={'patron_id': self.patron, 'book_id': book_id}):
+            self.borrowed.append(book_id)
+
+    def return_(self):
+        if not self.borrowed:
+            return self.borrow()
+        book_id = self.borrowed[self.rng.randrange(len(self.borrowed))]
+        if self.request('POST /return', 'POST', '/return', data={'patron_id': self.patron, 'book_id': book_id}):
+            self.borrowed.remove(book_id)
+
+    def run(self, mix: Dict[str, int], deadline: float, think_time: float) -> None:
+        tasks = [getattr(self, 'return_' if name == 'return' else name) for name in mix]
+        weights = list(mix.values())
+        while time.perf_counter() < deadline:
+            self.rng.choices(tasks, weights)[0]()
+            if think_time:
+                time.sleep(self.rng.uniform(0, 2 * think_time))
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))]
+
+
+def summarize(clients: List[VirtualClient], seconds: float) -> Dict:
+    """Merge the clients' samples into per-route throughput and latency percentiles (ms)."""
+    latencies, errors = defaultdict(list), defaultdict(int)
+    for client in clients:
+        for route, samples in client.latencies.items():
+            latencies[route].extend(samples)
+        for route, count in client.errors.items():
+            errors[route] += count
+
+    routes = {}
+    for route in sorted(latencies):
+        samples = sorted(latencies[route])
+        routes[route] = {
+            'requests': len(samples),
+            'errors': errors[route],
+            'requests_per_sec': len(samples) / seconds,
+            'mean_ms': sum(samples) / len(samples) * 1000,
+            'p50_ms': percentile(samples, 0.50) * 1000,
+            'p90_ms': percentile(samples, 0.90) * 1000,
+            'p99_ms': percentile(samples, 0.99) * 1000,
+            'max_ms': samples[-1] * 1000,
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'seconds': seconds,
+        'clients': len(clients),
+        'requests': total,
+        'errors': sum(route['errors'] for route in routes.values()),
+        'requests_per_sec': total / seconds,
+        'routes': routes,
+    }
+
+
+def run_load(app, clients: int, duration: float, mix: Dict[str, int] = DEFAULT_MIX, transport: str = 'wsgi',
+             think_time: float = 0.0, seed: int = 42) -> Dict:
+    """Run the virtual clients against ``app`` for ``duration`` seconds and summarize."""
+    unknown = set(mix) - set(DEFAULT_MIX)
+    if unknown:
+        raise ValueError(f"Unknown tasks {sorted(unknown)}; expected some of {list(DEFAULT_MIX)}")
+    with database.db_connection() as conn:
+        books = conn.execute('SELECT MAX(id) FROM books').fetchone()[0] or 1
+
+    server = TRANSPORTS[transport](app)
+    try:
+        # patron ids above the generated ones, so each client's borrowing limit is its own
+        users = [VirtualClient(server.session(), f"{999999 - i:06d}", books, seed + i) for i in range(clients)]
+        deadline = time.perf_counter() + duration
+        start = time.perf_counter()
+        threads = [threading.Thread(target=user.run, args=(mix, deadline, think_time)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+    finally:
+        server.close()
+
+    for user in users:  # hand the books back for the next run on this database
+        for book_id in user.borrowed:
+            database.return_book_transaction(user.patron, book_id, datetime.now())
+    return summarize(users, seconds)
+
+
+def parse_mix(text: str) -> Dict[str, int]:
+    """'catalog=3,borrow=1' -> {'catalog': 3, 'borrow': 1}"""
+    try:
+        return {name.strip(): int(weight) for name, weight in (item.split('=') for item in text.split(','))}
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected task=weight pairs, e.g. catalog=3,borrow=1")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--books", type=int, default=20_000)
+    parser.add_argument("--patrons", type=int, default=5_000)
+    parser.add_argument("--loans", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause between a client's requests (s)")
+    parser.add_argument("--transport", choices=list(TRANSPORTS), default="wsgi")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help=f"task weights (default: {','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items())})")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.close_all_connections()
+        database.DATABASE = os.path.join(tmp, "load.db")
+        database.init_database()
+        dataset = generate_dataset(args.books, args.patrons, args.loans, args.seed)
+        print(f"generated {args.books} books, {args.patrons} patrons, {args.loans} loans "
+              f"in {dataset['seconds']:.1f}s", file=sys.stderr)
+
+        app = create_app()
+        try:
+            report = run_load(app, args.clients, args.duration, args.mix, args.transport, args.think_time, args.seed)
+        except ValueError as e:
+            parser.error(str(e))
+        database.close_all_connections()
+
+    print(f"{'route':<26} {'reqs':>8} {'errors':>7} {'req/s':>9} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for route, r in report['routes'].items():
+        print(f"{route:<26} {r['requests']:>8} {r['errors']:>7} {r['requests_per_sec']:>9.1f} "
+              f"{r['p50_ms']:>8.2f} {r['p90_ms']:>8.2f} {r['p99_ms']:>8.2f} {r['max_ms']:>8.2f}")
+    print(f"{'total':<26} {report['requests']:>8} {report['errors']:>7} {report['requests_per_sec']:>9.1f}")
+
+    if args.output:
+        report = dict(report, environment=environment(),
+                      dataset={key: dataset[key] for key in ('books', 'patrons', 'loans', 'seed')},
+                      settings={'transport': args.transport, 'think_time': args.think_time, 'mix': args.mix})
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Command line interface for the Library Management System.
+
+Commands are registered on the Flask app, e.g. ``flask --app app import-books acquisitions.csv``
+"""
+
+import time
+import click
+from services.catalog_import import import_books_from_file, IMPORT_BATCH_SIZE, IMPORT_FORMATS
+from services.overdue_sweep import run_overdue_sweep
+from services.payment_jobs import PaymentWorkerPool, PAYMENT_JOB_WORKERS
+from services.seed_data import (
+    seed_library, SEED_BOOKS, SEED_PATRONS, SEED_LOANS, SEED_HISTORY_DAYS, SEED_POPULARITY, SEED_OVERDUE_RATE
+)
+from database import reconcile_patron_counters
+import database
+
+
+@click.command('import-books')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(IMPORT_FORMATS), default=None,
+              help='File format (default: from the file extension).')
+@click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True,
+              help='Rows per transaction.')
+@click.option('--max-errors', default=20, show_default=True,
+              help='Row errors to print.')
+def import_books_command(path, fmt, batch_size, max_errors):
+    """Bulk import books from a CSV or JSON-lines file."""
+    try:
+        report = import_books_from_file(path, fmt, batch_size)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    for line_no, message in report['errors'][:max_errors]:
+        click.echo(f"line {line_no}: {message}" if line_no else message, err=True)
+    if len(report['errors']) > max_errors:
+        click.echo(f"... {len(report['errors']) - max_errors} more errors", err=True)
+
+    click.echo(f"Imported {report['imported']} of {report['rows']} rows "
+               f"in {report['seconds']:.1f}s ({report['rows_per_second']:.0f} rows/s), "
+               f"{len(report['errors'])} errors.")
+
+
+@click.command('sweep-overdue')
+@click.option('--full', is_flag=True, help='Rebuild from every open loan instead of incrementally.')
+@click.option('--as-of', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Date to compute fees for (default: today).')
+def sweep_overdue_command(full, as_of):
+    """Update the overdue_loans table with newly overdue loans and current fees."""
+    result = run_overdue_sweep(as_of.date() if as_of else None, full)
+    click.echo(f"Overdue sweep up to {result['cutoff']}: {result['added']} added, "
+               f"{result['updated']} updated, {result['removed']} removed.")
+
+
+@click.command('reconcile-patrons')
+@click.option('--fix', is_flag=True, help='Reset drifted counters to the counted values.')
+def reconcile_patrons_command(fix):
+    """Check each patron's open-loan counter against borrow_records."""
+    mismatches = reconcile_patron_counters(fix)
+    for row in mismatches:
+        click.echo(f"patron {row['patron_id']}: counter {row['counter']}, open loans {row['actual']}")
+    if not mismatches:
+        click.echo("All patron counters match borrow_records.")
+    elif fix:
+        click.echo(f"Fixed {len(mismatches)} patron counters.")
+    else:
+        raise click.ClickException(f"{len(mismatches)} patron counters out of sync (rerun with --fix).")
+
+
+@click.command('payment-worker')
+@click.option('--workers', default=max(PAYMENT_JOB_WORKERS, 1), show_default=True,
+              help='Worker threads in this process.')
+def payment_worker_command(workers):
+    """Process queued payments and refunds until interrupted."""
+    pool = PaymentWorkerPool(workers)
+    pool.start()
+    click.echo(f"Processing payment jobs with {workers} workers (Ctrl+C to stop).")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pool.stop()
+    click.echo(f"Processed {pool.processed} jobs.")
+
+
+@click.command('seed')
+@click.option('--books', default=SEED_BOOKS, show_default=True, help='Catalog size.')
+@click.option('--patrons', default=SEED_PATRONS, show_default=True, help='Patrons with borrow history.')
+@click.option('--loans', default=SEED_LOANS, show_default=True, help='Borrow records, open and returned.')
+@click.option('--seed', 'seed', default=42, show_default=True, help='Random seed; the same seed gives the same data.')
+@click.option('--history-days', default=SEED_HISTORY_DAYS, show_default=True, help='How far back borrowing goes.')
+@click.option('--popularity', default=SEED_POPULARITY, show_default=True,
+              help='Zipf exponent of title popularity (higher = loans concentrated on fewer titles).')
+@click.option('--overdue-rate', default=SEED_OVERDUE_RATE, show_default=True,
+              help='Share of loans past due that were never returned.')
+@click.option('--yes', is_flag=True, help='Replace existing data without asking.')
+def seed_command(books, patrons, loans, seed, history_days, popularity, overdue_rate, yes):
+    """Replace all library data with a large generated catalog and borrow history."""
+    if not yes:
+        click.confirm(f"Replace all books, loans and payments in {database.DATABASE}?", abort=True)
+    try:
+        report = seed_library(books, patrons, loans, seed, history_days, popularity, overdue_rate)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    run_overdue_sweep(full=True)
+
+    click.echo(f"Seeded {report['books']} books and {report['loans']} loans for {report['patrons']} patrons "
+               f"in {report['seconds']:.1f}s ({report['rows_per_second']:.0f} rows/s): "
+               f"{report['open_loans']} open, {report['overdue_loans']} overdue.")
+
+
+def register_commands(app):
+    """Register all CLI commands with the Flask app."""
+    app.cli.add_command(import_books_command)
+    app.cli.add_command(sweep_overdue_command)
+    app.cli.add_command(reconcile_patrons_command)
+    app.cli.add_command(payment_worker_command)
+    app.cli.add_command(seed_command)
@@ -4,118 +4,770 @@ Handles all database operations and connections
 """
 
 import sqlite3, os # GD ADDED - added os
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import json, queue, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from flask import g, has_app_context
 
 # Database configuration
 DATABASE = os.getenv("LIBRARY_DB_PATH", "library.db") # GD CHANGED - DATABASE = 'library.db'
+DB_PROFILE = os.getenv("LIBRARY_DB_PROFILE", "performance")
+DB_PRAGMAS = os.getenv("LIBRARY_DB_PRAGMAS", "")  # e.g. "cache_size=-20000,mmap_size=0"
+POOL_SIZE = int(os.getenv("LIBRARY_DB_POOL_SIZE", "8"))
+CATALOG_PAGE_SIZE = int(os.getenv("LIBRARY_CATALOG_PAGE_SIZE", "50"))
+BOOK_CACHE_SIZE = int(os.getenv("LIBRARY_BOOK_CACHE_SIZE", "1024"))  # 0 disables the cache
+BOOK_CACHE_TTL = float(os.getenv("LIBRARY_BOOK_CACHE_TTL", "60"))  # seconds
+# Values bound per IN (...) query; stays well under SQLite's host parameter limit
+QUERY_BATCH_SIZE = 500
+
+# PRAGMA settings applied to every new connection, by profile name
+PRAGMA_PROFILES = {
+    # SQLite defaults: rollback journal, full fsync on every commit
+    'default': {},
+    # WAL lets catalog reads run alongside borrow/return writes
+    'performance': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative means KiB, i.e. 64 MiB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+def get_pragmas(profile: Optional[str] = None, overrides: Optional[str] = None) -> Dict[str, object]:
+    """
+    Get the PRAGMA settings for a profile, with "name=value,..." overrides applied.
+
+    Raises:
+        ValueError: if the profile or an override is not recognised
+    """
+    profile = DB_PROFILE if profile is None else profile
+    overrides = DB_PRAGMAS if overrides is None else overrides
+    if profile not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown database profile {profile!r}; expected one of {sorted(PRAGMA_PROFILES)}")
+    
+    pragmas = dict(PRAGMA_PROFILES[profile])
+    for item in filter(None, (part.strip() for part in overrides.split(','))):
+        name, sep, value = item.partition('=')
+        if not sep or not name.strip().isidentifier() or not value.strip().replace('-', '').isalnum():
+            raise ValueError(f"Invalid PRAGMA override {item!r}; expected name=value")
+        pragmas[name.strip()] = value.strip()
+    return pragmas
 
 def get_db_connection():
-    """Get a database connection."""
-    conn = sqlite3.connect(DATABASE)
+    """Open a new database connection (pooled connections are created through here)."""
+    # Pooled connections are handed between threads, one borrower at a time
+    conn = sqlite3.connect(DATABASE, check_same_thread=False)
     conn.row_factory = sqlite3.Row  # This enables column access by name
+    for name, value in get_pragmas().items():
+        conn.execute(f'PRAGMA {name} = {value}')
     return conn
 
-def init_database():
-    """Initialize the database with required tables."""
-    conn = get_db_connection()
+class ConnectionPool:
+    """
+    Keeps idle connections to one database file so helpers can reuse them
+    instead of opening a new connection per call.
+
+    At most ``size`` idle connections are kept; extra connections handed back
+    while the pool is full are closed. Connections are health checked when
+    they are taken out of the pool and replaced if they no longer work.
+    """
+
+    def __init__(self, database: str, size: int = POOL_SIZE):
+        self.database = database
+        self.size = size
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def acquire(self) -> sqlite3.Connection:
+        """Take an idle healthy connection, or open a new one."""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return get_db_connection()
+            if _is_healthy(conn):
+                return conn
+            _close_quietly(conn)
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Hand a connection back, discarding any uncommitted work."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            self._idle.put_nowait(conn)
+        except (queue.Full, sqlite3.Error):
+            _close_quietly(conn)
+
+    def close_all(self) -> None:
+        """Close every idle connection."""
+        while True:
+            try:
+                _close_quietly(self._idle.get_nowait())
+            except queue.Empty:
+                return
+
+def _is_healthy(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.execute('SELECT 1').fetchone()
+        return True
+    except sqlite3.Error:
+        return False
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    """Get the connection pool for the currently configured DATABASE."""
+    path = DATABASE
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(path, ConnectionPool(path))
+    return pool
+
+def close_all_connections() -> None:
+    """Close and forget every pooled connection (e.g. when switching databases)."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close_all()
+
+@contextmanager
+def db_connection() -> Iterator[sqlite3.Connection]:
+    """
+    Borrow a database connection.
+
+    Inside a Flask app context the same connection is reused for the whole
+    request and handed back by close_request_connection() on teardown.
+    Elsewhere (CLI, tests, background threads) it goes back to the pool as
+    soon as the block exits.
+    """
+    if has_app_context():
+        conn = g.get('_library_db')
+        if conn is None:
+            pool = get_pool()
+            conn = pool.acquire()
+            g._library_db = conn
+            g._library_db_pool = pool
+        yield conn
+        return
+
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+def close_request_connection(exception=None) -> None:
+    """Return the request-scoped connection to its pool (app teardown hook)."""
+    conn = g.pop('_library_db', None)
+    pool = g.pop('_library_db_pool', None)
+    if conn is not None:
+        pool.release(conn)
+
+# Secondary indexes created by init_database(), by name
+INDEXES = {
+    # Open loans per patron: borrow count, borrowed list (ordered by borrow_date), returns
+    'idx_borrow_records_open_patron': '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_open_patron
+        ON borrow_records (patron_id, borrow_date) WHERE return_date IS NULL
+    ''',
+    # Full loan history per patron
+    'idx_borrow_records_patron': '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_patron
+        ON borrow_records (patron_id)
+    ''',
+    # Loans of a given book
+    'idx_borrow_records_book': '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_book
+        ON borrow_records (book_id)
+    ''',
+    # Open loans by due date: finding loans that fell due since the last overdue sweep
+    'idx_borrow_records_open_due': '''
+        CREATE INDEX IF NOT EXISTS idx_borrow_records_open_due
+        ON borrow_records (due_date) WHERE return_date IS NULL
+    ''',
+    # Materialized overdue loans per patron
+    'idx_overdue_loans_patron': '''
+        CREATE INDEX IF NOT EXISTS idx_overdue_loans_patron
+        ON overdue_loans (patron_id)
+    ''',
+    # Payments ledger rows of a gateway transaction (one charge may cover several loans)
+    'idx_payments_transaction': '''
+        CREATE INDEX IF NOT EXISTS idx_payments_transaction
+        ON payments (transaction_id) WHERE transaction_id IS NOT NULL
+    ''',
+    # Succeeded payments of a loan, for charging only what is still unpaid when a fee grows
+    'idx_payments_loan': '''
+        CREATE INDEX IF NOT EXISTS idx_payments_loan
+        ON payments (loan_id) WHERE status = 'succeeded'
+    ''',
+    # Queued payment jobs in the order they become due
+    'idx_payment_jobs_queued': '''
+        CREATE INDEX IF NOT EXISTS idx_payment_jobs_queued
+        ON payment_jobs (run_after) WHERE status = 'queued'
+    ''',
+    # Running payment jobs, for requeueing those of crashed workers
+    'idx_payment_jobs_running': '''
+        CREATE INDEX IF NOT EXISTS idx_payment_jobs_running
+        ON payment_jobs (updated_at) WHERE status = 'running'
+    ''',
+    # Catalog order (title, then id via the implicit rowid) for listing and keyset paging
+    'idx_books_title': '''
+        CREATE INDEX IF NOT EXISTS idx_books_title
+        ON books (title)
+    ''',
+}
+
+def create_indexes(conn: sqlite3.Connection) -> None:
+    """Create every index in INDEXES that does not exist yet."""
+    for sql in INDEXES.values():
+        conn.execute(sql)
+
+# Triggers keeping the books_fts full-text index in sync with books
+SEARCH_INDEX_TRIGGERS = [
+    '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_insert AFTER INSERT ON books BEGIN
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_delete AFTER DELETE ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS books_fts_update AFTER UPDATE OF title, author ON books BEGIN
+            INSERT INTO books_fts (books_fts, rowid, title, author) VALUES ('delete', old.id, old.title, old.author);
+            INSERT INTO books_fts (rowid, title, author) VALUES (new.id, new.title, new.author);
+        END
+    ''',
+]
+
+def create_search_index(conn: sqlite3.Connection) -> bool:
+    """
+    Create the books_fts trigram index over book titles and authors.
+
+    The index is filled from existing rows when first created and kept in sync
+    by triggers afterwards.
+
+    Returns:
+        bool: False if this SQLite build has no FTS5 trigram support
+    """
+    if not _has_search_index(conn, refresh=True):
+        try:
+            conn.execute('''
+                CREATE VIRTUAL TABLE books_fts USING fts5(
+                    title, author, content='books', content_rowid='id', tokenize='trigram'
+                )
+            ''')
+        except sqlite3.OperationalError:
+            return False
+        conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
     
-    # Create books table
+    for sql in SEARCH_INDEX_TRIGGERS:
+        conn.execute(sql)
+    _search_index_available[DATABASE] = True
+    return True
+
+# Triggers bumping the catalog version (and recording when it changed) on every
+# change to books, so cached catalog pages and search results keyed by version
+# are never served stale
+CATALOG_VERSION_TRIGGERS = {
+    f'catalog_version_{event.lower()}': f'''
+        CREATE TRIGGER catalog_version_{event.lower()} AFTER {event} ON books BEGIN
+            UPDATE catalog_meta SET value = CASE name
+                WHEN 'catalog_version' THEN value + 1
+                ELSE CAST(strftime('%s', 'now') AS INTEGER) END
+            WHERE name IN ('catalog_version', 'catalog_modified');
+        END
+    '''
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+}
+
+def create_catalog_version(conn: sqlite3.Connection) -> None:
+    """
+    Create the catalog_meta table holding the catalog version and the time
+    (Unix seconds) it last changed, and the triggers maintaining both.
+
+    The triggers are recreated each time so existing databases pick up
+    changes to their bodies.
+    """
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            isbn TEXT UNIQUE NOT NULL,
-            total_copies INTEGER NOT NULL,
-            available_copies INTEGER NOT NULL
+        CREATE TABLE IF NOT EXISTS catalog_meta (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
         )
     ''')
-    
-    # Create borrow_records table
     conn.execute('''
-        CREATE TABLE IF NOT EXISTS borrow_records (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            patron_id TEXT NOT NULL,
-            book_id INTEGER NOT NULL,
-            borrow_date TEXT NOT NULL,
-            due_date TEXT NOT NULL,
-            return_date TEXT,
-            FOREIGN KEY (book_id) REFERENCES books (id)
+        INSERT OR IGNORE INTO catalog_meta (name, value)
+        VALUES ('catalog_version', 0), ('catalog_modified', CAST(strftime('%s', 'now') AS INTEGER))
+    ''')
+    for name, sql in CATALOG_VERSION_TRIGGERS.items():
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+        conn.execute(sql)
+
+def get_catalog_version() -> int:
+    """Get the catalog version, which changes whenever any book row is written."""
+    with db_connection() as conn:
+        row = conn.execute("SELECT value FROM catalog_meta WHERE name = 'catalog_version'").fetchone()
+    return row['value'] if row else 0
+
+def get_catalog_state() -> Tuple[int, int]:
+    """
+    Get the catalog version and when it last changed.
+
+    Returns:
+        tuple: (version, last modified as Unix seconds)
+    """
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT name, value FROM catalog_meta WHERE name IN ('catalog_version', 'catalog_modified')
+        ''').fetchall()
+    state = {row['name']: row['value'] for row in rows}
+    return state.get('catalog_version', 0), state.get('catalog_modified', 0)
+
+# Triggers keeping patrons.open_loans equal to the patron's open borrow_records,
+# inside whichever transaction opens, closes or deletes the loan
+PATRON_COUNTER_TRIGGERS = [
+    '''
+        CREATE TRIGGER IF NOT EXISTS patrons_loan_insert AFTER INSERT ON borrow_records
+        WHEN new.return_date IS NULL BEGIN
+            INSERT INTO patrons (patron_id, open_loans) VALUES (new.patron_id, 1)
+            ON CONFLICT (patron_id) DO UPDATE SET open_loans = open_loans + 1;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS patrons_loan_return AFTER UPDATE OF return_date ON borrow_records
+        WHEN old.return_date IS NULL AND new.return_date IS NOT NULL BEGIN
+            UPDATE patrons SET open_loans = open_loans - 1 WHERE patron_id = old.patron_id;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS patrons_loan_reopen AFTER UPDATE OF return_date ON borrow_records
+        WHEN old.return_date IS NOT NULL AND new.return_date IS NULL BEGIN
+            INSERT INTO patrons (patron_id, open_loans) VALUES (new.patron_id, 1)
+            ON CONFLICT (patron_id) DO UPDATE SET open_loans = open_loans + 1;
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS patrons_loan_delete AFTER DELETE ON borrow_records
+        WHEN old.return_date IS NULL BEGIN
+            UPDATE patrons SET open_loans = open_loans - 1 WHERE patron_id = old.patron_id;
+        END
+    ''',
+]
+
+# Open loans per patron as recorded in borrow_records
+_OPEN_LOAN_COUNTS = '''
+    SELECT patron_id, COUNT(*) AS open_loans FROM borrow_records
+    WHERE return_date IS NULL GROUP BY patron_id
+'''
+
+def create_patron_counters(conn: sqlite3.Connection) -> None:
+    """
+    Create the patrons table of open-loan counters.
+
+    The counters are filled from borrow_records when the table is first
+    created and kept in sync by triggers afterwards.
+    """
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'patrons'").fetchone()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS patrons (
+            patron_id TEXT PRIMARY KEY,
+            open_loans INTEGER NOT NULL DEFAULT 0
         )
     ''')
+    if not exists:
+        conn.execute(f'INSERT INTO patrons (patron_id, open_loans) {_OPEN_LOAN_COUNTS}')
     
-    conn.commit()
-    conn.close()
+    for sql in PATRON_COUNTER_TRIGGERS:
+        conn.execute(sql)
 
-def add_sample_data():
-    """Add sample data to the database if it's empty."""
-    conn = get_db_connection()
-    book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
-    
-    if book_count == 0:
-        # Add sample books
-        sample_books = [
-            ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
-            ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
-            ('1984', 'George Orwell', '9780451524935', 1)
-        ]
+# Whether books_fts exists, by database path (looked up once per database)
+_search_index_available: Dict[str, bool] = {}
+
+def _has_search_index(conn: sqlite3.Connection, refresh: bool = False) -> bool:
+    available = _search_index_available.get(DATABASE)
+    if available is None or refresh:
+        found = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'books_fts'").fetchone()
+        available = _search_index_available[DATABASE] = found is not None
+    return available
+
+def init_database():
+    """Initialize the database with required tables."""
+    with db_connection() as conn:
+        # Create books table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS books (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                author TEXT NOT NULL,
+                isbn TEXT UNIQUE NOT NULL,
+                total_copies INTEGER NOT NULL,
+                available_copies INTEGER NOT NULL
+            )
+        ''')
         
-        for title, author, isbn, copies in sample_books:
-            conn.execute('''
-                INSERT INTO books (title, author, isbn, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (title, author, isbn, copies, copies))
+        # Create borrow_records table
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS borrow_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                patron_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                borrow_date TEXT NOT NULL,
+                due_date TEXT NOT NULL,
+                return_date TEXT,
+                FOREIGN KEY (book_id) REFERENCES books (id)
+            )
+        ''')
         
-        # Make 1984 unavailable by adding a borrow record
+        # Create overdue_loans table (filled by sweep_overdue_loans)
         conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', ('123456', 3, 
-              (datetime.now() - timedelta(days=5)).isoformat(),
-              (datetime.now() + timedelta(days=9)).isoformat()))
+            CREATE TABLE IF NOT EXISTS overdue_loans (
+                loan_id INTEGER PRIMARY KEY,
+                patron_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                due_date TEXT NOT NULL,
+                days_overdue INTEGER NOT NULL,
+                fee_amount REAL NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (loan_id) REFERENCES borrow_records (id)
+            )
+        ''')
         
-        # Update available copies for 1984
-        conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
+        # Create payments ledger (one row per late fee payment attempt, by idempotency key)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payments (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                idempotency_key TEXT UNIQUE NOT NULL,
+                charge_key TEXT,
+                patron_id TEXT NOT NULL,
+                book_id INTEGER NOT NULL,
+                loan_id INTEGER,
+                amount REAL NOT NULL,
+                status TEXT NOT NULL,
+                transaction_id TEXT,
+                message TEXT,
+                refunded_amount REAL NOT NULL DEFAULT 0,
+                gateway_status TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
+        
+        # Create payment_jobs queue (payments and refunds processed by background workers)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS payment_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                run_after TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                locked_by TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+        ''')
         
+        # Create sweep_state table (progress markers for background jobs)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS sweep_state (
+                name TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            )
+        ''')
+
+        create_indexes(conn)
+        create_search_index(conn)
+        create_patron_counters(conn)
+        create_catalog_version(conn)
+
         conn.commit()
-    
-    conn.close()
+
+def add_sample_data():
+    """Add sample data to the database if it's empty."""
+    with db_connection() as conn:
+        book_count = conn.execute('SELECT COUNT(*) as count FROM books').fetchone()['count']
+        
+        if book_count == 0:
+            # Add sample books
+            sample_books = [
+                ('The Great Gatsby', 'F. Scott Fitzgerald', '9780743273565', 3),
+                ('To Kill a Mockingbird', 'Harper Lee', '9780061120084', 2),
+                ('1984', 'George Orwell', '9780451524935', 1)
+            ]
+            
+            for title, author, isbn, copies in sample_books:
+                conn.execute('''
+                    INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (title, author, isbn, copies, copies))
+            
+            # Make 1984 unavailable by adding a borrow record
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', ('123456', 3, 
+                  (datetime.now() - timedelta(days=5)).isoformat(),
+                  (datetime.now() + timedelta(days=9)).isoformat()))
+            
+            # Update available copies for 1984
+            conn.execute('UPDATE books SET available_copies = 0 WHERE id = 3')
+            
+            conn.commit()
 
 # Helper Functions for Database Operations
 
 def get_all_books() -> List[Dict]:
     """Get all books from the database."""
-    conn = get_db_connection()
-    books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
-    conn.close()
+    with db_connection() as conn:
+        books = conn.execute('SELECT * FROM books ORDER BY title').fetchall()
     return [dict(book) for book in books]
 
+def get_books_page(after_title: Optional[str] = None, after_id: Optional[int] = None,
+                   limit: int = CATALOG_PAGE_SIZE, before_title: Optional[str] = None,
+                   before_id: Optional[int] = None) -> Tuple[List[Dict], bool]:
+    """
+    Get one page of the catalog in (title, id) order using keyset pagination.
+
+    Pass the title/id of the last book on the current page as after_* for the
+    next page, or of the first book as before_* for the previous page. With
+    neither, the first page is returned. Each page reads only ``limit`` + 1
+    rows from the title index, however deep into the catalog it is.
+
+    Returns:
+        tuple: (books in catalog order, whether more books exist past this
+        page in the direction of travel)
+    """
+    with db_connection() as conn:
+        if before_title is not None and before_id is not None:
+            books = conn.execute('''
+                SELECT * FROM books WHERE (title, id) < (?, ?)
+                ORDER BY title DESC, id DESC LIMIT ?
+            ''', (before_title, before_id, limit + 1)).fetchall()
+            has_more = len(books) > limit
+            books = books[:limit][::-1]
+        elif after_title is not None and after_id is not None:
+            books = conn.execute('''
+                SELECT * FROM books WHERE (title, id) > (?, ?)
+                ORDER BY title, id LIMIT ?
+            ''', (after_title, after_id, limit + 1)).fetchall()
+            has_more = len(books) > limit
+            books = books[:limit]
+        else:
+            books = conn.execute('''
+                SELECT * FROM books ORDER BY title, id LIMIT ?
+            ''', (limit + 1,)).fetchall()
+            has_more = len(books) > limit
+            books = books[:limit]
+    return [dict(book) for book in books], has_more
+
+# Rows pulled from SQLite per fetch while streaming exports
+EXPORT_FETCH_SIZE = 1000
+
+def _iter_rows(sql: str, params: Tuple = ()) -> Iterator[Dict]:
+    """
+    Stream query results row by row, fetching EXPORT_FETCH_SIZE rows at a time.
+
+    Uses its own pooled connection rather than the request-scoped one, since
+    streamed responses keep reading after the view function has returned.
+    """
+    pool = get_pool()
+    conn = pool.acquire()
+    try:
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        pool.release(conn)
+
+def iter_books() -> Iterator[Dict]:
+    """Stream every book in id order without loading the catalog into memory."""
+    return _iter_rows('''
+        SELECT id, title, author, isbn, total_copies, available_copies FROM books ORDER BY id
+    ''')
+
+def iter_open_loans() -> Iterator[Dict]:
+    """Stream every open loan with its book title and ISBN, in loan id order."""
+    return _iter_rows('''
+        SELECT br.id AS loan_id, br.patron_id, br.book_id, b.title, b.isbn,
+               br.borrow_date, br.due_date
+        FROM borrow_records br
+        JOIN books b ON br.book_id = b.id
+        WHERE br.return_date IS NULL
+        ORDER BY br.id
+    ''')
+
+class BookCache:
+    """
+    Least-recently-used cache of book rows by (database, book id).
+
+    Entries expire ``ttl`` seconds after they were loaded, which bounds how
+    stale a book can get when another process writes to the same database.
+    Writes made through this module invalidate the affected book right away;
+    a row read before such an invalidation is not stored (see ``generation``).
+    """
+
+    def __init__(self, size: int = BOOK_CACHE_SIZE, ttl: float = BOOK_CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0  # bumped by every invalidation
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, Dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, book_id: int) -> Optional[Dict]:
+        key = (DATABASE, book_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            if entry:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, book: Dict, generation: int) -> None:
+        """Store a book read while ``generation`` was current."""
+        if self.size <= 0:
+            return
+        key = (DATABASE, book['id'])
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, dict(book))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, book_id: Optional[int] = None) -> None:
+        """Drop one book, or every cached book when no id is given."""
+        with self._lock:
+            self.generation += 1
+            if book_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop((DATABASE, book_id), None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'capacity': self.size}
+
+book_cache = BookCache()
+
 def get_book_by_id(book_id: int) -> Optional[Dict]:
-    """Get a specific book by ID."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
-    conn.close()
-    return dict(book) if book else None
+    """Get a specific book by ID (served from book_cache when possible)."""
+    book = book_cache.get(book_id)
+    if book is not None:
+        return book
+    generation = book_cache.generation
+    with db_connection() as conn:
+        book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    if not book:
+        return None
+    book = dict(book)
+    book_cache.put(book, generation)
+    return dict(book)
+
+# Trigram index terms must be at least this long; shorter terms fall back to LIKE
+MIN_FTS_TERM_LENGTH = 3
+
+def _like_pattern(term: str) -> str:
+    """Escape LIKE wildcards in a user supplied term."""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+def search_books(term: str, field: str, limit: int) -> List[Dict]:
+    """
+    Case-insensitive partial-match search on title or author, best matches first.
+
+    Goes through the books_fts trigram index, ranked with titles/authors
+    starting with the term first and then by relevance. Only up to ``limit``
+    rows are read.
+
+    Args:
+        term: text to find anywhere in the field
+        field: 'title' or 'author'
+        limit: maximum number of books to return
+    """
+    if field not in ('title', 'author'):
+        raise ValueError(f"Cannot search books by {field!r}")
+    
+    prefix = _like_pattern(term) + '%'
+    with db_connection() as conn:
+        if len(term) >= MIN_FTS_TERM_LENGTH and _has_search_index(conn):
+            # Quote the term as an FTS5 string so its punctuation is not parsed as query syntax
+            query = field + ' : "' + term.replace('"', '""') + '"'
+            books = conn.execute(f'''
+                SELECT b.* FROM books_fts f
+                JOIN books b ON b.id = f.rowid
+                WHERE books_fts MATCH ?
+                ORDER BY (b.{field} LIKE ? ESCAPE '\\') DESC, f.rank, b.title
+                LIMIT ?
+            ''', (query, prefix, limit)).fetchall()
+        else:
+            books = conn.execute(f'''
+                SELECT * FROM books
+                WHERE {field} LIKE ? ESCAPE '\\'
+                ORDER BY ({field} LIKE ? ESCAPE '\\') DESC, title
+                LIMIT ?
+            ''', ('%' + _like_pattern(term) + '%', prefix, limit)).fetchall()
+    return [dict(book) for book in books]
+
+def get_books_by_isbn_prefix(prefix: str, limit: int) -> List[Dict]:
+    """
+    Get books whose ISBN starts with a prefix (e.g. a publisher prefix), in ISBN order.
+
+    Runs as a range query on the UNIQUE index over books.isbn.
+    """
+    # Every string starting with the prefix sorts in [prefix, prefix with its last character bumped)
+    upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    with db_connection() as conn:
+        books = conn.execute('''
+            SELECT * FROM books WHERE isbn >= ? AND isbn < ? ORDER BY isbn LIMIT ?
+        ''', (prefix, upper, limit)).fetchall()
+    return [dict(book) for book in books]
 
 def get_book_by_isbn(isbn: str) -> Optional[Dict]:
     """Get a specific book by ISBN."""
-    conn = get_db_connection()
-    book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
-    conn.close()
+    with db_connection() as conn:
+        book = conn.execute('SELECT * FROM books WHERE isbn = ?', (isbn,)).fetchone()
     return dict(book) if book else None
 
 def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     """Get currently borrowed books for a patron."""
-    conn = get_db_connection()
-    records = conn.execute('''
-        SELECT br.*, b.title, b.author 
-        FROM borrow_records br 
-        JOIN books b ON br.book_id = b.id 
-        WHERE br.patron_id = ? AND br.return_date IS NULL
-        ORDER BY br.borrow_date
-    ''', (patron_id,)).fetchall()
-    conn.close()
+    with db_connection() as conn:
+        records = conn.execute('''
+            SELECT br.*, b.title, b.author 
+            FROM borrow_records br 
+            JOIN books b ON br.book_id = b.id 
+            WHERE br.patron_id = ? AND br.return_date IS NULL
+            ORDER BY br.borrow_date
+        ''', (patron_id,)).fetchall()
     
     borrowed_books = []
     for record in records:
@@ -130,72 +782,733 @@ def get_patron_borrowed_books(patron_id: str) -> List[Dict]:
     
     return borrowed_books
 
+def get_patron_loan_records(patron_ids: List[str]) -> Dict[str, List[Dict]]:
+    """
+    Get every loan (open and returned) with book title and author for many patrons.
+
+    Runs one query per QUERY_BATCH_SIZE patrons instead of one per patron or loan.
+
+    Returns:
+        dict: patron_id -> list of loans ordered by borrow_date; patrons with no
+        loans are absent
+    """
+    patron_ids = list(dict.fromkeys(patron_ids))
+    loans: Dict[str, List[Dict]] = {}
+    with db_connection() as conn:
+        for start in range(0, len(patron_ids), QUERY_BATCH_SIZE):
+            batch = patron_ids[start:start + QUERY_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            records = conn.execute(f'''
+                SELECT br.patron_id, br.book_id, br.borrow_date, br.due_date, br.return_date,
+                       b.title, b.author
+                FROM borrow_records br
+                JOIN books b ON br.book_id = b.id
+                WHERE br.patron_id IN ({placeholders})
+                ORDER BY br.patron_id, br.borrow_date
+            ''', batch).fetchall()
+
+            for record in records:
+                loans.setdefault(record['patron_id'], []).append({
+                    'book_id': record['book_id'],
+                    'title': record['title'],
+                    'author': record['author'],
+                    'borrow_date': datetime.fromisoformat(record['borrow_date']),
+                    'due_date': datetime.fromisoformat(record['due_date']),
+                    'return_date': datetime.fromisoformat(record['return_date']) if record['return_date'] else None,
+                })
+
+    return loans
+
+def _days_overdue_sql(due_date: str) -> str:
+    """SQL for whole days between a due_date column and the :as_of date (never negative)."""
+    return f"MAX(0, CAST(julianday(:as_of) - julianday(substr({due_date}, 1, 10)) AS INTEGER))"
+
+def _late_fee_sql(days: str) -> str:
+    """SQL for the tiered late fee of ``days`` overdue using :first_rate, :later_rate and :max_fee."""
+    return f'''CASE WHEN {days} <= 0 THEN 0.0
+                    ELSE MIN(MIN({days}, 7) * :first_rate + MAX({days} - 7, 0) * :later_rate, :max_fee)
+               END'''
+
+def _open_loan_fees_query(patron_count: Optional[int], extra_filter: str = '') -> str:
+    """
+    SQL computing days overdue and the late fee of every open loan as of a date.
+
+    Named parameters: as_of (YYYY-MM-DD), first_rate (daily fee for the first
+    7 days), later_rate (daily fee after that), max_fee, and p0..pN patron IDs
+    when filtering by patron. Mirrors library_service.find_late_fee exactly.
+    """
+    patron_filter = ''
+    if patron_count:
+        patron_filter = f"AND br.patron_id IN ({', '.join(f':p{i}' for i in range(patron_count))})"
+    return f'''
+        SELECT loan_id, patron_id, book_id, due_date, days_overdue,
+               {_late_fee_sql('days_overdue')} AS fee_amount
+        FROM (
+            SELECT br.id AS loan_id, br.patron_id, br.book_id, br.due_date,
+                   {_days_overdue_sql('br.due_date')} AS days_overdue
+            FROM borrow_records br
+            WHERE br.return_date IS NULL {patron_filter} {extra_filter}
+        )
+    '''
+
+def _open_loan_fees_batches(as_of: date, first_rate: float, later_rate: float, max_fee: float,
+                            patron_ids: Optional[List[str]]) -> Iterator[Tuple[Optional[int], Dict]]:
+    """Split a patron filter into (patron count, named parameters) batches of QUERY_BATCH_SIZE."""
+    rates = {'as_of': as_of.isoformat(), 'first_rate': first_rate, 'later_rate': later_rate, 'max_fee': max_fee}
+    if patron_ids is None:
+        yield None, rates
+        return
+    
+    patron_ids = list(dict.fromkeys(patron_ids))
+    for start in range(0, len(patron_ids), QUERY_BATCH_SIZE):
+        batch = patron_ids[start:start + QUERY_BATCH_SIZE]
+        yield len(batch), dict(rates, **{f'p{i}': patron_id for i, patron_id in enumerate(batch)})
+
+def get_open_loan_fees(as_of: date, first_rate: float, later_rate: float, max_fee: float,
+                       patron_ids: Optional[List[str]] = None) -> List[Dict]:
+    """
+    Compute days overdue and late fee for every open loan in SQL.
+
+    Args:
+        as_of: date to compute fees for
+        first_rate: daily fee for the first 7 days overdue
+        later_rate: daily fee for each day after that
+        max_fee: fee cap per loan
+        patron_ids: only these patrons' loans (default: all open loans)
+
+    Returns:
+        list: {'loan_id', 'patron_id', 'book_id', 'due_date', 'days_overdue', 'fee_amount'} dicts
+    """
+    loans = []
+    with db_connection() as conn:
+        for patron_count, params in _open_loan_fees_batches(as_of, first_rate, later_rate, max_fee, patron_ids):
+            loans.extend(dict(row) for row in conn.execute(_open_loan_fees_query(patron_count), params))
+    return loans
+
+def get_late_fee_totals(as_of: date, first_rate: float, later_rate: float, max_fee: float,
+                        patron_ids: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Total late fees per patron over their open loans, aggregated in SQL.
+
+    Same arguments as get_open_loan_fees; patrons with no open loans are absent.
+    """
+    totals = {}
+    with db_connection() as conn:
+        for patron_count, params in _open_loan_fees_batches(as_of, first_rate, later_rate, max_fee, patron_ids):
+            rows = conn.execute(f'''
+                SELECT patron_id, SUM(fee_amount) AS total
+                FROM ({_open_loan_fees_query(patron_count)})
+                GROUP BY patron_id
+            ''', params)
+            totals.update((row['patron_id'], row['total']) for row in rows)
+    return totals
+
+def sweep_overdue_loans(as_of: date, first_rate: float, later_rate: float, max_fee: float,
+                        full: bool = False) -> Dict:
+    """
+    Bring the overdue_loans table up to date as of a date, in one transaction.
+
+    Only loans that fell due since the previous sweep are read from
+    borrow_records (via the open-loan due_date index). Loans already in
+    overdue_loans get their days overdue and fee refreshed, and are dropped
+    once returned. ``full`` rebuilds the table from every open loan instead.
+
+    Returns:
+        dict: {'added': int, 'updated': int, 'removed': int, 'cutoff': str}
+    """
+    cutoff = as_of.isoformat()  # loans due before this date are at least a day overdue
+    params = {'as_of': cutoff, 'first_rate': first_rate, 'later_rate': later_rate,
+              'max_fee': max_fee, 'now': datetime.now().isoformat()}
+    days = _days_overdue_sql('due_date')
+    
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            if full:
+                conn.execute('DELETE FROM overdue_loans')
+                last_cutoff = ''
+            else:
+                row = conn.execute("SELECT value FROM sweep_state WHERE name = 'overdue_cutoff'").fetchone()
+                last_cutoff = row['value'] if row else ''
+            
+            removed = conn.execute('''
+                DELETE FROM overdue_loans WHERE loan_id IN (
+                    SELECT o.loan_id FROM overdue_loans o
+                    JOIN borrow_records br ON br.id = o.loan_id
+                    WHERE br.return_date IS NOT NULL
+                )
+            ''').rowcount
+            
+            updated = conn.execute(f'''
+                UPDATE overdue_loans
+                SET days_overdue = {days}, fee_amount = {_late_fee_sql(days)}, updated_at = :now
+            ''', params).rowcount
+            
+            added = 0
+            if cutoff > last_cutoff:
+                added = conn.execute(f'''
+                    INSERT OR REPLACE INTO overdue_loans
+                        (loan_id, patron_id, book_id, due_date, days_overdue, fee_amount, updated_at)
+                    SELECT loan_id, patron_id, book_id, due_date, days_overdue, fee_amount, :now
+                    FROM ({_open_loan_fees_query(None, 'AND br.due_date >= :due_from AND br.due_date < :as_of')})
+                ''', dict(params, due_from=last_cutoff)).rowcount
+                last_cutoff = cutoff
+            
+            conn.executemany('''
+                INSERT INTO sweep_state (name, value) VALUES (?, ?)
+                ON CONFLICT (name) DO UPDATE SET value = excluded.value
+            ''', [('overdue_cutoff', last_cutoff), ('overdue_last_run', params['now'])])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    return {'added': added, 'updated': updated, 'removed': removed, 'cutoff': last_cutoff}
+
+def get_overdue_loans(patron_id: str) -> List[Dict]:
+    """Get a patron's loans from the last overdue sweep, with book titles, oldest due first."""
+    with db_connection() as conn:
+        loans = conn.execute('''
+            SELECT o.loan_id, o.book_id, b.title, o.due_date, o.days_overdue, o.fee_amount, o.updated_at
+            FROM overdue_loans o
+            JOIN books b ON b.id = o.book_id
+            WHERE o.patron_id = ?
+            ORDER BY o.due_date
+        ''', (patron_id,)).fetchall()
+    return [dict(loan) for loan in loans]
+
 def get_patron_borrow_count(patron_id: str) -> int:
-    """Get the number of books currently borrowed by a patron."""
-    conn = get_db_connection()
-    count = conn.execute('''
-        SELECT COUNT(*) as count FROM borrow_records 
-        WHERE patron_id = ? AND return_date IS NULL
-    ''', (patron_id,)).fetchone()['count']
-    conn.close()
-    return count
+    """Get the number of books currently borrowed by a patron (from the patrons counter)."""
+    with db_connection() as conn:
+        row = conn.execute('SELECT open_loans FROM patrons WHERE patron_id = ?', (patron_id,)).fetchone()
+    return row['open_loans'] if row else 0
+
+def reconcile_patron_counters(fix: bool = False) -> List[Dict]:
+    """
+    Compare every patrons.open_loans counter with a count over borrow_records.
+
+    Args:
+        fix: overwrite the drifted counters with the counted values
+
+    Returns:
+        list: [{'patron_id': str, 'counter': int, 'actual': int}] for each mismatch
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            mismatches = conn.execute(f'''
+                WITH counts AS ({_OPEN_LOAN_COUNTS})
+                SELECT p.patron_id, p.open_loans AS counter, COALESCE(c.open_loans, 0) AS actual
+                FROM patrons p LEFT JOIN counts c ON c.patron_id = p.patron_id
+                WHERE p.open_loans != COALESCE(c.open_loans, 0)
+                UNION ALL
+                SELECT c.patron_id, 0, c.open_loans FROM counts c
+                WHERE NOT EXISTS (SELECT 1 FROM patrons p WHERE p.patron_id = c.patron_id)
+                ORDER BY 1
+            ''').fetchall()
+            mismatches = [dict(row) for row in mismatches]
+            if fix:
+                conn.executemany('''
+                    INSERT INTO patrons (patron_id, open_loans) VALUES (:patron_id, :actual)
+                    ON CONFLICT (patron_id) DO UPDATE SET open_loans = excluded.open_loans
+                ''', mismatches)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return mismatches
 
 def insert_book(title: str, author: str, isbn: str, total_copies: int, available_copies: int) -> bool:
     """Insert a new book into the database."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO books (title, author, isbn, total_copies, available_copies)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (title, author, isbn, total_copies, available_copies))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with db_connection() as conn:
+        try:
+            book_id = conn.execute('''
+                INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (title, author, isbn, total_copies, available_copies)).lastrowid
+            conn.commit()
+            book_cache.invalidate(book_id)
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
+
+def get_existing_isbns(isbns: List[str]) -> set:
+    """Get which of the given ISBNs are already in the catalog (one query per QUERY_BATCH_SIZE ISBNs)."""
+    isbns = list(dict.fromkeys(isbns))
+    existing = set()
+    with db_connection() as conn:
+        for start in range(0, len(isbns), QUERY_BATCH_SIZE):
+            batch = isbns[start:start + QUERY_BATCH_SIZE]
+            placeholders = ', '.join('?' * len(batch))
+            rows = conn.execute(f'SELECT isbn FROM books WHERE isbn IN ({placeholders})', batch).fetchall()
+            existing.update(row['isbn'] for row in rows)
+    return existing
+
+def insert_books(books: List[Tuple[str, str, str, int, int]]) -> int:
+    """
+    Insert many books in one transaction.
+
+    Args:
+        books: (title, author, isbn, total_copies, available_copies) tuples
+
+    Returns:
+        int: number of books inserted; rows whose ISBN already exists are skipped
+    """
+    with db_connection() as conn:
+        try:
+            inserted = conn.executemany('''
+                INSERT INTO books (title, author, isbn, total_copies, available_copies)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (isbn) DO NOTHING
+            ''', books).rowcount
+            conn.commit()
+            return inserted
+        except Exception:
+            conn.rollback()
+            raise
+
+# Tables emptied by bulk_load_library (children first)
+LIBRARY_DATA_TABLES = ('payment_jobs', 'payments', 'overdue_loans', 'sweep_state', 'patrons', 'borrow_records', 'books')
+
+def bulk_load_library(books: Iterable[Tuple[str, str, str, int]],
+                      loans: Iterable[Tuple[str, int, str, str, Optional[str]]],
+                      batch_size: int = 50_000) -> Dict[str, int]:
+    """
+    Replace all library data with the given books and loans, in one transaction.
+
+    Triggers and indexes are dropped for the load and rebuilt once at the
+    end: the search index, patron counters, available_copies and the catalog
+    version come out as if every row had been written one at a time.
+
+    Args:
+        books: (title, author, isbn, total_copies) rows; they get ids 1, 2, ...
+            in order, which is what loans refer to
+        loans: (patron_id, book_id, borrow_date, due_date, return_date) rows,
+            dates as ISO strings and return_date None for open loans
+
+    Returns:
+        dict: number of books and loans loaded
+    """
+    counts = {'books': 0, 'loans': 0}
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            triggers = conn.execute('''
+                SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name IN ('books', 'borrow_records')
+            ''').fetchall()
+            for row in triggers:
+                conn.execute(f"DROP TRIGGER {row['name']}")
+            for name in INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+            for table in LIBRARY_DATA_TABLES:
+                conn.execute(f'DELETE FROM {table}')
+            conn.execute(f"DELETE FROM sqlite_sequence WHERE name IN ({', '.join('?' * len(LIBRARY_DATA_TABLES))})",
+                         LIBRARY_DATA_TABLES)
+
+            for rows, sql, key in (
+                (((title, author, isbn, copies, copies) for title, author, isbn, copies in books), '''
+                    INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES (?, ?, ?, ?, ?)
+                ''', 'books'),
+                (loans, '''
+                    INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date, return_date)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', 'loans'),
+            ):
+                rows = iter(rows)
+                while batch := list(islice(rows, batch_size)):
+                    conn.executemany(sql, batch)
+                    counts[key] += len(batch)
+
+            create_indexes(conn)
+            conn.execute('''
+                UPDATE books SET available_copies = total_copies - (
+                    SELECT COUNT(*) FROM borrow_records WHERE book_id = books.id AND return_date IS NULL
+                ) WHERE id IN (SELECT book_id FROM borrow_records WHERE return_date IS NULL)
+            ''')
+            if _has_search_index(conn, refresh=True):
+                conn.execute("INSERT INTO books_fts (books_fts) VALUES ('rebuild')")
+                for sql in SEARCH_INDEX_TRIGGERS:
+                    conn.execute(sql)
+            conn.execute(f'INSERT INTO patrons (patron_id, open_loans) {_OPEN_LOAN_COUNTS}')
+            for sql in PATRON_COUNTER_TRIGGERS:
+                conn.execute(sql)
+            conn.execute('''
+                UPDATE catalog_meta SET value = CASE name
+                    WHEN 'catalog_version' THEN value + 1
+                    ELSE CAST(strftime('%s', 'now') AS INTEGER) END
+                WHERE name IN ('catalog_version', 'catalog_modified')
+            ''')
+            for sql in CATALOG_VERSION_TRIGGERS.values():
+                conn.execute(sql)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    book_cache.invalidate()
+    return counts
 
 def insert_borrow_record(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime) -> bool:
     """Insert a new borrow record into the database."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
-            VALUES (?, ?, ?, ?)
-        ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
 
 def update_book_availability(book_id: int, change: int) -> bool:
     """Update the available copies of a book by a given amount (+1 for return, -1 for borrow)."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE books SET available_copies = available_copies + ? WHERE id = ?
-        ''', (change, book_id))
-        conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE books SET available_copies = available_copies + ? WHERE id = ?
+            ''', (change, book_id))
+            conn.commit()
+            book_cache.invalidate(book_id)
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
 
 def update_borrow_record_return_date(patron_id: str, book_id: int, return_date: datetime) -> bool:
     """Update the return date for a borrow record."""
-    conn = get_db_connection()
-    try:
-        conn.execute('''
-            UPDATE borrow_records 
-            SET return_date = ? 
+    with db_connection() as conn:
+        try:
+            conn.execute('''
+                UPDATE borrow_records 
+                SET return_date = ? 
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+            ''', (return_date.isoformat(), patron_id, book_id))
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            return False
+
+def borrow_book_transaction(patron_id: str, book_id: int, borrow_date: datetime, due_date: datetime, max_borrowed: int) -> Tuple[str, Optional[Dict]]:
+    """
+    Borrow a book in a single write transaction.
+
+    The availability decrement is a compare-and-set (only applied while copies
+    remain), so concurrent borrowers can never drive available_copies negative.
+    The borrowing limit is checked against the patron's open-loan counter,
+    which the borrow_records triggers bump in this same transaction.
+
+    Returns:
+        tuple: (status: str, book: dict or None) where status is one of
+        'borrowed', 'not_found', 'unavailable', 'limit_reached' or 'error'
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+            if not book:
+                conn.rollback()
+                return 'not_found', None
+            book = dict(book)
+            
+            if book['available_copies'] <= 0:
+                conn.rollback()
+                return 'unavailable', book
+            
+            patron = conn.execute('SELECT open_loans FROM patrons WHERE patron_id = ?', 
+                                  (patron_id,)).fetchone()
+            if patron and patron['open_loans'] >= max_borrowed:
+                conn.rollback()
+                return 'limit_reached', book
+            
+            updated = conn.execute('''
+                UPDATE books SET available_copies = available_copies - 1 
+                WHERE id = ? AND available_copies > 0
+            ''', (book_id,)).rowcount
+            if updated == 0:
+                conn.rollback()
+                return 'unavailable', book
+            
+            conn.execute('''
+                INSERT INTO borrow_records (patron_id, book_id, borrow_date, due_date)
+                VALUES (?, ?, ?, ?)
+            ''', (patron_id, book_id, borrow_date.isoformat(), due_date.isoformat()))
+            conn.commit()
+            book_cache.invalidate(book_id)
+            return 'borrowed', book
+        except sqlite3.Error:
+            conn.rollback()
+            return 'error', None
+
+def return_book_transaction(patron_id: str, book_id: int, return_date: datetime) -> Tuple[str, Optional[Dict]]:
+    """
+    Return a book in a single write transaction.
+
+    Closes the patron's oldest open loan for the book and gives the copy back.
+
+    Returns:
+        tuple: (status: str, book: dict or None) where status is one of
+        'returned', 'not_found', 'not_borrowed' or 'error'
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            book = conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+            if not book:
+                conn.rollback()
+                return 'not_found', None
+            book = dict(book)
+            
+            loan = conn.execute('''
+                SELECT id FROM borrow_records 
+                WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
+                ORDER BY borrow_date LIMIT 1
+            ''', (patron_id, book_id)).fetchone()
+            if not loan:
+                conn.rollback()
+                return 'not_borrowed', book
+            
+            conn.execute('UPDATE borrow_records SET return_date = ? WHERE id = ?', 
+                         (return_date.isoformat(), loan['id']))
+            conn.execute('''
+                UPDATE books SET available_copies = available_copies + 1 
+                WHERE id = ? AND available_copies < total_copies
+            ''', (book_id,))
+            conn.commit()
+            book_cache.invalidate(book_id)
+            return 'returned', book
+        except sqlite3.Error:
+            conn.rollback()
+            return 'error', None
+
+def get_open_loan(patron_id: str, book_id: int) -> Optional[Dict]:
+    """Get a patron's oldest open loan of a book."""
+    with db_connection() as conn:
+        loan = conn.execute('''
+            SELECT * FROM borrow_records
             WHERE patron_id = ? AND book_id = ? AND return_date IS NULL
-        ''', (return_date.isoformat(), patron_id, book_id))
+            ORDER BY borrow_date LIMIT 1
+        ''', (patron_id, book_id)).fetchone()
+    return dict(loan) if loan else None
+
+def claim_payment(idempotency_key: str, patron_id: str, book_id: int, loan_id: Optional[int],
+                  amount: float, stale_after: float) -> Tuple[bool, Dict]:
+    """
+    Claim the right to charge a payment, recording it as pending in the ledger.
+
+    A key seen for the first time, or whose last attempt failed, or that has
+    been pending for more than ``stale_after`` seconds (e.g. the process died
+    mid-call), is claimed. Succeeded and recently pending payments are not.
+    A claimed row's charge_key is its own key until set_charge_key changes it.
+
+    Returns:
+        tuple: (claimed: bool, ledger row as it is now)
+    """
+    now = datetime.now()
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+            stale = (row is not None and row['status'] == 'pending'
+                     and datetime.fromisoformat(row['updated_at']) < now - timedelta(seconds=stale_after))
+            if row is not None and row['status'] != 'failed' and not stale:
+                conn.rollback()
+                return False, dict(row)
+            
+            conn.execute('''
+                INSERT INTO payments (idempotency_key, charge_key, patron_id, book_id, loan_id, amount, status,
+                                      created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', ?, ?)
+                ON CONFLICT (idempotency_key) DO UPDATE SET
+                    charge_key = excluded.charge_key, amount = excluded.amount, status = 'pending',
+                    transaction_id = NULL, message = NULL, updated_at = excluded.updated_at
+            ''', (idempotency_key, idempotency_key, patron_id, book_id, loan_id, amount,
+                  now.isoformat(), now.isoformat()))
+            row = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+            conn.commit()
+            return True, dict(row)
+        except Exception:
+            conn.rollback()
+            raise
+
+def get_payment(idempotency_key: str) -> Optional[Dict]:
+    """Get a payments ledger row by its idempotency key."""
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM payments WHERE idempotency_key = ?', (idempotency_key,)).fetchone()
+    return dict(row) if row else None
+
+def set_charge_key(idempotency_keys: List[str], charge_key: str) -> None:
+    """Record the idempotency key of the one gateway charge covering several pending payments."""
+    with db_connection() as conn:
+        conn.executemany('''
+            UPDATE payments SET charge_key = ? WHERE idempotency_key = ? AND status = 'pending'
+        ''', [(charge_key, key) for key in idempotency_keys])
         conn.commit()
-        conn.close()
-        return True
-    except Exception as e:
-        conn.close()
-        return False
+
+def finish_payment(idempotency_keys: List[str], succeeded: bool, transaction_id: Optional[str], message: str) -> None:
+    """Record the gateway's answer for claimed payments (several when one charge covered many loans)."""
+    with db_connection() as conn:
+        conn.executemany('''
+            UPDATE payments SET status = ?, transaction_id = ?, message = ?, updated_at = ?
+            WHERE idempotency_key = ?
+        ''', [('succeeded' if succeeded else 'failed', transaction_id, message,
+               datetime.now().isoformat(), key) for key in idempotency_keys])
+        conn.commit()
+
+def get_transaction_payments(transaction_id: str) -> List[Dict]:
+    """Get the ledger rows paid by a gateway transaction (empty if it is not in the ledger)."""
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT * FROM payments WHERE transaction_id = ? ORDER BY id
+        ''', (transaction_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+def get_loan_payments(loan_id: int) -> List[Dict]:
+    """Get a loan's succeeded late fee payments, oldest first."""
+    with db_connection() as conn:
+        rows = conn.execute('''
+            SELECT * FROM payments WHERE loan_id = ? AND status = 'succeeded' ORDER BY id
+        ''', (loan_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+def record_gateway_status(transaction_id: str, status: Dict) -> None:
+    """Store a final gateway status for a transaction so later checks need no gateway call."""
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE payments SET gateway_status = ?, updated_at = ? WHERE transaction_id = ?
+        ''', (json.dumps(status), datetime.now().isoformat(), transaction_id))
+        conn.commit()
+
+def reserve_refund(transaction_id: str, amount: float) -> Optional[bool]:
+    """
+    Reserve part of a ledger transaction's paid amount for a refund.
+
+    The check and the reservation happen in one write transaction, so
+    concurrent refunds can never add up to more than was paid. Reservations
+    are spread over the transaction's rows in order, and clear any cached
+    gateway status. Undo with a negative amount if the gateway refuses the refund.
+
+    Returns:
+        bool or None: None if the transaction is not a succeeded payment in the
+        ledger, False if the amount exceeds what is left to refund, else True
+    """
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute('''
+                SELECT id, amount, refunded_amount FROM payments
+                WHERE transaction_id = ? AND status = 'succeeded' ORDER BY id
+            ''', (transaction_id,)).fetchall()
+            if not rows:
+                conn.rollback()
+                return None
+            
+            refundable = sum(row['amount'] - row['refunded_amount'] for row in rows)
+            if amount > 0 and amount > refundable + 1e-9:
+                conn.rollback()
+                return False
+            
+            remaining = amount
+            for row in (rows if amount > 0 else reversed(rows)):
+                if amount > 0:
+                    change = min(remaining, row['amount'] - row['refunded_amount'])
+                else:
+                    change = max(remaining, -row['refunded_amount'])
+                if change:
+                    conn.execute('''
+                        UPDATE payments SET refunded_amount = refunded_amount + ?, gateway_status = NULL,
+                                            updated_at = ?
+                        WHERE id = ?
+                    ''', (change, datetime.now().isoformat(), row['id']))
+                    remaining -= change
+            conn.commit()
+            return True
+        except Exception:
+            conn.rollback()
+            raise
+
+def _payment_job(row: sqlite3.Row) -> Dict:
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+def enqueue_payment_job(kind: str, payload: Dict, max_attempts: int) -> int:
+    """Add a job to the payment queue, ready to run now. Returns the job id."""
+    now = datetime.now().isoformat()
+    with db_connection() as conn:
+        job_id = conn.execute('''
+            INSERT INTO payment_jobs (kind, payload, status, max_attempts, run_after, created_at, updated_at)
+            VALUES (?, ?, 'queued', ?, ?, ?, ?)
+        ''', (kind, json.dumps(payload), max_attempts, now, now, now)).lastrowid
+        conn.commit()
+    return job_id
+
+def claim_payment_job(worker_id: str) -> Optional[Dict]:
+    """
+    Take the next due job off the queue and mark it running (attempts + 1).
+
+    Safe to call from many threads and processes at once: the pick and the
+    update happen in one write transaction, so each job goes to one worker.
+
+    Returns:
+        dict: the claimed job with its payload decoded, or None if no job is due
+    """
+    now = datetime.now().isoformat()
+    with db_connection() as conn:
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('''
+                SELECT id FROM payment_jobs WHERE status = 'queued' AND run_after <= ?
+                ORDER BY run_after LIMIT 1
+            ''', (now,)).fetchone()
+            if row is None:
+                conn.rollback()
+                return None
+            conn.execute('''
+                UPDATE payment_jobs SET status = 'running', attempts = attempts + 1, locked_by = ?, updated_at = ?
+                WHERE id = ?
+            ''', (worker_id, now, row['id']))
+            job = conn.execute('SELECT * FROM payment_jobs WHERE id = ?', (row['id'],)).fetchone()
+            conn.commit()
+            return _payment_job(job)
+        except Exception:
+            conn.rollback()
+            raise
+
+def finish_payment_job(job_id: int, succeeded: bool, result: Optional[Dict], error: Optional[str] = None) -> None:
+    """Mark a running job succeeded or failed for good, with its result."""
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE payment_jobs SET status = ?, result = ?, error = ?, locked_by = NULL, updated_at = ?
+            WHERE id = ?
+        ''', ('succeeded' if succeeded else 'failed', json.dumps(result) if result is not None else None,
+              error, datetime.now().isoformat(), job_id))
+        conn.commit()
+
+def retry_payment_job(job_id: int, run_after: datetime, error: str) -> None:
+    """Put a running job back on the queue to run again at ``run_after``."""
+    with db_connection() as conn:
+        conn.execute('''
+            UPDATE payment_jobs SET status = 'queued', run_after = ?, error = ?, locked_by = NULL, updated_at = ?
+            WHERE id = ?
+        ''', (run_after.isoformat(), error, datetime.now().isoformat(), job_id))
+        conn.commit()
+
+def requeue_stale_payment_jobs(older_than: datetime) -> int:
+    """Queue again the jobs left running since before ``older_than`` (their worker died). Returns how many."""
+    with db_connection() as conn:
+        count = conn.execute('''
+            UPDATE payment_jobs SET status = 'queued', locked_by = NULL, run_after = ?, updated_at = ?
+            WHERE status = 'running' AND updated_at < ?
+        ''', (datetime.now().isoformat(), datetime.now().isoformat(), older_than.isoformat())).rowcount
+        conn.commit()
+    return count
+
+def get_payment_job(job_id: int) -> Optional[Dict]:
+    """Get a payment job by id, with its payload and result decoded."""
+    with db_connection() as conn:
+        row = conn.execute('SELECT * FROM payment_jobs WHERE id = ?', (job_id,)).fetchone()
+    return _payment_job(row) if row else None
@@ -2,8 +2,17 @@
 API Routes - JSON API endpoints
 """
 
-from flask import Blueprint, jsonify, request
-from services.library_service import calculate_late_fee_for_book, search_books_in_catalog
+import csv, io, json
+from flask import Blueprint, Response, jsonify, request, url_for
+from database import iter_books, iter_open_loans, get_overdue_loans, book_cache
+from routes.catalog_routes import row_fragments
+from services.cache import get_cache
+from services.payment_service import get_payment_gateway
+from services.payment_jobs import enqueue_late_fee_payment, enqueue_refund, get_job_status
+from routes.http_cache import catalog_conditional
+from services.library_service import (
+    calculate_late_fee_for_book, search_books_in_catalog, SEARCH_RESULT_LIMIT
+)
 
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
@@ -16,7 +25,73 @@ def get_late_fee(patron_id, book_id):
     result = calculate_late_fee_for_book(patron_id, book_id)
     return jsonify(result), 501 if 'not implemented' in result.get('status', '') else 200
 
+@api_bp.route('/overdue/<patron_id>')
+def get_overdue(patron_id):
+    """
+    Overdue loans and accrued fees for a patron, as of the last overdue sweep.
+    Reads the materialized overdue_loans table instead of recomputing fees.
+    """
+    loans = get_overdue_loans(patron_id)
+    return jsonify({
+        'patron_id': patron_id,
+        'loans': loans,
+        'total_late_fees': sum(loan['fee_amount'] for loan in loans)
+    })
+
+@api_bp.route('/metrics')
+def get_metrics():
+    """
+    This worker's cache hit/miss counters (with the catalog row render time
+    they saved) and the payment gateway's circuit breaker and bulkhead state.
+    """
+    return jsonify({
+        'book_cache': book_cache.stats(),
+        'catalog_cache': get_cache().stats(),
+        'catalog_row_fragments': row_fragments.stats(),
+        'payment_gateway': get_payment_gateway().stats(),
+    })
+
+def _queued(success, message, job_id):
+    if not success:
+        return jsonify({'error': message}), 400
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'message': message,
+        'status_url': url_for('api.get_job', job_id=job_id)
+    }), 202
+
+@api_bp.route('/payments', methods=['POST'])
+def queue_payment():
+    """
+    Queue a late fee payment ({"patron_id": ..., "book_id": ...}).
+    Returns 202 with a job id at once; poll status_url for the result.
+    """
+    data = request.get_json(silent=True) or {}
+    return _queued(*enqueue_late_fee_payment(data.get('patron_id'), data.get('book_id')))
+
+@api_bp.route('/refunds', methods=['POST'])
+def queue_refund():
+    """
+    Queue a refund ({"transaction_id": ..., "amount": ...}).
+    Returns 202 with a job id at once; poll status_url for the result.
+    """
+    data = request.get_json(silent=True) or {}
+    return _queued(*enqueue_refund(data.get('transaction_id'), data.get('amount')))
+
+@api_bp.route('/jobs/<int:job_id>')
+def get_job(job_id):
+    """
+    Status of a queued payment or refund: queued, running, succeeded or
+    failed, with the attempts made and, once finished, the result.
+    """
+    job = get_job_status(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
 @api_bp.route('/search')
+@catalog_conditional
 def search_books_api():
     """
     Search for books via API endpoint.
@@ -24,12 +99,13 @@ def search_books_api():
     """
     search_term = request.args.get('q', '').strip()
     search_type = request.args.get('type', 'title')
+    limit = request.args.get('limit', SEARCH_RESULT_LIMIT, type=int)
     
     if not search_term:
         return jsonify({'error': 'Search term is required'}), 400
     
     # Use business logic function
-    books = search_books_in_catalog(search_term, search_type)
+    books = search_books_in_catalog(search_term, search_type, limit)
     
     return jsonify({
         'search_term': search_term,
@@ -37,3 +113,59 @@ def search_books_api():
         'results': books,
         'count': len(books)
     })
+
+# Rows serialized into each chunk of a streamed export
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_SOURCES = {
+    'books': (iter_books, ['id', 'title', 'author', 'isbn', 'total_copies', 'available_copies']),
+    'loans': (iter_open_loans, ['loan_id', 'patron_id', 'book_id', 'title', 'isbn', 'borrow_date', 'due_date']),
+}
+
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _export_chunks(rows, columns, fmt):
+    """Serialize rows as CSV (with a header) or NDJSON, EXPORT_CHUNK_ROWS at a time."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, lineterminator='\n') if fmt == 'csv' else None
+    if writer:
+        writer.writeheader()
+    
+    count = 0
+    for row in rows:
+        if writer:
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row) + '\n')
+        count += 1
+        if count % EXPORT_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    
+    if buffer.tell():
+        yield buffer.getvalue()
+
+@api_bp.route('/export/<source>')
+def export_rows(source):
+    """
+    Stream the books table or all open loans as CSV or NDJSON.
+    Rows are read with a server-side cursor and sent as they are produced, so
+    memory use does not grow with table size.
+
+    Query parameters:
+        format: 'csv' (default) or 'ndjson'
+    """
+    fmt = request.args.get('format', 'csv').lower()
+    if source not in EXPORT_SOURCES:
+        return jsonify({'error': f'Unknown export {source!r}'}), 404
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({'error': 'Format must be csv or ndjson'}), 400
+    
+    iter_rows, columns = EXPORT_SOURCES[source]
+    response = Response(_export_chunks(iter_rows(), columns, fmt), mimetype=EXPORT_MIMETYPES[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={source}.{fmt}'
+    return response
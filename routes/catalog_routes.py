@@ -2,25 +2,61 @@
 Catalog Routes - Book catalog related endpoints
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, flash
-from database import get_all_books
-from services.library_service import add_book_to_catalog
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
+from markupsafe import Markup
+from database import CATALOG_PAGE_SIZE
+from routes.http_cache import catalog_conditional
+from services.library_service import add_book_to_catalog, get_catalog_page
+from services.cache import FragmentCache
 
 catalog_bp = Blueprint('catalog', __name__)
 
+# Rendered catalog table rows, keyed by every field the row shows
+row_fragments = FragmentCache(size=4096)
+
+def render_catalog_rows(books):
+    """
+    Render the catalog table rows, reusing the cached HTML of books whose
+    fields (availability included) have not changed since they were last shown.
+    """
+    template = current_app.jinja_env.get_template('catalog_row.html')
+    rows = []
+    for book in books:
+        key = repr((request.script_root, book['id'], book['available_copies'], book['total_copies'],
+                    book['title'], book['author'], book['isbn']))
+        rows.append(Markup(row_fragments.render(key, lambda: template.render(book=book))))
+    return rows
+
 @catalog_bp.route('/')
 def index():
     """Home page redirects to catalog."""
     return redirect(url_for('catalog.catalog'))
 
 @catalog_bp.route('/catalog')
+@catalog_conditional
 def catalog():
     """
-    Display all books in the catalog.
+    Display the book catalog, one page at a time.
     Implements R2: Book Catalog Display
+
+    Pages are addressed by the title/id of the neighbouring book
+    (?after_title=&after_id= for the next page, ?before_title=&before_id= for
+    the previous one) so deep pages cost the same as the first.
     """
-    books = get_all_books()
-    return render_template('catalog.html', books=books)
+    after_title = request.args.get('after_title')
+    after_id = request.args.get('after_id', type=int)
+    before_title = request.args.get('before_title')
+    before_id = request.args.get('before_id', type=int)
+    
+    books, has_more = get_catalog_page(after_title, after_id, before_title, before_id, CATALOG_PAGE_SIZE)
+    
+    if before_title is not None and before_id is not None:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after_title is not None and after_id is not None, has_more
+    
+    return render_template('catalog.html', books=books, rows=render_catalog_rows(books), has_prev=has_prev and bool(books),
+                           has_next=has_next and bool(books))
 
 @catalog_bp.route('/add_book', methods=['GET', 'POST'])
 def add_book():
@@ -0,0 +1,43 @@
+"""
+HTTP Caching - Conditional GET support for catalog-backed pages
+"""
+
+from datetime import datetime, timezone
+from functools import wraps
+from flask import Response, make_response, request, session
+from database import get_catalog_state
+
+def catalog_conditional(view):
+    """
+    Answer GET requests for a view whose output depends only on the URL and
+    the catalog with 304 Not Modified when the client's copy is current.
+
+    The ETag is the catalog version and Last-Modified the time it last
+    changed, both read with one primary-key lookup, so a revalidation skips
+    the view's queries and rendering entirely. Responses are marked
+    ``no-cache`` so clients revalidate on every use. Requests with pending
+    flash messages always get a full, uncached page.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if session.get('_flashes'):
+            response = make_response(view(*args, **kwargs))
+            response.cache_control.no_store = True
+            return response
+        
+        version, modified = get_catalog_state()
+        etag = f'catalog-{version}'
+        last_modified = datetime.fromtimestamp(modified, timezone.utc)
+        
+        if request.if_none_match:
+            not_modified = request.if_none_match.contains_weak(etag)
+        else:
+            not_modified = request.if_modified_since is not None and request.if_modified_since >= last_modified
+        
+        response = Response(status=304) if not_modified else make_response(view(*args, **kwargs))
+        if response.status_code in (200, 304):
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+        return response
+    return wrapper
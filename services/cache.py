@@ -0,0 +1,344 @@
+"""
+Cache Module - Shared cache backends for catalog and search results
+
+Backends store string values under string keys and are interchangeable:
+    LocalCache  - in-process LRU (one copy per worker)
+    FileCache   - SQLite file shared by the worker processes on one host
+    RedisCache  - any server speaking the Redis protocol (RESP)
+
+Callers do not invalidate entries. Keys carry the catalog version from
+database.get_catalog_version(), which every write to books bumps, so a write
+in any worker makes the old entries unreachable and they age out on their own.
+"""
+
+import os, socket, sqlite3, threading, time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+# Cache configuration
+CACHE_BACKEND = os.getenv("LIBRARY_CACHE_BACKEND", "local")  # none, local, file or redis
+CACHE_URL = os.getenv("LIBRARY_CACHE_URL", "")  # file path or redis://host:port/db
+CACHE_SIZE = int(os.getenv("LIBRARY_CACHE_SIZE", "1024"))  # entries (local and file backends)
+CACHE_TTL = float(os.getenv("LIBRARY_CACHE_TTL", "300"))  # seconds
+CACHE_PREFIX = os.getenv("LIBRARY_CACHE_PREFIX", "library")  # namespace in a shared server
+
+class Cache:
+    """Base cache: stores nothing. Used when LIBRARY_CACHE_BACKEND=none."""
+
+    def __init__(self, ttl: float = CACHE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self._set(key, value, self.ttl if ttl is None else ttl)
+
+    def _get(self, key: str) -> Optional[str]:
+        return None
+
+    def _set(self, key: str, value: str, ttl: float) -> None:
+        pass
+
+    def delete(self, key: str) -> None:
+        pass
+
+    def clear(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, object]:
+        return {'backend': type(self).__name__, 'hits': self.hits, 'misses': self.misses}
+
+class LocalCache(Cache):
+    """Least-recently-used cache in this process, entries expiring after ``ttl`` seconds."""
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        super().__init__(ttl)
+        self.size = size
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+            self._entries.pop(key, None)
+            return None
+
+    def _set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class FragmentCache(LocalCache):
+    """
+    LocalCache for rendered HTML fragments that also times the renders it performs.
+
+    ``saved_seconds`` in stats() estimates the rendering avoided by hits, at
+    the mean render time of the misses.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        super().__init__(size, ttl)
+        self.render_seconds = 0.0
+
+    def render(self, key: str, render: Callable[[], str]) -> str:
+        """Return the fragment cached under key, calling render() to build it on a miss."""
+        html = self.get(key)
+        if html is None:
+            start = time.perf_counter()
+            html = render()
+            self.render_seconds += time.perf_counter() - start
+            self.set(key, html)
+        return html
+
+    def stats(self):
+        mean_render = self.render_seconds / self.misses if self.misses else 0.0
+        return dict(super().stats(), size=len(self._entries), render_seconds=self.render_seconds,
+                    saved_seconds=self.hits * mean_render)
+
+class FileCache(Cache):
+    """
+    Cache in a SQLite file, shared by every worker process that opens the same path.
+
+    Each thread keeps its own connection. Expired entries are skipped on read
+    and, together with the oldest entries beyond ``size``, pruned every
+    PRUNE_EVERY writes.
+    """
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path: str, size: int = CACHE_SIZE, ttl: float = CACHE_TTL):
+        super().__init__(ttl)
+        self.path = path
+        self.size = size
+        self._local = threading.local()
+        self._writes = 0
+        self._conn().execute('''
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, timeout=5)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')  # losing cache entries on a crash is fine
+            self._local.conn = conn
+        return conn
+
+    def _get(self, key):
+        row = self._conn().execute('SELECT value FROM cache WHERE key = ? AND expires_at > ?',
+                                   (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def _set(self, key, value, ttl):
+        conn = self._conn()
+        conn.execute('''
+            INSERT INTO cache (key, value, expires_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at
+        ''', (key, value, time.time() + ttl))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self) -> None:
+        """Delete expired entries and the soonest-expiring ones beyond ``size``."""
+        conn = self._conn()
+        conn.execute('DELETE FROM cache WHERE expires_at <= ?', (time.time(),))
+        conn.execute('''
+            DELETE FROM cache WHERE key IN (
+                SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+            )
+        ''', (self.size,))
+
+    def delete(self, key):
+        self._conn().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._conn().execute('DELETE FROM cache')
+
+class RedisError(Exception):
+    """Error reply from a Redis-protocol server."""
+
+class RedisCache(Cache):
+    """
+    Cache on a Redis-protocol server (Redis, Valkey, KeyDB, ...), e.g. redis://localhost:6379/0.
+
+    Speaks RESP over one socket guarded by a lock. Keys are namespaced with
+    ``prefix``. If the server cannot be reached, reads miss and writes are
+    dropped, so a cache outage slows requests down instead of failing them.
+    """
+
+    def __init__(self, url: str = "redis://localhost:6379/0", ttl: float = CACHE_TTL,
+                 prefix: str = CACHE_PREFIX, timeout: float = 0.5):
+        super().__init__(ttl)
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.strip('/') or 0)
+        self.password = parsed.password
+        self.prefix = prefix
+        self.timeout = timeout
+        self.errors = 0
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._sock.makefile('rb')
+        if self.password:
+            self._call('AUTH', self.password)
+        if self.db:
+            self._call('SELECT', str(self.db))
+
+    def _disconnect(self) -> None:
+        if self._sock is not None:
+            try:
+                self._reader.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def _call(self, *args: str):
+        parts = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg.encode() if isinstance(arg, str) else arg
+            parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        self._sock.sendall(b''.join(parts))
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by cache server")
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode()
+        if kind == b'-':
+            raise RedisError(payload.decode())
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._reader.read(length + 2)
+            return data[:-2].decode()
+        if kind == b'*':
+            length = int(payload)
+            return None if length < 0 else [self._read_reply() for _ in range(length)]
+        raise RedisError(f"Unexpected reply {line!r}")
+
+    def execute(self, *args: str):
+        """Send one command and return its reply, reconnecting once if the connection dropped."""
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._call(*args)
+                except (OSError, ConnectionError):
+                    self._disconnect()
+                    if attempt == 2:
+                        raise
+
+    def _safe_execute(self, *args: str):
+        try:
+            return self.execute(*args)
+        except (OSError, ConnectionError, RedisError):
+            self.errors += 1
+            return None
+
+    def _key(self, key: str) -> str:
+        return f'{self.prefix}:{key}'
+
+    def _get(self, key):
+        return self._safe_execute('GET', self._key(key))
+
+    def _set(self, key, value, ttl):
+        self._safe_execute('SET', self._key(key), value, 'PX', str(max(1, int(ttl * 1000))))
+
+    def delete(self, key):
+        self._safe_execute('DEL', self._key(key))
+
+    def clear(self):
+        """Delete every key under this cache's prefix."""
+        cursor = '0'
+        while True:
+            reply = self._safe_execute('SCAN', cursor, 'MATCH', self._key('*'), 'COUNT', '500')
+            if not reply:
+                return
+            cursor, keys = reply
+            if keys:
+                self._safe_execute('DEL', *keys)
+            if cursor == '0':
+                return
+
+    def stats(self):
+        return dict(super().stats(), errors=self.errors)
+
+CACHE_BACKENDS = ('none', 'local', 'file', 'redis')
+
+def create_cache(backend: str = CACHE_BACKEND, url: str = CACHE_URL) -> Cache:
+    """
+    Build a cache backend by name.
+
+    Raises:
+        ValueError: if the backend is unknown or needs a URL that was not given
+    """
+    if backend == 'none':
+        return Cache()
+    if backend == 'local':
+        return LocalCache()
+    if backend == 'file':
+        if not url:
+            raise ValueError("The file cache backend needs LIBRARY_CACHE_URL set to a file path")
+        return FileCache(url)
+    if backend == 'redis':
+        return RedisCache(url or "redis://localhost:6379/0")
+    raise ValueError(f"Unknown cache backend {backend!r}; expected one of {list(CACHE_BACKENDS)}")
+
+_cache: Optional[Cache] = None
+_cache_lock = threading.Lock()
+
+def get_cache() -> Cache:
+    """Get the process-wide cache, creating it from the LIBRARY_CACHE_* settings on first use."""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache()
+    return _cache
+
+def set_cache(cache: Cache) -> None:
+    """Replace the process-wide cache (e.g. a different backend in tests)."""
+    global _cache
+    _cache = cache
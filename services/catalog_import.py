@@ -0,0 +1,137 @@
+"""
+Catalog Import Module - Bulk loading of books
+Streams CSV or JSON-lines acquisition files into the catalog in chunked transactions
+"""
+
+import csv, json, os, time
+from typing import Dict, IO, Iterator, List, Optional, Tuple
+from database import get_existing_isbns, insert_books
+from services.library_service import validate_book
+
+# Rows validated, deduplicated and inserted per transaction
+IMPORT_BATCH_SIZE = 5000
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+
+def read_book_rows(stream: IO[str], fmt: str) -> Iterator[Tuple[int, Dict]]:
+    """
+    Read raw book rows from a text stream without loading the whole file.
+
+    CSV files need a header with title, author, isbn and total_copies columns;
+    JSON-lines files hold one object with those keys per line.
+
+    Yields:
+        tuple: (line number, row dict) - a row that cannot be parsed yields
+        {'_error': message} instead
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif fmt == 'jsonl':
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_no, {'_error': "Invalid JSON."}
+                continue
+            yield line_no, row if isinstance(row, dict) else {'_error': "Expected a JSON object."}
+    else:
+        raise ValueError(f"Unsupported import format {fmt!r}; expected one of {IMPORT_FORMATS}")
+
+def _parse_book(row: Dict) -> Tuple[Optional[Tuple[str, str, str, int]], Optional[str]]:
+    """Turn a raw row into (title, author, isbn, total_copies), applying the R1 rules."""
+    if '_error' in row:
+        return None, row['_error']
+    
+    # JSON values keep their types; CSV values are always strings
+    for field, label in (('title', 'Title'), ('author', 'Author'), ('isbn', 'ISBN')):
+        if not isinstance(row.get(field) or '', str):
+            return None, f"{label} must be text."
+    title = row.get('title') or ''
+    author = row.get('author') or ''
+    isbn = (row.get('isbn') or '').strip()
+    total_copies = row.get('total_copies')
+    if isinstance(total_copies, bool):
+        return None, "Total copies must be a positive integer."
+    if isinstance(total_copies, str):
+        try:
+            total_copies = int(total_copies.strip())
+        except ValueError:
+            return None, "Total copies must be a positive integer."
+    
+    error = validate_book(title, author, isbn, total_copies)
+    if error:
+        return None, error
+    return (title.strip(), author.strip(), isbn, total_copies), None
+
+def import_books(rows: Iterator[Tuple[int, Dict]], batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Validate and insert book rows in batches.
+
+    Each batch is checked for ISBNs already in the catalog with a handful of
+    IN queries and inserted with executemany in a single transaction.
+
+    Args:
+        rows: (line number, row dict) pairs, e.g. from read_book_rows
+        batch_size: rows per transaction
+
+    Returns:
+        dict: {'imported': int, 'errors': [(line number, message), ...],
+               'rows': int, 'seconds': float, 'rows_per_second': float}
+    """
+    started = time.perf_counter()
+    report = {'imported': 0, 'errors': [], 'rows': 0}
+    batch: List[Tuple[int, Tuple[str, str, str, int]]] = []
+    
+    def flush():
+        existing = get_existing_isbns([book[2] for _, book in batch])
+        seen = set()
+        to_insert = []
+        for line_no, (title, author, isbn, copies) in batch:
+            if isbn in existing or isbn in seen:
+                report['errors'].append((line_no, "A book with this ISBN already exists."))
+                continue
+            seen.add(isbn)
+            to_insert.append((title, author, isbn, copies, copies))
+        
+        inserted = insert_books(to_insert)
+        report['imported'] += inserted
+        if inserted < len(to_insert):
+            # Added by someone else between the duplicate check and the insert
+            report['errors'].append((None, f"{len(to_insert) - inserted} rows skipped: ISBN added concurrently."))
+        batch.clear()
+    
+    for line_no, row in rows:
+        report['rows'] += 1
+        book, error = _parse_book(row)
+        if error:
+            report['errors'].append((line_no, error))
+            continue
+        batch.append((line_no, book))
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    
+    report['errors'].sort(key=lambda e: (e[0] is None, e[0] or 0))
+    report['seconds'] = time.perf_counter() - started
+    report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+def import_books_from_file(path: str, fmt: Optional[str] = None, batch_size: int = IMPORT_BATCH_SIZE) -> Dict:
+    """
+    Bulk import a CSV or JSON-lines file into the catalog.
+
+    The format is taken from the file extension (.csv, .jsonl/.ndjson) unless given.
+    """
+    if fmt is None:
+        ext = os.path.splitext(path)[1].lower()
+        fmt = 'csv' if ext == '.csv' else 'jsonl' if ext in ('.jsonl', '.ndjson') else None
+        if fmt is None:
+            raise ValueError(f"Cannot tell the format of {path!r}; pass one of {IMPORT_FORMATS}")
+    
+    with open(path, newline='', encoding='utf-8') as stream:
+        return import_books(read_book_rows(stream, fmt), batch_size)
@@ -3,51 +3,79 @@ Library Service Module - Business Logic Functions
 Contains all the core business logic for the Library Management System
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import asyncio, hashlib, json, time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
 from database import (
-    get_book_by_id, get_book_by_isbn, get_patron_borrow_count,
-    insert_book, insert_borrow_record, update_book_availability,
-    update_borrow_record_return_date, get_all_books, 
-    get_patron_borrowed_books # GD ADDED
+    get_book_by_id, get_book_by_isbn, insert_book, search_books,
+    get_books_by_isbn_prefix, get_patron_borrowed_books, # GD ADDED
+    borrow_book_transaction, return_book_transaction, get_patron_loan_records,
+    get_open_loan_fees, get_late_fee_totals, get_books_page, get_catalog_version,
+    get_open_loan, claim_payment, finish_payment, get_transaction_payments,
+    get_loan_payments, get_payment, set_charge_key, record_gateway_status, reserve_refund, CATALOG_PAGE_SIZE
 )
-from services.payment_service import PaymentGateway
+from services.payment_service import (
+    PaymentGateway, AsyncPaymentGateway, PaymentTimeoutError, get_payment_gateway,
+    outcome_unknown, idempotency_key
+)
+from services.cache import get_cache
 
-def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+MAX_BORROWED_BOOKS = 5
+PAYMENT_BATCH_CONCURRENCY = 8  # gateway calls in flight at once during batch collection
+PAYMENT_PENDING_TIMEOUT = 300  # seconds before an unfinished payment attempt is checked with the gateway
+# Gateway statuses that never change on their own; cached in the payments ledger
+FINAL_PAYMENT_STATUSES = ('completed', 'failed', 'refunded', 'canceled')
+
+def validate_book(title: str, author: str, isbn: str, total_copies: int) -> Optional[str]:
     """
-    Add a new book to the catalog.
-    Implements R1: Book Catalog Management
-    
-    Args:
-        title: Book title (max 200 chars)
-        author: Book author (max 100 chars)
-        isbn: 13-digit ISBN
-        total_copies: Number of copies (positive integer)
-        
+    Check book fields against the R1 catalog rules.
+    Shared by add_book_to_catalog and the bulk catalog import.
+
     Returns:
-        tuple: (success: bool, message: str)
+        str: the first validation error message, or None if the book is valid
     """
-    # Input validation
     if not title or not title.strip():
-        return False, "Title is required."
+        return "Title is required."
     
     if len(title.strip()) > 200:
-        return False, "Title must be less than 200 characters."
+        return "Title must be less than 200 characters."
     
     if not author or not author.strip():
-        return False, "Author is required."
+        return "Author is required."
     
     if len(author.strip()) > 100:
-        return False, "Author must be less than 100 characters."
+        return "Author must be less than 100 characters."
     
     if len(isbn) != 13:
-        return False, "ISBN must be exactly 13 digits."
+        return "ISBN must be exactly 13 digits."
     
     if not isbn.isdigit(): # GD ADDED
-        return False, "ISBN must contain only digits."
+        return "ISBN must contain only digits."
     
     if not isinstance(total_copies, int) or total_copies <= 0:
-        return False, "Total copies must be a positive integer."
+        return "Total copies must be a positive integer."
+    
+    return None
+
+def add_book_to_catalog(title: str, author: str, isbn: str, total_copies: int) -> Tuple[bool, str]:
+    """
+    Add a new book to the catalog.
+    Implements R1: Book Catalog Management
+    
+    Args:
+        title: Book title (max 200 chars)
+        author: Book author (max 100 chars)
+        isbn: 13-digit ISBN
+        total_copies: Number of copies (positive integer)
+        
+    Returns:
+        tuple: (success: bool, message: str)
+    """
+    # Input validation
+    error = validate_book(title, author, isbn, total_copies)
+    if error:
+        return False, error
     
     # Check for duplicate ISBN
     existing = get_book_by_isbn(isbn)
@@ -77,33 +105,25 @@ def borrow_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]:
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists and is available
-    book = get_book_by_id(book_id)
-    if not book:
+    # Loan period
+    borrow_date = datetime.now()
+    due_date = borrow_date + timedelta(days=14)
+    
+    # Check availability and the borrowing limit, then record the loan in one transaction
+    status, book = borrow_book_transaction(patron_id, book_id, borrow_date, due_date, MAX_BORROWED_BOOKS)
+    
+    if status == 'not_found':
         return False, "Book not found."
     
-    if book['available_copies'] <= 0:
+    if status == 'unavailable':
         return False, "This book is currently not available."
     
-    # Check patron's current borrowed books count
-    current_borrowed = get_patron_borrow_count(patron_id)
-    
-    if current_borrowed >= 5: # GD ADDED
+    if status == 'limit_reached': # GD ADDED
         return False, "You have reached the maximum borrowing limit of 5 books."
     
-    # Create borrow record
-    borrow_date = datetime.now()
-    due_date = borrow_date + timedelta(days=14)
-    
-    # Insert borrow record and update availability
-    borrow_success = insert_borrow_record(patron_id, book_id, borrow_date, due_date)
-    if not borrow_success:
+    if status != 'borrowed':
         return False, "Database error occurred while creating borrow record."
     
-    availability_success = update_book_availability(book_id, -1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
-    
     return True, f'Successfully borrowed "{book["title"]}". Due date: {due_date.strftime("%Y-%m-%d")}.'
 
 def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]: # GD ADDED whole function
@@ -123,31 +143,17 @@ def return_book_by_patron(patron_id: str, book_id: int) -> Tuple[bool, str]: # G
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return False, "Invalid patron ID. Must be exactly 6 digits."
     
-    # Check if book exists
-    book_info = get_book_by_id(book_id)
-    if not book_info:
+    # Close the loan and increment availability in one transaction
+    status, book_info = return_book_transaction(patron_id, book_id, datetime.now())
+    
+    if status == 'not_found':
         return False, "Book not found."
     
-    borrowed_book_list = get_patron_borrowed_books(patron_id)
-    if not borrowed_book_list:
+    if status == 'not_borrowed':
         return False, "no book found borrowed with patron ID"
     
-    # check if patron has the specific book borrowed
-    for b in borrowed_book_list:
-        if b.get("book_id") == book_id:
-            break
-    else: 
-        return False, "no book found borrowed with patron ID"
-
-    # update the borrow record
-    update_borrow_record_success = update_borrow_record_return_date(patron_id, book_id, datetime.now())
-    if not update_borrow_record_success:
+    if status != 'returned':
         return False, "Database error occurred with updating borrow record."
-    
-    # Increment availability
-    availability_success = update_book_availability(book_id, +1)
-    if not availability_success:
-        return False, "Database error occurred while updating book availability."
 
     return True, f'Successfully returned "{book_info["title"]}"'
 
@@ -236,10 +242,78 @@ def calculate_late_fee_for_book(patron_id: str, book_id: int) -> Dict: # GD ADDE
     }
 
 
-def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]: # GD ADDED whole function
+def calculate_late_fees_batch(patron_ids: Optional[List[str]] = None, as_of: Optional[date] = None) -> Dict[str, float]:
+    """
+    Calculate total late fees per patron over all their open loans at once.
+    Batch counterpart of calculate_late_fee_for_book for nightly billing.
+
+    Days overdue and fees are computed for every loan inside one SQL query
+    (per 500 patrons when filtering) using the same tiers as find_late_fee.
+
+    input:
+        patron_ids: only bill these patrons (default: every patron with an open loan)
+        as_of: billing date (default: today)
+
+    return {patron_id: total_fee, ...}  // patrons without open loans are absent
+    """
+    as_of = as_of or datetime.now().date()
+    return get_late_fee_totals(as_of, DAILY_FEE_FIRST_7, DAILY_FEE_AFTER_7, MAX_LATE_FEE, patron_ids)
+
+def calculate_late_fees_by_loan(patron_ids: Optional[List[str]] = None, as_of: Optional[date] = None) -> List[Dict]:
+    """
+    Calculate days overdue and late fee for each open loan at once.
+
+    Same inputs as calculate_late_fees_batch; returns one dict per loan with
+    loan_id, patron_id, book_id, due_date, days_overdue and fee_amount.
+    """
+    as_of = as_of or datetime.now().date()
+    return get_open_loan_fees(as_of, DAILY_FEE_FIRST_7, DAILY_FEE_AFTER_7, MAX_LATE_FEE, patron_ids)
+
+
+def _cached_catalog_read(kind: str, params: list, load: Callable):
+    """
+    Return load() through the shared cache, keyed by the current catalog version.
+
+    Any write to books bumps the version, so entries cached before it are
+    never read again, in this worker or any other sharing the cache.
+    """
+    cache = get_cache()
+    key = f"{kind}:v{get_catalog_version()}:{json.dumps(params)}"
+    cached = cache.get(key)
+    if cached is not None:
+        return json.loads(cached)
+    value = load()
+    cache.set(key, json.dumps(value))
+    return value
+
+def get_catalog_page(after_title: Optional[str] = None, after_id: Optional[int] = None,
+                     before_title: Optional[str] = None, before_id: Optional[int] = None,
+                     limit: int = CATALOG_PAGE_SIZE) -> Tuple[List[Dict], bool]:
+    """
+    Get one page of the catalog (R2), served from the shared cache when possible.
+
+    See database.get_books_page for how pages are addressed.
+
+    Returns:
+        tuple: (books in catalog order, whether more books exist past this page)
+    """
+    books, has_more = _cached_catalog_read(
+        'catalog', [after_title, after_id, before_title, before_id, limit],
+        lambda: get_books_page(after_title, after_id, limit, before_title, before_id))
+    return books, has_more
+
+SEARCH_RESULT_LIMIT = 50
+MAX_SEARCH_RESULT_LIMIT = 200
+
+def search_books_in_catalog(search_term: str, search_type: str, limit: int = SEARCH_RESULT_LIMIT) -> List[Dict]: # GD ADDED whole function
     """
     Search for books in the catalog.
     Implements R6 as per requirements
+
+    Title and author searches use the full-text index, best matches first.
+    A full 13-digit ISBN is matched exactly; a shorter run of digits (e.g. a
+    publisher prefix such as 978074) returns books whose ISBN starts with it.
+    At most ``limit`` books are returned (capped at MAX_SEARCH_RESULT_LIMIT).
     """
 
     # check input type validity
@@ -251,18 +325,25 @@ def search_books_in_catalog(search_term: str, search_type: str) -> List[Dict]: #
     if not term:
         return []
     
-    books = get_all_books()
-    results = []
+    limit = max(1, min(int(limit), MAX_SEARCH_RESULT_LIMIT))
+    if stype not in ('title', 'author', 'isbn'):
+        return []
+    
+    return _cached_catalog_read('search', [stype, term, limit],
+                                lambda: _search_catalog(term, stype, limit))
 
-    # filter results based on search type
-    if stype == "title":
-        results = [b for b in books if term in (b.get("title")).lower()]
-    elif stype == 'author':
-        results = [b for b in books if term in (b.get("author")).lower()]
-    elif stype == 'isbn':
-        results = [b for b in books if term in (b.get("isbn")).lower()]
+def _search_catalog(term: str, stype: str, limit: int) -> List[Dict]:
+    """Run a normalised catalog search against the database."""
+    if stype in ('title', 'author'):
+        return search_books(term, stype, limit)
     
-    return results
+    isbn = term.replace('-', '')
+    if not isbn.isdigit():
+        return []
+    if len(isbn) == 13:
+        book = get_book_by_isbn(isbn)
+        return [book] if book else []
+    return get_books_by_isbn_prefix(isbn, limit)
 
 def get_patron_status_report(patron_id: str) -> Dict: # GD ADDED whole function
     """
@@ -284,43 +365,58 @@ def get_patron_status_report(patron_id: str) -> Dict: # GD ADDED whole function
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
         return None
 
-    borrowed_book_list = get_patron_borrowed_books(patron_id)
-    if not borrowed_book_list:
-        return None
-    
-    currently_borrowed = []
+    return get_patron_status_reports([patron_id]).get(patron_id)
+
+def get_patron_status_reports(patron_ids: List[str]) -> Dict[str, Optional[Dict]]:
+    """
+    Build status reports for many patrons at once (e.g. staff dashboards).
+
+    All loans for the batch are fetched with one query per
+    database.QUERY_BATCH_SIZE patrons, so the number of queries does not
+    grow with the number of loans.
+
+    input:
+        patron_ids: 6-digit library card IDs
+
+    return {
+        patron_id: report as returned by get_patron_status_report (None for
+                   invalid IDs or patrons with nothing currently borrowed)
+        }
+    """
+    valid_ids = [p for p in patron_ids if isinstance(p, str) and p.isdigit() and len(p) == 6]
+    loans_by_patron = get_patron_loan_records(valid_ids)
     time_now = datetime.now().date()
+
+    return {
+        patron_id: _build_patron_status_report(loans_by_patron.get(patron_id, []), time_now)
+        for patron_id in patron_ids
+    }
+
+def _build_patron_status_report(loans: List[Dict], time_now) -> Optional[Dict]:
+    """Turn one patron's loan records into the R7 status report."""
+    currently_borrowed = []
     total_fee = 0.0
     borrowing_history_titles = set()
 
-    for book in borrowed_book_list:
-        current = get_book_by_id(book.get("book_id"))
-
-        title = current.get("title")
-        author = current.get("author")
-        due_date_datetime = book.get("due_date")
+    for loan in loans:
+        borrowing_history_titles.add(loan["title"])
+        if loan["return_date"] is not None:
+            continue
 
-        # ensure both are date objects
-        if isinstance(due_date_datetime, datetime):
-            due_date = due_date_datetime.date()
-        else:
-            due_date = due_date_datetime
+        due_date_datetime = loan["due_date"]
 
         # Calculate total late fee
-        if due_date is None:
-            days_overdue = 0
-        else:
-            days_overdue = max(0, (time_now - due_date).days)
-            
-        late_fee = find_late_fee(days_overdue)
-        total_fee += late_fee
+        days_overdue = max(0, (time_now - due_date_datetime.date()).days)
+        total_fee += find_late_fee(days_overdue)
 
         currently_borrowed.append({
-            "title": title,
-            "author": author,
+            "title": loan["title"],
+            "author": loan["author"],
             "due_date": due_date_datetime,
         })
-        borrowing_history_titles.add(title)
+
+    if not currently_borrowed:
+        return None
 
     entry = {
         "currently_borrowed": currently_borrowed,
@@ -353,49 +449,325 @@ def pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway
         mock_gateway.process_payment.return_value = (True, "txn_123", "Success")
         success, msg, txn = pay_late_fees("123456", 1, mock_gateway)
     """
+    return try_pay_late_fees(patron_id, book_id, payment_gateway)[0]
+
+def try_pay_late_fees(patron_id: str, book_id: int, payment_gateway: PaymentGateway = None
+                      ) -> Tuple[Tuple[bool, str, Optional[str]], bool]:
+    """
+    pay_late_fees, also telling whether a failure is worth retrying later:
+    the error shows nothing was charged (circuit open, bulkhead full, a
+    connection that failed; see outcome_unknown) or another attempt is still
+    pending. Declines and timeouts, which may have charged, are not.
+
+    Returns:
+        tuple: (pay_late_fees result, retry_later: bool)
+    """
+    error, fee_amount, description = _late_fee_payment_request(patron_id, book_id)
+    if error:
+        return (False, error, None), False
+    
+    # Use provided gateway or the configured one
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    
+    # A retried request for the same loan gets the recorded result instead of a second charge
+    key, fee_amount, replay = _claim_late_fee_payment(patron_id, book_id, fee_amount,
+                                                      verify=payment_gateway.verify_payment_status)
+    if replay:
+        return replay, not replay[0]
+    
+    # Process payment through external gateway
+    # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
+    try:
+        with idempotency_key(key):
+            success, transaction_id, message = payment_gateway.process_payment(
+                patron_id=patron_id,
+                amount=fee_amount,
+                description=description
+            )
+        finish_payment([key], success, transaction_id if success else None, message)
+        return _late_fee_payment_result(success, transaction_id, message), False
+            
+    except Exception as e:
+        # Handle payment gateway errors
+        return _late_fee_payment_error([key], e), not outcome_unknown(e)
+
+async def pay_late_fees_async(patron_id: str, book_id: int,
+                              payment_gateway: AsyncPaymentGateway = None) -> Tuple[bool, str, Optional[str]]:
+    """
+    Awaitable pay_late_fees: same checks and results, but the gateway call
+    is awaited, so one event loop can have many payments in flight.
+
+    Args:
+        payment_gateway: AsyncPaymentGateway (default: wraps the configured gateway)
+    """
+    error, fee_amount, description = _late_fee_payment_request(patron_id, book_id)
+    if error:
+        return False, error, None
+    
+    if payment_gateway is None:
+        payment_gateway = AsyncPaymentGateway(get_payment_gateway())
+    
+    # The claim may ask the gateway about a stale attempt; it runs on a worker thread meanwhile
+    loop = asyncio.get_running_loop()
+    def verify(**kwargs) -> Dict:
+        return asyncio.run_coroutine_threadsafe(payment_gateway.verify_payment_status(**kwargs), loop).result()
+    key, fee_amount, replay = await asyncio.to_thread(_claim_late_fee_payment, patron_id, book_id, fee_amount,
+                                                      verify=verify)
+    if replay:
+        return replay
+    
+    try:
+        with idempotency_key(key):
+            success, transaction_id, message = await payment_gateway.process_payment(
+                patron_id=patron_id,
+                amount=fee_amount,
+                description=description
+            )
+        finish_payment([key], success, transaction_id if success else None, message)
+        return _late_fee_payment_result(success, transaction_id, message)
+    except Exception as e:
+        return _late_fee_payment_error([key], e)
+
+def _late_fee_payment_request(patron_id: str, book_id: int) -> Tuple[Optional[str], float, str]:
+    """
+    Check a late fee payment before it goes to the gateway.
+
+    Returns:
+        tuple: (error message or None, fee amount, payment description)
+    """
     # Validate patron ID
     if not patron_id or not patron_id.isdigit() or len(patron_id) != 6:
-        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+        return "Invalid patron ID. Must be exactly 6 digits.", 0.0, ""
     
     # Calculate late fee first
     fee_info = calculate_late_fee_for_book(patron_id, book_id)
     
     # Check if there's a fee to pay
     if not fee_info or 'fee_amount' not in fee_info:
-        return False, "Unable to calculate late fees.", None
+        return "Unable to calculate late fees.", 0.0, ""
     
     fee_amount = fee_info.get('fee_amount', 0.0)
     
     if fee_amount <= 0:
-        return False, "No late fees to pay for this book.", None
+        return "No late fees to pay for this book.", 0.0, ""
     
     # Get book details for payment description
     book = get_book_by_id(book_id)
     if not book:
-        return False, "Book not found.", None
-    
-    # Use provided gateway or create new one
-    if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        return "Book not found.", 0.0, ""
     
-    # Process payment through external gateway
-    # THIS IS WHAT YOU SHOULD MOCK IN THEIR TESTS!
+    return None, fee_amount, f"Late fees for '{book['title']}'"
+
+def late_fee_payment_key(patron_id: str, book_id: int, loan_id: Optional[int], paid: float = 0.0) -> str:
+    """Idempotency key of the late fee payment for one loan, after ``paid`` was already collected."""
+    key = f"late_fee:{patron_id}:{book_id}:{loan_id}"
+    return f"{key}:paid:{round(paid * 100)}" if paid > 0 else key
+
+def _claim_late_fee_payment(patron_id: str, book_id: int, fee_amount: float, loan_id: Optional[int] = None,
+                            verify: Optional[Callable[..., Dict]] = None
+                            ) -> Tuple[str, float, Optional[Tuple[bool, str, Optional[str]]]]:
+    """
+    Record a late fee payment as pending in the ledger before calling the gateway.
+
+    Only the part of the fee not yet paid for the loan is charged, so a fee
+    that grew since an earlier payment can be settled; the ledger key
+    includes the amount already paid.
+
+    An attempt pending for more than PAYMENT_PENDING_TIMEOUT may have charged
+    without its answer being recorded, so before it is claimed again the
+    gateway is asked about its charge key with ``verify`` (a gateway's
+    verify_payment_status; default: the configured gateway's).
+
+    Returns:
+        tuple: (idempotency key, amount to charge, None if the caller should
+        charge, else the result to return instead: the latest successful
+        payment when nothing is left to pay, or an "in progress" failure
+        while another attempt is pending)
+    """
+    if loan_id is None:
+        loan = get_open_loan(patron_id, book_id)
+        loan_id = loan['id'] if loan else None
+    payments = get_loan_payments(loan_id) if loan_id is not None else []
+    paid = round(sum(payment['amount'] for payment in payments), 2)
+    amount = round(fee_amount - paid, 2)
+    key = late_fee_payment_key(patron_id, book_id, loan_id, paid)
+    if amount <= 0:
+        latest = payments[-1]
+        return key, latest['amount'], (True, f"Payment successful! {latest['message']}", latest['transaction_id'])
+    
+    payment = get_payment(key)
+    if (payment is not None and payment['status'] == 'pending' and datetime.fromisoformat(payment['updated_at'])
+            < datetime.now() - timedelta(seconds=PAYMENT_PENDING_TIMEOUT)):
+        replay = _settle_stale_payment(payment, verify or get_payment_gateway().verify_payment_status)
+        if replay:
+            return key, payment['amount'], replay
+    
+    claimed, payment = claim_payment(key, patron_id, book_id, loan_id, amount, PAYMENT_PENDING_TIMEOUT)
+    if claimed:
+        return key, amount, None
+    if payment['status'] == 'succeeded':
+        return key, payment['amount'], (True, f"Payment successful! {payment['message']}", payment['transaction_id'])
+    return key, payment['amount'], (False, "A payment for these late fees is already in progress.", None)
+
+def _settle_stale_payment(payment: Dict, verify: Callable[..., Dict]) -> Optional[Tuple[bool, str, Optional[str]]]:
+    """
+    Ask the gateway what became of a stale pending payment.
+
+    Returns:
+        None when the gateway has no charge for it (it may be claimed and
+        charged again), else the result to return instead: success once a
+        completed charge is recorded, or "in progress" while the gateway
+        cannot tell
+    """
+    in_progress = (False, "A payment for these late fees is already in progress.", None)
     try:
-        success, transaction_id, message = payment_gateway.process_payment(
-            patron_id=patron_id,
-            amount=fee_amount,
-            description=f"Late fees for '{book['title']}'"
-        )
-        
-        if success:
-            return True, f"Payment successful! {message}", transaction_id
-        else:
-            return False, f"Payment failed: {message}", None
-            
-    except Exception as e:
-        # Handle payment gateway errors
-        return False, f"Payment processing error: {str(e)}", None
+        status = verify(idempotency_key=payment['charge_key'] or payment['idempotency_key'])
+    except Exception:
+        return in_progress
+    if status.get('status') == 'completed' and status.get('transaction_id'):
+        message = status.get('message') or f"Payment of ${payment['amount']:.2f} processed successfully"
+        finish_payment([payment['idempotency_key']], True, status['transaction_id'], message)
+        return True, f"Payment successful! {message}", status['transaction_id']
+    if status.get('status') in ('not_found', 'failed', 'canceled'):
+        return None
+    return in_progress
+
+def _late_fee_payment_result(success: bool, transaction_id: str, message: str) -> Tuple[bool, str, Optional[str]]:
+    if success:
+        return True, f"Payment successful! {message}", transaction_id
+    return False, f"Payment failed: {message}", None
 
+def _late_fee_payment_error(keys: List[str], error: Exception) -> Tuple[bool, str, Optional[str]]:
+    """
+    Record a gateway error for claimed payments and build the failure result.
+
+    When the charge may still go through (outcome_unknown), the payments stay
+    pending rather than failed, so a retry does not charge again meanwhile:
+    the answer of a timed-out call is recorded once it arrives. A claim
+    nobody finishes is checked with the gateway once it is older than
+    PAYMENT_PENDING_TIMEOUT, and only charged again if the gateway has no
+    charge for it; the charge itself carries the ledger key as its
+    Idempotency-Key, so an HTTP gateway can also refuse a duplicate.
+    """
+    if isinstance(error, PaymentTimeoutError) and error.future is not None:
+        error.future.add_done_callback(lambda future: _finish_late_fee_payment(keys, future))
+    elif not outcome_unknown(error):
+        finish_payment(keys, False, None, str(error))
+    return False, f"Payment processing error: {str(error)}", None
+
+def _finish_late_fee_payment(keys: List[str], future) -> None:
+    """Record the answer of a gateway call that outlived its deadline."""
+    error = future.exception()
+    if error is None:
+        success, transaction_id, message = future.result()
+        finish_payment(keys, success, transaction_id if success else None, message)
+    elif not outcome_unknown(error):
+        finish_payment(keys, False, None, str(error))
+
+
+def pay_late_fees_batch(items: List[Tuple[str, int]], payment_gateway: PaymentGateway = None,
+                        max_workers: int = PAYMENT_BATCH_CONCURRENCY, as_of: Optional[date] = None) -> Dict:
+    """
+    Collect late fees for many (patron_id, book_id) pairs, e.g. end-of-month collections.
+
+    Fees for every pair come from one bulk calculation (calculate_late_fees_by_loan).
+    Each patron's fees are then charged in a single gateway call, and the
+    calls run on up to ``max_workers`` threads. Items are checked the same
+    way as in pay_late_fees; an item repeated in the list is only charged once,
+    and loans already paid (per the payments ledger) are reported, not recharged;
+    a loan whose fee grew since it was paid is charged the difference.
+
+    input:
+        items: [(patron_id, book_id), ...]
+        payment_gateway: gateway to charge through (default: the configured one)
+        as_of: date to compute fees for (default: today)
+
+    return {
+        'items': [{'patron_id', 'book_id', 'fee_amount', 'success', 'message', 'transaction_id'}, ...],  // input order
+        'charges': 2, 'succeeded': 3, 'failed': 1, 'total_charged': 12.5,  // charged by this call
+        'seconds': 0.8, 'items_per_second': 5.0
+        }
+    """
+    start = time.perf_counter()
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    
+    results = [{'patron_id': patron_id, 'book_id': book_id, 'fee_amount': 0.0,
+                'success': False, 'message': '', 'transaction_id': None} for patron_id, book_id in items]
+    
+    # Oldest open loan of each (patron, book) pair, like calculate_late_fee_for_book
+    valid_patrons = {r['patron_id'] for r in results
+                     if isinstance(r['patron_id'], str) and r['patron_id'].isdigit() and len(r['patron_id']) == 6}
+    loan_fees = {}
+    if valid_patrons:
+        for loan in sorted(calculate_late_fees_by_loan(sorted(valid_patrons), as_of),
+                           key=lambda l: l['due_date'], reverse=True):
+            loan_fees[(loan['patron_id'], loan['book_id'])] = (loan['fee_amount'], loan['loan_id'])
+    
+    charges: Dict[str, List[Dict]] = {}
+    seen = set()
+    for result in results:
+        key = (result['patron_id'], result['book_id'])
+        if result['patron_id'] not in valid_patrons:
+            result['message'] = "Invalid patron ID. Must be exactly 6 digits."
+        elif key in seen:
+            result['message'] = "Duplicate item; see its first occurrence."
+        elif loan_fees.get(key, (0, None))[0] <= 0:
+            result['message'] = "No late fees to pay for this book."
+        else:
+            book = get_book_by_id(result['book_id'])
+            fee_amount, loan_id = loan_fees[key]
+            if not book:
+                result['message'] = "Book not found."
+            else:
+                payment_key, result['fee_amount'], replay = _claim_late_fee_payment(
+                    *key, fee_amount, loan_id, verify=payment_gateway.verify_payment_status)
+                if replay:
+                    result['success'], result['message'], result['transaction_id'] = replay
+                else:
+                    result['key'], result['title'] = payment_key, book['title']
+                    charges.setdefault(result['patron_id'], []).append(result)
+        seen.add(key)
+    
+    def charge(patron_id: str, patron_items: List[Dict]) -> None:
+        titles = [item.pop('title') for item in patron_items]
+        keys = [item.pop('key') for item in patron_items]
+        if len(titles) == 1:
+            description = f"Late fees for '{titles[0]}'"
+        else:
+            description = f"Late fees for {len(titles)} books: " + ", ".join(f"'{title}'" for title in titles)
+        amount = round(sum(item['fee_amount'] for item in patron_items), 2)
+        charge_key = keys[0]
+        if len(keys) > 1:
+            charge_key = f"late_fees:{patron_id}:" + hashlib.sha256("\n".join(keys).encode()).hexdigest()[:32]
+            set_charge_key(keys, charge_key)
+        try:
+            with idempotency_key(charge_key):
+                success, transaction_id, message = payment_gateway.process_payment(
+                    patron_id=patron_id, amount=amount, description=description)
+            finish_payment(keys, success, transaction_id if success else None, message)
+            success, message, transaction_id = _late_fee_payment_result(success, transaction_id, message)
+        except Exception as e:
+            success, message, transaction_id = _late_fee_payment_error(keys, e)
+        for item in patron_items:
+            item.update(success=success, message=message, transaction_id=transaction_id)
+    
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        list(executor.map(lambda entry: charge(*entry), charges.items()))
+    
+    seconds = time.perf_counter() - start
+    succeeded = [r for r in results if r['success']]
+    return {
+        'items': results,
+        'charges': len(charges),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+        'total_charged': round(sum(item['fee_amount'] for patron_items in charges.values()
+                                   for item in patron_items if item['success']), 2),
+        'seconds': seconds,
+        'items_per_second': len(results) / seconds if seconds else 0.0,
+    }
 
 def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None) -> Tuple[bool, str]:
     """
@@ -411,19 +783,36 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
     Returns:
         tuple: (success: bool, message: str)
     """
+    return try_refund_late_fee_payment(transaction_id, amount, payment_gateway)[0]
+
+def try_refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway: PaymentGateway = None
+                                ) -> Tuple[Tuple[bool, str], bool]:
+    """
+    refund_late_fee_payment, also telling whether a failure is worth retrying
+    later because the error shows nothing was refunded (circuit open,
+    bulkhead full, a connection that failed; see outcome_unknown).
+
+    Returns:
+        tuple: (refund_late_fee_payment result, retry_later: bool)
+    """
     # Validate inputs
     if not transaction_id or not transaction_id.startswith("txn_"):
-        return False, "Invalid transaction ID."
+        return (False, "Invalid transaction ID."), False
     
     if amount <= 0:
-        return False, "Refund amount must be greater than 0."
+        return (False, "Refund amount must be greater than 0."), False
     
     if amount > 15.00:  # Maximum late fee per book
-        return False, "Refund amount exceeds maximum late fee."
+        return (False, "Refund amount exceeds maximum late fee."), False
+    
+    # Payments in the ledger are checked locally; the amount is held until the gateway answers
+    reserved = reserve_refund(transaction_id, amount)
+    if reserved is False:
+        return (False, "Refund amount exceeds the amount paid."), False
     
-    # Use provided gateway or create new one
+    # Use provided gateway or the configured one
     if payment_gateway is None:
-        payment_gateway = PaymentGateway()
+        payment_gateway = get_payment_gateway()
     
     # Process refund through external gateway
     # THIS IS WHAT YOU SHOULD MOCK IN YOUR TESTS!
@@ -431,11 +820,51 @@ def refund_late_fee_payment(transaction_id: str, amount: float, payment_gateway:
         success, message = payment_gateway.refund_payment(transaction_id, amount)
         
         if success:
-            return True, message
+            return (True, message), False
         else:
-            return False, f"Refund failed: {message}"
+            if reserved:
+                reserve_refund(transaction_id, -amount)
+            return (False, f"Refund failed: {message}"), False
             
     except Exception as e:
-        return False, f"Refund processing error: {str(e)}"
+        if reserved:
+            _release_refund_after_error(transaction_id, amount, e)
+        return (False, f"Refund processing error: {str(e)}"), not outcome_unknown(e)
+
+def _release_refund_after_error(transaction_id: str, amount: float, error: Exception) -> None:
+    """
+    Undo a refund reservation after a gateway error, unless the refund may
+    still go through: a timed-out call releases it only if its eventual
+    answer is a refusal, and an unanswered refund stays reserved.
+    """
+    def release_if_refused(future) -> None:
+        late_error = future.exception()
+        refused = not future.result()[0] if late_error is None else not outcome_unknown(late_error)
+        if refused:
+            reserve_refund(transaction_id, -amount)
+    
+    if isinstance(error, PaymentTimeoutError) and error.future is not None:
+        error.future.add_done_callback(release_if_refused)
+    elif not outcome_unknown(error):
+        reserve_refund(transaction_id, -amount)
+
+def get_payment_status(transaction_id: str, payment_gateway: PaymentGateway = None) -> Dict:
+    """
+    Get a payment's status from the gateway (verify_payment_status).
+
+    Final statuses (FINAL_PAYMENT_STATUSES) of transactions in the payments
+    ledger are kept there, so checking them again needs no gateway call.
+    A refund through refund_late_fee_payment clears the kept status.
+    """
+    payments = get_transaction_payments(transaction_id) if transaction_id else []
+    if payments and payments[0]['gateway_status']:
+        return json.loads(payments[0]['gateway_status'])
+    
+    if payment_gateway is None:
+        payment_gateway = get_payment_gateway()
+    status = payment_gateway.verify_payment_status(transaction_id)
+    if payments and status.get('status') in FINAL_PAYMENT_STATUSES:
+        record_gateway_status(transaction_id, status)
+    return status
 
 
@@ -0,0 +1,77 @@
+"""
+Overdue Sweep Module - Background materialization of overdue loans
+Keeps the overdue_loans table current so fee lookups and reports are index reads
+"""
+
+import logging, os, threading
+from datetime import date, datetime
+from typing import Dict, Optional
+from database import sweep_overdue_loans
+from services.library_service import DAILY_FEE_FIRST_7, DAILY_FEE_AFTER_7, MAX_LATE_FEE
+
+# Seconds between sweeps when running in-process; 0 disables the scheduler
+SWEEP_INTERVAL = int(os.getenv("LIBRARY_SWEEP_INTERVAL", "0"))
+
+logger = logging.getLogger(__name__)
+
+def run_overdue_sweep(as_of: Optional[date] = None, full: bool = False) -> Dict:
+    """
+    Run one overdue sweep with the library's fee tiers.
+
+    input:
+        as_of: date to compute overdue days and fees for (default: today)
+        full: rebuild overdue_loans from every open loan instead of incrementally
+
+    return {'added': 0, 'updated': 0, 'removed': 0, 'cutoff': '2025-10-16'}
+    """
+    as_of = as_of or datetime.now().date()
+    return sweep_overdue_loans(as_of, DAILY_FEE_FIRST_7, DAILY_FEE_AFTER_7, MAX_LATE_FEE, full)
+
+class OverdueSweepScheduler:
+    """
+    Runs run_overdue_sweep() on a daemon thread every ``interval`` seconds.
+    The first sweep happens immediately on start().
+    """
+
+    def __init__(self, interval: int = SWEEP_INTERVAL):
+        self.interval = interval
+        self.last_result: Optional[Dict] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="overdue-sweep", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            try:
+                self.last_result = run_overdue_sweep()
+            except Exception:
+                logger.exception("Overdue sweep failed")
+            if self._stop.wait(self.interval):
+                return
+
+_scheduler: Optional[OverdueSweepScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def start_overdue_scheduler(interval: int = SWEEP_INTERVAL) -> Optional[OverdueSweepScheduler]:
+    """Start the process-wide sweep scheduler once, if an interval is configured."""
+    global _scheduler
+    if interval <= 0:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                scheduler = OverdueSweepScheduler(interval)
+                scheduler.start()
+                _scheduler = scheduler
+    return _scheduler
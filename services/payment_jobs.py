@@ -0,0 +1,204 @@
+"""
+Payment Jobs Module - Background processing of late fee payments and refunds
+Requests enqueue a job and return at once; worker threads call the gateway
+"""
+
+import logging, os, random, socket, threading, time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from database import (
+    enqueue_payment_job, claim_payment_job, finish_payment_job, retry_payment_job,
+    requeue_stale_payment_jobs, get_payment_job
+)
+from services import library_service
+
+# Worker threads started with each serving app process's first request. Queued payments and
+# refunds only run while some process has workers: set 0 only when `flask payment-worker` runs
+PAYMENT_JOB_WORKERS = int(os.getenv("LIBRARY_PAYMENT_WORKERS", "2"))
+PAYMENT_JOB_MAX_ATTEMPTS = int(os.getenv("LIBRARY_PAYMENT_JOB_ATTEMPTS", "5"))
+PAYMENT_JOB_BACKOFF = float(os.getenv("LIBRARY_PAYMENT_JOB_BACKOFF", "2"))  # seconds before the first retry
+PAYMENT_JOB_MAX_BACKOFF = 300.0  # seconds
+PAYMENT_JOB_POLL_INTERVAL = 0.5  # seconds an idle worker waits before looking for jobs again
+PAYMENT_JOB_STALE_AFTER = 600  # seconds a job may stay running before it is assumed abandoned
+PAYMENT_JOB_REQUEUE_INTERVAL = PAYMENT_JOB_STALE_AFTER / 10  # seconds between a pool's checks for abandoned jobs
+
+logger = logging.getLogger(__name__)
+
+def enqueue_late_fee_payment(patron_id: str, book_id: int) -> Tuple[bool, str, Optional[int]]:
+    """
+    Queue a pay_late_fees call for the workers. Only the request's shape is
+    checked here; fees and the ledger are checked when the job runs.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[int])
+    """
+    if not isinstance(patron_id, str) or not patron_id.isdigit() or len(patron_id) != 6:
+        return False, "Invalid patron ID. Must be exactly 6 digits.", None
+    if not isinstance(book_id, int) or isinstance(book_id, bool) or book_id <= 0:
+        return False, "Invalid book ID.", None
+    
+    job_id = enqueue_payment_job('payment', {'patron_id': patron_id, 'book_id': book_id}, PAYMENT_JOB_MAX_ATTEMPTS)
+    return True, "Payment queued.", job_id
+
+def enqueue_refund(transaction_id: str, amount: float) -> Tuple[bool, str, Optional[int]]:
+    """
+    Queue a refund_late_fee_payment call for the workers.
+
+    Returns:
+        tuple: (success: bool, message: str, job_id: Optional[int])
+    """
+    if not isinstance(transaction_id, str) or not transaction_id.startswith("txn_"):
+        return False, "Invalid transaction ID.", None
+    if not isinstance(amount, (int, float)) or isinstance(amount, bool) or amount <= 0:
+        return False, "Refund amount must be greater than 0.", None
+    
+    job_id = enqueue_payment_job('refund', {'transaction_id': transaction_id, 'amount': amount}, PAYMENT_JOB_MAX_ATTEMPTS)
+    return True, "Refund queued.", job_id
+
+def backoff_delay(attempts: int) -> float:
+    """Seconds to wait before the next attempt: exponential, capped, with up to 10% jitter."""
+    delay = min(PAYMENT_JOB_BACKOFF * 2 ** (attempts - 1), PAYMENT_JOB_MAX_BACKOFF)
+    return delay * random.uniform(1.0, 1.1)
+
+def run_payment_job(job: Dict) -> Tuple[bool, bool, Dict]:
+    """
+    Carry out one claimed job through library_service.
+
+    Only failures that charged or refunded nothing (the gateway was never
+    called or the connection failed), or where another attempt at the same
+    payment is still pending, are retried. A timeout may have charged or
+    refunded already (outcome_unknown), so it is final.
+
+    Returns:
+        tuple: (success: bool, retry_later: bool, result dict for the status endpoint)
+    """
+    payload = job['payload']
+    if job['kind'] == 'payment':
+        (success, message, transaction_id), retry_later = library_service.try_pay_late_fees(
+            payload['patron_id'], payload['book_id'])
+        return success, retry_later, {'success': success, 'message': message, 'transaction_id': transaction_id}
+    if job['kind'] == 'refund':
+        (success, message), retry_later = library_service.try_refund_late_fee_payment(
+            payload['transaction_id'], payload['amount'])
+        return success, retry_later, {'success': success, 'message': message}
+    return False, False, {'success': False, 'message': f"Unknown job kind {job['kind']!r}"}
+
+def process_next_job(worker_id: str) -> Optional[Dict]:
+    """
+    Claim and run the next due job, then record the outcome: done, failed for
+    good, or queued again after a backoff when run_payment_job says the
+    failure is worth retrying and attempts remain.
+
+    Returns:
+        dict: the job as claimed (None if the queue had nothing due)
+    """
+    job = claim_payment_job(worker_id)
+    if job is None:
+        return None
+
+    try:
+        success, retry_later, result = run_payment_job(job)
+    except Exception as e:
+        logger.exception("Payment job %s failed", job['id'])
+        success, retry_later, result = False, False, {'success': False, 'message': f"Payment job error: {e}"}
+
+    if retry_later and job['attempts'] < job['max_attempts']:
+        retry_payment_job(job['id'], datetime.now() + timedelta(seconds=backoff_delay(job['attempts'])),
+                          result['message'])
+    else:
+        finish_payment_job(job['id'], success, result, None if success else result['message'])
+    return job
+
+class PaymentWorkerPool:
+    """
+    Worker threads that take jobs off the payment queue until stopped.
+
+    Several pools (in several processes) can share one database: each job is
+    claimed by exactly one worker. Jobs left running by a crashed worker are
+    queued again after PAYMENT_JOB_STALE_AFTER seconds; one of the pool's
+    workers checks for them every ``requeue_interval`` seconds.
+    """
+
+    def __init__(self, workers: int = PAYMENT_JOB_WORKERS, poll_interval: float = PAYMENT_JOB_POLL_INTERVAL,
+                 requeue_interval: float = PAYMENT_JOB_REQUEUE_INTERVAL):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.requeue_interval = requeue_interval
+        self.processed = 0
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._next_requeue = 0.0
+
+    def start(self) -> None:
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stop.clear()
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads = [threading.Thread(target=self._run, args=(f"{prefix}:{i}",),
+                                          name=f"payment-worker-{i}", daemon=True)
+                         for i in range(self.workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _requeue_due(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_requeue:
+                return False
+            self._next_requeue = now + self.requeue_interval
+            return True
+
+    def _run(self, worker_id: str) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._requeue_due():
+                    requeue_stale_payment_jobs(datetime.now() - timedelta(seconds=PAYMENT_JOB_STALE_AFTER))
+                job = process_next_job(worker_id)
+            except Exception:
+                logger.exception("Payment worker %s failed", worker_id)
+                job = None
+            if job is not None:
+                with self._lock:
+                    self.processed += 1
+            elif self._stop.wait(self.poll_interval):
+                return
+
+_pool: Optional[PaymentWorkerPool] = None
+_pool_lock = threading.Lock()
+
+def start_payment_workers(workers: int = PAYMENT_JOB_WORKERS) -> Optional[PaymentWorkerPool]:
+    """Start the process-wide payment worker pool once, if workers are configured."""
+    global _pool
+    if workers <= 0:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = PaymentWorkerPool(workers)
+                pool.start()
+                _pool = pool
+    return _pool
+
+def get_job_status(job_id: int) -> Optional[Dict]:
+    """Public view of a payment job for the status endpoint (None if unknown)."""
+    job = get_payment_job(job_id)
+    if job is None:
+        return None
+    return {
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'attempts': job['attempts'],
+        'max_attempts': job['max_attempts'],
+        'next_attempt_at': job['run_after'] if job['status'] == 'queued' else None,
+        'result': job['result'],
+        'error': job['error'],
+        'created_at': job['created_at'],
+        'updated_at': job['updated_at'],
+    }
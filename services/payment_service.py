@@ -7,8 +7,25 @@ since we cannot make actual payment API calls during testing.
 """
 
 import requests
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
+import asyncio, contextvars, os, threading, weakref
 import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from requests.adapters import HTTPAdapter
+
+# Real gateway integration; when PAYMENT_GATEWAY_URL is unset the simulated gateway is used
+PAYMENT_GATEWAY_URL = os.getenv("PAYMENT_GATEWAY_URL", "")
+PAYMENT_API_KEY = os.getenv("PAYMENT_API_KEY", "test_key_12345")
+PAYMENT_CONNECT_TIMEOUT = float(os.getenv("PAYMENT_CONNECT_TIMEOUT", "3.05"))  # seconds
+PAYMENT_READ_TIMEOUT = float(os.getenv("PAYMENT_READ_TIMEOUT", "10"))  # seconds
+PAYMENT_POOL_SIZE = int(os.getenv("PAYMENT_POOL_SIZE", "10"))  # keep-alive connections per host
+# Resilience settings for the process-wide gateway (see ResilientPaymentGateway)
+PAYMENT_DEADLINE = float(os.getenv("PAYMENT_DEADLINE", "15"))  # seconds a caller waits for one gateway call
+PAYMENT_BULKHEAD_SIZE = int(os.getenv("PAYMENT_BULKHEAD_SIZE", "4"))  # gateway calls in flight per process
+PAYMENT_BULKHEAD_WAIT = float(os.getenv("PAYMENT_BULKHEAD_WAIT", "0.1"))  # seconds to wait for a free slot
+PAYMENT_BREAKER_THRESHOLD = int(os.getenv("PAYMENT_BREAKER_THRESHOLD", "5"))  # consecutive failures to open
+PAYMENT_BREAKER_RESET = float(os.getenv("PAYMENT_BREAKER_RESET", "30"))  # seconds open before a trial call
 
 
 class PaymentGateway:
@@ -107,7 +124,8 @@ class PaymentGateway:
         refund_id = f"refund_{transaction_id}_{int(time.time())}"
         return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund_id}"
     
-    def verify_payment_status(self, transaction_id: str) -> Dict:
+    def verify_payment_status(self, transaction_id: Optional[str] = None,
+                              idempotency_key: Optional[str] = None) -> Dict:
         """
         Check the status of a payment transaction.
         
@@ -116,6 +134,8 @@ class PaymentGateway:
         
         Args:
             transaction_id: Transaction ID to check
+            idempotency_key: Look the charge up by the idempotency key it was
+                sent with instead (the simulator keeps no record of these)
             
         Returns:
             dict: Payment status information
@@ -131,4 +151,341 @@ class PaymentGateway:
             "status": "completed",
             "amount": 10.50,
             "timestamp": time.time()
-        }
\ No newline at end of file
+        }
+
+
+_idempotency_key: "contextvars.ContextVar[Optional[str]]" = contextvars.ContextVar("payment_idempotency_key",
+                                                                                  default=None)
+
+@contextmanager
+def idempotency_key(key: str):
+    """
+    Send ``key`` as the Idempotency-Key of the gateway charges made in this block,
+    so the gateway can recognise a retried charge and not bill it twice.
+    """
+    token = _idempotency_key.set(key)
+    try:
+        yield
+    finally:
+        _idempotency_key.reset(token)
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def get_http_session() -> requests.Session:
+    """
+    Get this process's shared HTTP session for the payment gateway.
+
+    Connections are kept alive and reused across calls and threads (up to
+    PAYMENT_POOL_SIZE per host). Failed requests are not retried here, since
+    retrying a charge could bill a patron twice.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=PAYMENT_POOL_SIZE, pool_maxsize=PAYMENT_POOL_SIZE,
+                                      max_retries=0, pool_block=False)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _session = session
+    return _session
+
+def close_http_session() -> None:
+    """Close the shared session's pooled connections."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+class HttpPaymentGateway(PaymentGateway):
+    """
+    Payment gateway client making real HTTP calls over the shared, pooled session.
+
+    Same interface as PaymentGateway. Declines (4xx) are returned as failed
+    results. 408 and 429 answers mean the request was not acted on and raise
+    PaymentUnavailableError; timeouts, connection errors and 5xx responses
+    raise ``requests.RequestException`` for the caller to handle. Charges made
+    inside ``idempotency_key(key)`` send it as the Idempotency-Key header, and
+    verify_payment_status can look a charge up by that key.
+    """
+
+    TRANSIENT_STATUSES = (408, 429)  # request timeout, rate limited
+
+    def __init__(self, base_url: str = PAYMENT_GATEWAY_URL, api_key: str = PAYMENT_API_KEY,
+                 session: Optional[requests.Session] = None,
+                 timeout: Tuple[float, float] = (PAYMENT_CONNECT_TIMEOUT, PAYMENT_READ_TIMEOUT)):
+        super().__init__(api_key)
+        self.base_url = base_url.rstrip('/')
+        self.session = session
+        self.timeout = timeout
+
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        session = self.session or get_http_session()
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        key = _idempotency_key.get()
+        if key is not None and method == "POST":
+            headers["Idempotency-Key"] = key
+        return session.request(method, f"{self.base_url}{path}", timeout=self.timeout, headers=headers, **kwargs)
+
+    @staticmethod
+    def _error_message(response: requests.Response) -> str:
+        try:
+            return response.json().get("error", {}).get("message") or response.reason
+        except ValueError:
+            return response.reason
+
+    def _declined(self, response: requests.Response) -> bool:
+        """Whether the gateway refused the request (4xx); raises for transient refusals."""
+        if response.status_code in self.TRANSIENT_STATUSES:
+            raise PaymentUnavailableError(
+                f"Payment gateway busy ({response.status_code}): {self._error_message(response)}; try again later")
+        return 400 <= response.status_code < 500
+
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        response = self._request("POST", "/charges", json={
+            "customer_id": patron_id,
+            "amount": amount,
+            "currency": "usd",
+            "description": description
+        })
+        if self._declined(response):
+            return False, "", self._error_message(response)
+        response.raise_for_status()
+        charge = response.json()
+        return True, charge["id"], charge.get("message", f"Payment of ${amount:.2f} processed successfully")
+
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        response = self._request("POST", "/refunds", json={"transaction_id": transaction_id, "amount": amount})
+        if self._declined(response):
+            return False, self._error_message(response)
+        response.raise_for_status()
+        refund = response.json()
+        if "message" in refund:
+            return True, refund["message"]
+        return True, f"Refund of ${amount:.2f} processed successfully. Refund ID: {refund.get('id', 'unknown')}"
+
+    def verify_payment_status(self, transaction_id: Optional[str] = None,
+                              idempotency_key: Optional[str] = None) -> Dict:
+        if idempotency_key is not None:
+            response = self._request("GET", "/charges", params={"idempotency_key": idempotency_key})
+        else:
+            response = self._request("GET", f"/charges/{transaction_id}")
+        if response.status_code == 404:
+            return {"status": "not_found", "message": "Transaction not found"}
+        response.raise_for_status()
+        return response.json()
+
+
+class AsyncPaymentGateway:
+    """
+    Awaitable wrapper around a blocking gateway (HttpPaymentGateway by default).
+
+    Each call runs on asyncio's default thread pool over the shared keep-alive
+    session, so an event loop can have many payments in flight at once; at
+    most ``max_concurrency`` run at the same time.
+    """
+
+    def __init__(self, gateway: Optional[PaymentGateway] = None, max_concurrency: int = PAYMENT_POOL_SIZE):
+        self.gateway = gateway or HttpPaymentGateway()
+        self.max_concurrency = max_concurrency
+        self._semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = \
+            weakref.WeakKeyDictionary()
+
+    async def _call(self, method, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        async with semaphore:
+            return await asyncio.to_thread(method, *args, **kwargs)
+
+    async def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return await self._call(self.gateway.process_payment, patron_id=patron_id, amount=amount,
+                                description=description)
+
+    async def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return await self._call(self.gateway.refund_payment, transaction_id, amount)
+
+    async def verify_payment_status(self, transaction_id: Optional[str] = None,
+                                    idempotency_key: Optional[str] = None) -> Dict:
+        if idempotency_key is None:
+            return await self._call(self.gateway.verify_payment_status, transaction_id)
+        return await self._call(self.gateway.verify_payment_status, idempotency_key=idempotency_key)
+
+
+class PaymentUnavailableError(Exception):
+    """The gateway call was not made; safe to retry later."""
+
+class CircuitOpenError(PaymentUnavailableError):
+    pass
+
+class BulkheadFullError(PaymentUnavailableError):
+    pass
+
+class PaymentTimeoutError(Exception):
+    """
+    The gateway did not answer in time, but the call was made and keeps
+    running: it may still charge or refund. ``future`` holds its eventual result.
+    """
+
+    def __init__(self, message: str, future=None):
+        super().__init__(message)
+        self.future = future
+
+
+def outcome_unknown(error: Exception) -> bool:
+    """Whether a gateway call that raised ``error`` may still have charged or refunded."""
+    if isinstance(error, PaymentTimeoutError):
+        return True
+    # The request was sent but no answer was read (a connect timeout means it was never sent)
+    return isinstance(error, requests.Timeout) and not isinstance(error, requests.ConnectTimeout)
+
+
+class ResilientPaymentGateway(PaymentGateway):
+    """
+    Wraps a gateway so a slow or failing payment provider cannot stall the app.
+
+    - Bulkhead: at most ``max_concurrent`` calls run at once; a caller waits
+      up to ``bulkhead_wait`` seconds for a slot, then gets BulkheadFullError.
+    - Deadline: callers wait at most ``deadline`` seconds (PaymentTimeoutError).
+      The call itself keeps running, and its bulkhead slot, until it really
+      finishes; its result is on the error's ``future``.
+    - Circuit breaker: after ``failure_threshold`` consecutive errors or
+      timeouts the circuit opens and calls fail at once with CircuitOpenError.
+      After ``reset_timeout`` seconds one trial call is let through (half-open);
+      its success closes the circuit, its failure opens it again.
+
+    Declined payments and refunds are answers, not failures, and do not count.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, gateway: PaymentGateway, deadline: float = PAYMENT_DEADLINE,
+                 max_concurrent: int = PAYMENT_BULKHEAD_SIZE, bulkhead_wait: float = PAYMENT_BULKHEAD_WAIT,
+                 failure_threshold: int = PAYMENT_BREAKER_THRESHOLD, reset_timeout: float = PAYMENT_BREAKER_RESET):
+        self.gateway = gateway
+        self.api_key = gateway.api_key
+        self.base_url = gateway.base_url
+        self.deadline = deadline
+        self.max_concurrent = max_concurrent
+        self.bulkhead_wait = bulkhead_wait
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="payment")
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._consecutive_failures = 0
+        self._in_flight = 0
+        self.metrics = {'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0,
+                        'rejected_open': 0, 'rejected_bulkhead': 0, 'times_opened': 0}
+
+    def _refresh_state(self) -> None:
+        # Called with self._lock held
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _before_call(self) -> None:
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.OPEN or (self._state == self.HALF_OPEN and self._trial_in_flight):
+                self.metrics['rejected_open'] += 1
+                raise CircuitOpenError("Payment gateway unavailable (circuit open); try again later")
+            if self._state == self.HALF_OPEN:
+                self._trial_in_flight = True
+            self.metrics['calls'] += 1
+
+    def _after_call(self, failed: bool) -> None:
+        with self._lock:
+            self._trial_in_flight = False
+            if not failed:
+                self.metrics['successes'] += 1
+                self._consecutive_failures = 0
+                self._state = self.CLOSED
+                return
+            self.metrics['failures'] += 1
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.metrics['times_opened'] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def _release_slot(self, future) -> None:
+        with self._lock:
+            self._in_flight -= 1
+        self._slots.release()
+
+    def _call(self, method, *args, **kwargs):
+        self._before_call()
+        if not self._slots.acquire(timeout=self.bulkhead_wait):
+            with self._lock:
+                self._trial_in_flight = False
+                self.metrics['calls'] -= 1
+                self.metrics['rejected_bulkhead'] += 1
+            raise BulkheadFullError("Too many payments in progress; try again shortly")
+        with self._lock:
+            self._in_flight += 1
+        
+        # The call runs in the caller's context, e.g. with its idempotency key
+        future = self._executor.submit(contextvars.copy_context().run, method, *args, **kwargs)
+        future.add_done_callback(self._release_slot)
+        try:
+            result = future.result(timeout=self.deadline)
+        except FutureTimeoutError:
+            with self._lock:
+                self.metrics['timeouts'] += 1
+            self._after_call(failed=True)
+            raise PaymentTimeoutError(f"Payment gateway did not answer within {self.deadline:g}s", future)
+        except Exception:
+            self._after_call(failed=True)
+            raise
+        self._after_call(failed=False)
+        return result
+
+    def process_payment(self, patron_id: str, amount: float, description: str = "") -> Tuple[bool, str, str]:
+        return self._call(self.gateway.process_payment, patron_id=patron_id, amount=amount, description=description)
+
+    def refund_payment(self, transaction_id: str, amount: float) -> Tuple[bool, str]:
+        return self._call(self.gateway.refund_payment, transaction_id, amount)
+
+    def verify_payment_status(self, transaction_id: Optional[str] = None,
+                              idempotency_key: Optional[str] = None) -> Dict:
+        if idempotency_key is None:
+            return self._call(self.gateway.verify_payment_status, transaction_id)
+        return self._call(self.gateway.verify_payment_status, idempotency_key=idempotency_key)
+
+    def stats(self) -> Dict[str, object]:
+        state = self.state
+        with self._lock:
+            return dict(self.metrics, state=state, consecutive_failures=self._consecutive_failures,
+                        in_flight=self._in_flight, max_concurrent=self.max_concurrent)
+
+
+_gateway: Optional[ResilientPaymentGateway] = None
+_gateway_lock = threading.Lock()
+
+def get_payment_gateway() -> ResilientPaymentGateway:
+    """
+    Get the process-wide gateway: HTTP when PAYMENT_GATEWAY_URL is set,
+    otherwise the simulator, behind one shared ResilientPaymentGateway so
+    every request sees the same circuit breaker and bulkhead.
+    """
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = ResilientPaymentGateway(HttpPaymentGateway() if PAYMENT_GATEWAY_URL else PaymentGateway())
+    return _gateway
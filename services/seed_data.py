@@ -0,0 +1,159 @@
+"""
+Seed Data Module - Synthetic libraries at production scale
+Generates a catalog, patrons and borrow history from a seed and bulk loads them,
+for reproducing performance problems locally (add_sample_data only adds three books)
+"""
+
+import random, time
+from array import array
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Tuple
+from database import bulk_load_library
+from services.library_service import MAX_BORROWED_BOOKS
+
+# Seeding defaults (flask seed)
+SEED_BOOKS = 100_000
+SEED_PATRONS = 20_000
+SEED_LOANS = 500_000
+SEED_HISTORY_DAYS = 365
+SEED_POPULARITY = 1.0  # Zipf exponent of title popularity; higher concentrates loans on fewer titles
+SEED_PATRON_ACTIVITY = 0.7  # Zipf exponent of patron activity (a few heavy readers, a long tail)
+SEED_OVERDUE_RATE = 0.08  # share of loans past due that were never returned
+SEED_LATE_RETURN_RATE = 0.15  # share of returned loans that came back after the due date
+SEED_EARLY_RETURN_RATE = 0.3  # share of loans not yet due that are already back
+
+LOAN_DAYS = 14
+MAX_COPIES = 8
+FIRST_PATRON_ID = 100000  # generated patron ids are 6 digits: 100000, 100001, ...
+
+TITLE_WORDS = [
+    "river", "shadow", "garden", "winter", "empire", "silent", "golden", "night", "ocean", "machine",
+    "history", "secret", "mountain", "city", "glass", "stone", "journey", "summer", "storm", "kingdom",
+    "forest", "letters", "island", "memory", "light", "broken", "north", "house", "fire", "dream",
+]
+FIRST_NAMES = ["Ada", "Alan", "Grace", "Edsger", "Barbara", "Donald", "Margaret", "Ken", "Frances", "Niklaus"]
+LAST_NAMES = ["Lovelace", "Turing", "Hopper", "Dijkstra", "Liskov", "Knuth", "Hamilton", "Thompson", "Allen", "Wirth"]
+
+SAMPLE_BATCH = 10_000  # books or patrons drawn per rng.choices call
+
+def seed_patron_id(n: int) -> str:
+    """Library card id of the n-th generated patron (n from 0)."""
+    return f"{FIRST_PATRON_ID + n:06d}"
+
+def zipf_cum_weights(n: int, exponent: float) -> List[float]:
+    """Cumulative weights of ranks 1..n under a Zipf distribution (for rng.choices)."""
+    return list(accumulate(1.0 / rank ** exponent for rank in range(1, n + 1)))
+
+class _Sampler:
+    """Draws ids by Zipf rank, a batch of SAMPLE_BATCH at a time; rank 1 is a random id, not id 0."""
+
+    def __init__(self, n: int, exponent: float, rng: random.Random):
+        self.ids = list(range(n))
+        rng.shuffle(self.ids)
+        self.cum_weights = zipf_cum_weights(n, exponent)
+        self.rng = rng
+        self.batch: List[int] = []
+
+    def __call__(self) -> int:
+        if not self.batch:
+            self.batch = [self.ids[rank] for rank in
+                          self.rng.choices(range(len(self.ids)), cum_weights=self.cum_weights, k=SAMPLE_BATCH)]
+        return self.batch.pop()
+
+def generate_books(count: int, copies: array, rng: random.Random) -> Iterator[Tuple[str, str, str, int]]:
+    """Yield (title, author, isbn, total_copies) rows; book i gets ISBN 978 + i, zero-padded."""
+    for i in range(count):
+        yield (f"The {rng.choice(TITLE_WORDS).title()} {rng.choice(TITLE_WORDS).title()} {i + 1}",
+               f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+               f"978{i + 1:010d}", copies[i])
+
+def generate_loans(count: int, pick_book, pick_patron, copies: array, rng: random.Random, now: datetime,
+                   history_days: int, overdue_rate: float, late_return_rate: float,
+                   stats: Dict[str, int]) -> Iterator[Tuple[str, int, str, Optional[str], Optional[str]]]:
+    """
+    Yield borrow_records rows with borrow dates spread over the last
+    ``history_days`` days. A loan stays open if it is not due yet (unless
+    returned early) or if it is one of the ``overdue_rate`` never brought
+    back; an open loan that would break the borrowing limit or exceed the
+    book's copies is recorded as returned instead. Counts of open and
+    overdue loans are added to ``stats``.
+    """
+    on_loan = array('b', bytes(len(copies)))
+    patron_open: Dict[int, int] = {}
+    for _ in range(count):
+        book, patron = pick_book(), pick_patron()
+        borrowed = now - timedelta(seconds=rng.randrange(history_days * 86400))
+        due = borrowed + timedelta(days=LOAN_DAYS)
+        stays_open = rng.random() >= SEED_EARLY_RETURN_RATE if due > now else rng.random() < overdue_rate
+        if stays_open and patron_open.get(patron, 0) < MAX_BORROWED_BOOKS and on_loan[book] < copies[book]:
+            patron_open[patron] = patron_open.get(patron, 0) + 1
+            on_loan[book] += 1
+            stats['open_loans'] += 1
+            stats['overdue_loans'] += due < now
+            returned = None
+        elif rng.random() < late_return_rate:
+            returned = due + timedelta(days=rng.randint(1, 30), hours=rng.randint(0, 23))
+        else:
+            returned = borrowed + timedelta(days=rng.randint(0, LOAN_DAYS - 1), hours=rng.randint(0, 23))
+        if returned is not None and returned > now:
+            returned = now
+        yield (seed_patron_id(patron), book + 1, borrowed.isoformat(), due.isoformat(),
+               returned.isoformat() if returned else None)
+
+def seed_library(books: int = SEED_BOOKS, patrons: int = SEED_PATRONS, loans: int = SEED_LOANS,
+                 seed: int = 42, history_days: int = SEED_HISTORY_DAYS, popularity: float = SEED_POPULARITY,
+                 overdue_rate: float = SEED_OVERDUE_RATE, late_return_rate: float = SEED_LATE_RETURN_RATE,
+                 as_of: Optional[datetime] = None) -> Dict:
+    """
+    Replace the library's data with a generated catalog and borrow history.
+
+    Title popularity follows a Zipf distribution: a few titles account for
+    most loans and get more copies. Patron activity is skewed the same way,
+    less steeply. The same arguments (including ``as_of``) always produce
+    the same rows.
+
+    Args:
+        books: catalog size
+        patrons: patrons with borrow history (at most 900000, 6-digit ids)
+        loans: borrow_records rows
+        seed: random seed
+        history_days: how far back borrowing goes
+        popularity: Zipf exponent of title popularity
+        overdue_rate: share of loans past due that are still out
+        late_return_rate: share of returned loans returned after the due date
+        as_of: the generated "now" (default: the current time)
+
+    Returns:
+        dict: books, patrons, loans, open_loans, overdue_loans, seconds, rows_per_second
+
+    Raises:
+        ValueError: if a count is out of range
+    """
+    if books < 1 or patrons < 1 or loans < 0:
+        raise ValueError("Need at least one book and one patron")
+    if patrons > 1_000_000 - FIRST_PATRON_ID:
+        raise ValueError("At most 900000 patrons fit in 6-digit library card ids")
+    rng = random.Random(seed)
+    now = (as_of or datetime.now()).replace(microsecond=0)
+    start = time.perf_counter()
+
+    # the most popular 1% of titles get 4-8 copies, the rest 1-3
+    pick_book = _Sampler(books, popularity, rng)
+    copies = array('b', (rng.randint(1, 3) for _ in range(books)))
+    for book in pick_book.ids[:max(1, books // 100)]:
+        copies[book] = rng.randint(4, MAX_COPIES)
+    pick_patron = _Sampler(patrons, SEED_PATRON_ACTIVITY, rng)
+
+    stats = {'open_loans': 0, 'overdue_loans': 0}
+    counts = bulk_load_library(
+        generate_books(books, copies, random.Random(rng.random())),
+        generate_loans(loans, pick_book, pick_patron, copies, rng, now, history_days,
+                       overdue_rate, late_return_rate, stats))
+
+    seconds = time.perf_counter() - start
+    return {
+        'books': counts['books'], 'patrons': patrons, 'loans': counts['loans'],
+        'open_loans': stats['open_loans'], 'overdue_loans': stats['overdue_loans'],
+        'seconds': seconds, 'rows_per_second': (counts['books'] + counts['loans']) / seconds if seconds else 0.0,
+    }
@@ -61,3 +61,56 @@ def test_catalog_valid_avail_over_total_copies_0_2(client):
 
 
 
+
+#---------------------------------------------------------------------------------------------------------
+# Keyset pagination
+#---------------------------------------------------------------------------------------------------------
+
+def insert_numbered_books(count):
+    for i in range(count):
+        assert database.insert_book(f"Paged Book {i:03d}", "Author", f"52000000{i:05d}", 1, 1)
+
+def test_books_page_walks_forward_and_back():
+    insert_numbered_books(7)
+
+    first, more = database.get_books_page(limit=3)
+    assert [b["title"] for b in first] == ["Paged Book 000", "Paged Book 001", "Paged Book 002"]
+    assert more
+
+    second, more = database.get_books_page(first[-1]["title"], first[-1]["id"], 3)
+    assert [b["title"] for b in second] == ["Paged Book 003", "Paged Book 004", "Paged Book 005"]
+    assert more
+
+    last, more = database.get_books_page(second[-1]["title"], second[-1]["id"], 3)
+    assert [b["title"] for b in last] == ["Paged Book 006"]
+    assert not more
+
+    back, more = database.get_books_page(limit=3, before_title=second[0]["title"], before_id=second[0]["id"])
+    assert back == first
+    assert not more
+
+def test_books_page_orders_equal_titles_by_id():
+    for i in range(3):
+        assert database.insert_book("Same Title", f"Author {i}", f"530000000000{i}", 1, 1)
+
+    first, _ = database.get_books_page(limit=2)
+    rest, more = database.get_books_page(first[-1]["title"], first[-1]["id"], 2)
+
+    assert [b["author"] for b in first + rest] == ["Author 0", "Author 1", "Author 2"]
+    assert not more
+
+def test_catalog_page_navigation(client, monkeypatch):
+    import routes.catalog_routes as catalog_routes
+    monkeypatch.setattr(catalog_routes, "CATALOG_PAGE_SIZE", 2)
+    insert_numbered_books(3)
+    books = database.get_all_books()
+
+    html = client.get("/catalog").get_data(as_text=True)
+    assert books[1]["title"] in html and books[2]["title"] not in html
+    assert "Next →" in html and "← Previous" not in html
+
+    # the last page starts after the third-to-last book
+    cursor = books[-3]
+    html = client.get("/catalog", query_string={"after_title": cursor["title"], "after_id": cursor["id"]}).get_data(as_text=True)
+    assert books[-1]["title"] in html and cursor["title"] not in html
+    assert "← Previous" in html and "Next →" not in html
@@ -131,3 +131,51 @@ def test_calculate_late_fee_valid_input_not_overdue():
     assert res["days_overdue"] == 0
     assert res["fee_amount"] == 0
     assert "not overdue" in res["status"].lower()
+
+#---------------------------------------------------------------------------------------------------------
+# Batch late fees
+#---------------------------------------------------------------------------------------------------------
+
+from services.library_service import (
+    calculate_late_fees_batch, calculate_late_fees_by_loan, find_late_fee
+)
+
+def test_batch_late_fees_match_find_late_fee():
+    assert database.insert_book("Batch Fee Book", "Author", "5500000000001", 50, 50)
+    book = database.get_book_by_isbn("5500000000001")
+    now = datetime.now()
+    expected = {}
+    for days in range(-3, 40):
+        patron_id = f"55{days + 10:04d}"
+        due = now - timedelta(days=days)
+        assert database.insert_borrow_record(patron_id, book["id"], due - timedelta(days=14), due)
+        expected[patron_id] = find_late_fee(max(0, (now.date() - due.date()).days))
+
+    assert calculate_late_fees_batch() == expected
+
+    by_loan = {loan["patron_id"]: loan for loan in calculate_late_fees_by_loan()}
+    for patron_id, fee in expected.items():
+        assert by_loan[patron_id]["fee_amount"] == fee
+
+def test_batch_late_fees_totals_per_patron_and_filter():
+    assert database.insert_book("Batch Fee Book", "Author", "5500000000002", 5, 5)
+    book = database.get_book_by_isbn("5500000000002")
+    now = datetime.now()
+    assert database.insert_borrow_record("560000", book["id"], now - timedelta(days=20), now - timedelta(days=6))
+    assert database.insert_borrow_record("560000", book["id"], now - timedelta(days=40), now - timedelta(days=26))
+    assert database.insert_borrow_record("560001", book["id"], now - timedelta(days=20), now - timedelta(days=10))
+    assert database.insert_borrow_record("560002", book["id"], now - timedelta(days=20), now - timedelta(days=10))
+    assert database.update_borrow_record_return_date("560002", book["id"], now)
+
+    totals = calculate_late_fees_batch(["560000", "560001", "560002", "569999"])
+
+    assert totals == {"560000": 3.0 + 15.0, "560001": 7 * 0.5 + 3 * 1.0}
+
+def test_batch_late_fees_as_of_date():
+    assert database.insert_book("Batch Fee Book", "Author", "5500000000003", 1, 1)
+    book = database.get_book_by_isbn("5500000000003")
+    due = datetime(2025, 1, 1, 23, 59)
+    assert database.insert_borrow_record("570000", book["id"], due - timedelta(days=14), due)
+
+    assert calculate_late_fees_batch(as_of=due.date() + timedelta(days=1)) == {"570000": 0.5}
+    assert calculate_late_fees_batch(as_of=due.date()) == {"570000": 0.0}
@@ -87,3 +87,82 @@ def test_search_books_invalid_isbn():
     assert res == False
 
 
+
+#---------------------------------------------------------------------------------------------------------
+# Full-text search index
+#---------------------------------------------------------------------------------------------------------
+
+def test_search_title_partial_match_case_insensitive():
+    assert database.insert_book("The Hobbit", "J. R. R. Tolkien", "3100000000001", 1, 1)
+    assert database.insert_book("Hobbits of the Shire", "Someone Else", "3100000000002", 1, 1)
+    assert database.insert_book("Dune", "Frank Herbert", "3100000000003", 1, 1)
+
+    titles = [b["title"] for b in search_books_in_catalog("HOBBIT", "title")]
+
+    # titles starting with the term rank first
+    assert titles == ["Hobbits of the Shire", "The Hobbit"]
+
+def test_search_index_follows_title_updates():
+    assert database.insert_book("Old Title", "Author", "3100000000004", 1, 1)
+    with database.db_connection() as conn:
+        conn.execute("UPDATE books SET title = 'Renamed Volume' WHERE isbn = '3100000000004'")
+        conn.commit()
+
+    assert search_books_in_catalog("old title", "title") == []
+    assert [b["isbn"] for b in search_books_in_catalog("renamed", "title")] == ["3100000000004"]
+
+def test_search_short_and_special_terms():
+    assert database.insert_book('He Said "Go"', "Ng", "3100000000005", 1, 1)
+    assert database.insert_book("100% Done", "Author", "3100000000006", 1, 1)
+
+    assert [b["isbn"] for b in search_books_in_catalog("ng", "author")] == ["3100000000005"]
+    assert [b["isbn"] for b in search_books_in_catalog('said "go', "title")] == ["3100000000005"]
+    assert [b["isbn"] for b in search_books_in_catalog("0%", "title")] == ["3100000000006"]
+
+def test_search_results_limited():
+    for i in range(10):
+        assert database.insert_book(f"Series Volume {i}", "Author", f"320000000000{i}", 1, 1)
+
+    assert len(search_books_in_catalog("series", "title", limit=3)) == 3
+    assert len(search_books_in_catalog("series", "title")) == 10
+
+def test_search_api_limit(client):
+    for i in range(5):
+        assert database.insert_book(f"Api Volume {i}", "Author", f"330000000000{i}", 1, 1)
+
+    response = client.get("/api/search?q=api volume&type=title&limit=2")
+
+    assert response.status_code == 200
+    assert response.get_json()["count"] == 2
+
+#---------------------------------------------------------------------------------------------------------
+# ISBN exact and prefix search
+#---------------------------------------------------------------------------------------------------------
+
+def test_search_isbn_exact_does_not_match_substrings():
+    assert database.insert_book("Exact", "Author", "9780743273565", 1, 1)
+    assert database.insert_book("Other", "Author", "1978074327356", 1, 1)
+
+    assert [b["title"] for b in search_books_in_catalog("9780743273565", "isbn")] == ["Exact"]
+    assert [b["title"] for b in search_books_in_catalog("978-0743273565", "isbn")] == ["Exact"]
+
+def test_search_isbn_prefix():
+    assert database.insert_book("Publisher A 2", "Author", "9780740000002", 1, 1)
+    assert database.insert_book("Publisher A 1", "Author", "9780740000001", 1, 1)
+    assert database.insert_book("Publisher B", "Author", "9780750000001", 1, 1)
+    assert database.insert_book("Ends With Prefix", "Author", "1111111978074", 1, 1)
+
+    titles = [b["title"] for b in search_books_in_catalog("978074", "isbn")]
+
+    assert titles == ["Publisher A 1", "Publisher A 2"]
+
+def test_search_isbn_prefix_ending_in_nine():
+    assert database.insert_book("Nine", "Author", "9799999999999", 1, 1)
+    assert database.insert_book("After", "Author", "9800000000000", 1, 1)
+
+    assert [b["title"] for b in search_books_in_catalog("979", "isbn")] == ["Nine"]
+
+def test_search_isbn_rejects_non_digits():
+    assert database.insert_book("Letters", "Author", "9780743273599", 1, 1)
+
+    assert search_books_in_catalog("978abc", "isbn") == []
@@ -157,3 +157,50 @@ def test_patron_status_valid_id_with_late_5_days():
 #Valid patron ID w/ late books 5 days-> pass
 #Invalid patron ID -> pass (DONE)
 #Valid patron ID w/ no late books (DONE)
+
+#---------------------------------------------------------------------------------------------------------
+# Batch reports
+#---------------------------------------------------------------------------------------------------------
+
+from services import library_service
+from services.library_service import get_patron_status_reports, return_book_by_patron
+
+def test_patron_status_reports_batch(mocker):
+    now = datetime.now()
+    assert database.insert_book("Batch Book A", "Author A", "4100000000001", 5, 5)
+    assert database.insert_book("Batch Book B", "Author B", "4100000000002", 5, 5)
+    book_a = database.get_book_by_isbn("4100000000001")
+    book_b = database.get_book_by_isbn("4100000000002")
+
+    assert database.insert_borrow_record("410001", book_a["id"], now, now + timedelta(days=14))
+    assert database.insert_borrow_record("410001", book_b["id"], now - timedelta(days=24), now - timedelta(days=10))
+    assert database.insert_borrow_record("410002", book_b["id"], now, now + timedelta(days=14))
+
+    book_lookup = mocker.spy(library_service, "get_book_by_id")
+    loan_query = mocker.spy(library_service, "get_patron_loan_records")
+    reports = get_patron_status_reports(["410001", "410002", "410003", "ABC123"])
+
+    assert reports["410001"]["num_borrowed_books"] == 2
+    assert reports["410001"]["total_late_fees"] == 7*0.50 + 3*1.00
+    assert reports["410002"]["borrowing_history"] == {"Batch Book B"}
+    assert reports["410003"] is None
+    assert reports["ABC123"] is None
+    book_lookup.assert_not_called()
+    loan_query.assert_called_once()
+
+def test_patron_status_history_includes_returned_books():
+    now = datetime.now()
+    assert database.insert_book("Returned Book", "Author", "4200000000001", 1, 1)
+    assert database.insert_book("Kept Book", "Author", "4200000000002", 1, 1)
+    returned = database.get_book_by_isbn("4200000000001")
+    kept = database.get_book_by_isbn("4200000000002")
+
+    assert database.insert_borrow_record("420000", returned["id"], now, now + timedelta(days=14))
+    assert database.insert_borrow_record("420000", kept["id"], now, now + timedelta(days=14))
+    assert return_book_by_patron("420000", returned["id"])[0]
+
+    status = get_patron_status_report("420000")
+
+    assert [b["title"] for b in status["currently_borrowed"]] == ["Kept Book"]
+    assert status["num_borrowed_books"] == 1
+    assert status["borrowing_history"] == {"Returned Book", "Kept Book"}
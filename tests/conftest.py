@@ -1,8 +1,16 @@
 # GD ADDED just to temporarily run the test without modifying the database
 import os
+from datetime import datetime, timedelta
+from unittest.mock import Mock
 import pytest
+
+# Payment jobs are run explicitly in tests, not by background workers
+os.environ.setdefault("LIBRARY_PAYMENT_WORKERS", "0")
+
 import database
 from app import create_app
+from services.cache import LocalCache, set_cache
+from services.payment_service import PaymentGateway
 
 @pytest.fixture(autouse=True)
 def use_temp_db(tmp_path):
@@ -12,9 +20,13 @@ def use_temp_db(tmp_path):
     database.DATABASE = str(test_db) 
 
     database.init_database()
+    set_cache(LocalCache())
 
     yield
 
+    database.close_all_connections()
+    database.book_cache.invalidate()
+
 # from flask website
 @pytest.fixture()
 def app():
@@ -29,3 +41,47 @@ def client(app):
 @pytest.fixture()
 def runner(app):
     return app.test_cli_runner()
+
+# Test data builders
+@pytest.fixture()
+def add_book():
+    """add_book(isbn, copies=2, title=None) inserts a book and returns its id."""
+    def add(isbn, copies=2, title=None):
+        assert database.insert_book(title or f"Book {isbn}", "Author", isbn, copies, copies)
+        return database.get_book_by_isbn(isbn)["id"]
+    return add
+
+@pytest.fixture()
+def add_loan(add_book):
+    """add_loan(patron_id, isbn, due, title=None) adds a book borrowed 14 days before ``due``; returns its id."""
+    def add(patron_id, isbn, due, title=None):
+        book_id = add_book(isbn, title=title)
+        assert database.insert_borrow_record(patron_id, book_id, due - timedelta(days=14), due)
+        return book_id
+    return add
+
+@pytest.fixture()
+def add_overdue_loan(add_loan):
+    """add_overdue_loan(patron_id, isbn, days_overdue=4, title=None): add_loan due ``days_overdue`` days ago."""
+    def add(patron_id, isbn, days_overdue=4, title=None):
+        return add_loan(patron_id, isbn, datetime.now() - timedelta(days=days_overdue), title)
+    return add
+
+@pytest.fixture()
+def mock_gateway():
+    """
+    mock_gateway(txn=None) builds a Mock PaymentGateway that approves
+    payments and refunds. Payments get transaction ``txn``, or txn_<patron>_1.
+    """
+    def make(txn=None):
+        gateway = Mock(spec=PaymentGateway)
+        gateway.api_key, gateway.base_url = "key", "https://pay.example.com"
+        if txn:
+            gateway.process_payment.return_value = (True, txn, "Payment of $2.00 processed successfully")
+        else:
+            gateway.process_payment.side_effect = lambda patron_id, amount, description="": (
+                True, f"txn_{patron_id}_1", f"Payment of ${amount:.2f} processed successfully")
+        gateway.refund_payment.return_value = (True, "Refund processed")
+        gateway.verify_payment_status.return_value = {"transaction_id": txn, "status": "completed", "amount": 2.0}
+        return gateway
+    return make
@@ -0,0 +1,76 @@
+import json
+import database
+from benchmarks import bench_suite
+from benchmarks.datagen import generate_dataset
+from services.library_service import MAX_BORROWED_BOOKS
+
+def test_generated_dataset_is_consistent():
+    result = generate_dataset(books=300, patrons=40, loans=2000, seed=7)
+
+    with database.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM borrow_records").fetchone()[0] == 2000
+        open_loans = conn.execute("SELECT COUNT(*) FROM borrow_records WHERE return_date IS NULL").fetchone()[0]
+        busiest = conn.execute('''
+            SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM borrow_records WHERE return_date IS NULL GROUP BY patron_id)
+        ''').fetchone()[0]
+        drift = conn.execute('''
+            SELECT COUNT(*) FROM books WHERE available_copies != total_copies - (
+                SELECT COUNT(*) FROM borrow_records WHERE book_id = books.id AND return_date IS NULL)
+        ''').fetchone()[0]
+
+    assert result["open_loans"] == open_loans > 0
+    assert busiest <= MAX_BORROWED_BOOKS
+    assert drift == 0
+    assert database.reconcile_patron_counters() == []
+
+def test_dataset_is_deterministic(tmp_path):
+    generate_dataset(books=50, patrons=10, loans=200, seed=3)
+    with database.db_connection() as conn:
+        first = [tuple(row) for row in conn.execute("SELECT patron_id, book_id, return_date IS NULL FROM borrow_records")]
+
+    database.close_all_connections()
+    database.DATABASE = str(tmp_path / "second.db")
+    database.init_database()
+    generate_dataset(books=50, patrons=10, loans=200, seed=3)
+    with database.db_connection() as conn:
+        second = [tuple(row) for row in conn.execute("SELECT patron_id, book_id, return_date IS NULL FROM borrow_records")]
+
+    assert first == second
+
+def test_suite_runs_every_benchmark_and_leaves_data_unchanged():
+    dataset = generate_dataset(books=100, patrons=20, loans=400)
+    with database.db_connection() as conn:
+        open_before = conn.execute("SELECT COUNT(*) FROM borrow_records WHERE return_date IS NULL").fetchone()[0]
+
+    results = bench_suite.run_benchmarks(bench_suite.build_context(dataset, 1), iterations=3, warmup=1)
+
+    assert set(results) == set(bench_suite.BENCHMARKS)
+    assert all(r["iterations"] == 3 and r["median_us"] > 0 for r in results.values())
+    with database.db_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM borrow_records WHERE return_date IS NULL").fetchone()[0] == open_before
+
+def test_compare_results_flags_slowdowns(tmp_path):
+    baseline = {"results": {"a": {"median_us": 10.0}, "b": {"median_us": 10.0}, "gone": {"median_us": 1.0}}}
+    current = {"results": {"a": {"median_us": 10.5}, "b": {"median_us": 15.0}, "new": {"median_us": 99.0}}}
+
+    regressions = bench_suite.compare_results(baseline, current, threshold=0.10)
+
+    assert [r["name"] for r in regressions] == ["b"]
+    assert round(regressions[0]["change"], 2) == 0.5
+
+def test_main_writes_json_and_fails_on_regression(tmp_path, monkeypatch):
+    monkeypatch.setattr(database.book_cache, "size", database.book_cache.size)
+    output = tmp_path / "results.json"
+    args = ["--books", "50", "--patrons", "10", "--loans", "100", "--iterations", "2", "--warmup", "0",
+            "--only", "database.get_book_by_*", "--output", str(output)]
+
+    assert bench_suite.main(args) == 0
+    report = json.loads(output.read_text())
+    assert set(report["results"]) == {"database.get_book_by_id", "database.get_book_by_isbn"}
+    assert report["dataset"]["books"] == 50 and report["environment"]["sqlite"]
+
+    for result in report["results"].values():
+        result["median_us"] /= 100
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(report))
+    assert bench_suite.main(args + ["--baseline", str(baseline)]) == 1
@@ -0,0 +1,87 @@
+import time
+import pytest, database
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+#---------------------------------------------------------------------------------------------------------
+# Book cache
+#---------------------------------------------------------------------------------------------------------
+
+def count_book_queries(mocker):
+    """Count connections handed out while reading books."""
+    return mocker.spy(database, "db_connection")
+
+def test_repeated_lookups_skip_sqlite(mocker, add_book):
+    book_id = add_book("8300000000001")
+    database.get_book_by_id(book_id)
+    spy = count_book_queries(mocker)
+    before = database.book_cache.stats()
+
+    for _ in range(3):
+        assert database.get_book_by_id(book_id)["title"] == "Book 8300000000001"
+
+    after = database.book_cache.stats()
+    assert spy.call_count == 0
+    assert after["hits"] - before["hits"] == 3
+
+def test_cached_book_is_a_copy(add_book):
+    book_id = add_book("8300000000011")
+    database.get_book_by_id(book_id)["title"] = "Changed by caller"
+
+    assert database.get_book_by_id(book_id)["title"] == "Book 8300000000011"
+
+def test_missing_books_are_not_cached():
+    before = database.book_cache.stats()["misses"]
+    assert database.get_book_by_id(99999) is None
+    assert database.get_book_by_id(99999) is None
+    assert database.book_cache.stats()["misses"] - before == 2
+
+@pytest.mark.parametrize("write", [
+    lambda book_id: database.update_book_availability(book_id, -1),
+    lambda book_id: borrow_book_by_patron("830000", book_id),
+])
+def test_writes_invalidate_cached_book(write, add_book):
+    book_id = add_book("8300000000021")
+    assert database.get_book_by_id(book_id)["available_copies"] == 2
+
+    write(book_id)
+
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
+
+def test_return_invalidates_cached_book(add_book):
+    book_id = add_book("8300000000031")
+    assert borrow_book_by_patron("830001", book_id)[0]
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
+
+    assert return_book_by_patron("830001", book_id)[0]
+
+    assert database.get_book_by_id(book_id)["available_copies"] == 2
+
+def test_least_recently_used_book_is_evicted(monkeypatch, add_book):
+    monkeypatch.setattr(database, "book_cache", database.BookCache(size=2, ttl=60))
+    ids = [add_book(f"830000000004{i}") for i in range(3)]
+    for book_id in ids:
+        database.get_book_by_id(book_id)
+
+    database.get_book_by_id(ids[0])
+
+    assert database.book_cache.stats() == {"hits": 0, "misses": 4, "size": 2, "capacity": 2}
+
+def test_entries_expire_after_ttl(monkeypatch, add_book):
+    monkeypatch.setattr(database, "book_cache", database.BookCache(size=8, ttl=60))
+    book_id = add_book("8300000000051")
+    database.get_book_by_id(book_id)
+
+    monkeypatch.setattr(time, "monotonic", lambda real=time.monotonic: real() + 61)
+    database.get_book_by_id(book_id)
+
+    assert database.book_cache.stats()["misses"] == 2
+
+def test_read_racing_a_write_is_not_cached(add_book):
+    book_id = add_book("8300000000061")
+    generation = database.book_cache.generation
+    stale = database.get_book_by_isbn("8300000000061")
+    database.update_book_availability(book_id, -1)
+
+    database.book_cache.put(stale, generation)
+
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
@@ -0,0 +1,227 @@
+import socketserver, threading, time
+import pytest, database
+from services.cache import Cache, LocalCache, FileCache, RedisCache, create_cache, set_cache
+from services import library_service as lib_service
+from services.library_service import search_books_in_catalog, get_catalog_page, borrow_book_by_patron
+
+#---------------------------------------------------------------------------------------------------------
+# Stand-in Redis server (GET, SET .. PX, DEL, SCAN, SELECT, PING)
+#---------------------------------------------------------------------------------------------------------
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    def read_command(self):
+        header = self.rfile.readline()
+        if not header:
+            return None
+        args = []
+        for _ in range(int(header[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def reply(self, value):
+        if value is None:
+            self.wfile.write(b"$-1\r\n")
+        elif isinstance(value, int):
+            self.wfile.write(b":%d\r\n" % value)
+        elif isinstance(value, list):
+            self.wfile.write(b"*%d\r\n" % len(value))
+            for item in value:
+                self.reply(item)
+        else:
+            data = value.encode()
+            self.wfile.write(b"$%d\r\n%s\r\n" % (len(data), data))
+
+    def handle(self):
+        store = self.server.store
+        while (args := self.read_command()) is not None:
+            command = args[0].upper()
+            self.server.commands.append(command)
+            if command == "GET":
+                entry = store.get(args[1])
+                self.reply(entry[0] if entry and entry[1] > time.time() else None)
+            elif command == "SET":
+                store[args[1]] = (args[2], time.time() + int(args[4]) / 1000)
+                self.wfile.write(b"+OK\r\n")
+            elif command == "DEL":
+                self.reply(sum(store.pop(key, None) is not None for key in args[1:]))
+            elif command == "SCAN":
+                prefix = args[3].rstrip("*")
+                self.reply(["0", [key for key in store if key.startswith(prefix)]])
+            elif command in ("SELECT", "PING"):
+                self.wfile.write(b"+OK\r\n")
+            else:
+                self.wfile.write(b"-ERR unknown command\r\n")
+
+@pytest.fixture()
+def redis_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    server.daemon_threads = True
+    server.store, server.commands = {}, []
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def redis_url(server, db=0):
+    return f"redis://127.0.0.1:{server.server_address[1]}/{db}"
+
+#---------------------------------------------------------------------------------------------------------
+# Backends
+#---------------------------------------------------------------------------------------------------------
+
+@pytest.fixture(params=["local", "file", "redis"])
+def backend(request, tmp_path):
+    if request.param == "local":
+        return LocalCache(size=8, ttl=60)
+    if request.param == "file":
+        return FileCache(str(tmp_path / "cache.db"), size=8, ttl=60)
+    return RedisCache(redis_url(request.getfixturevalue("redis_server"), db=2), ttl=60)
+
+def test_backend_get_set_delete_clear(backend):
+    assert backend.get("a") is None
+    backend.set("a", "1")
+    backend.set("b", '{"x": [1, 2]}')
+
+    assert backend.get("a") == "1"
+    assert backend.get("b") == '{"x": [1, 2]}'
+
+    backend.delete("a")
+    assert backend.get("a") is None
+    backend.clear()
+    assert backend.get("b") is None
+    assert (backend.stats()["hits"], backend.stats()["misses"]) == (2, 3)
+
+def test_backend_entries_expire(backend):
+    backend.set("short", "1", ttl=0.05)
+    backend.set("long", "2")
+    time.sleep(0.1)
+
+    assert backend.get("short") is None
+    assert backend.get("long") == "2"
+
+def test_local_cache_evicts_least_recently_used():
+    cache = LocalCache(size=2, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+
+    assert [cache.get(key) for key in "abc"] == ["1", None, "3"]
+
+def test_file_cache_is_shared_between_workers(tmp_path):
+    path = str(tmp_path / "shared.db")
+    worker_a, worker_b = FileCache(path), FileCache(path)
+
+    worker_a.set("k", "from a")
+
+    assert worker_b.get("k") == "from a"
+
+def test_file_cache_prune_keeps_newest_entries(tmp_path):
+    cache = FileCache(str(tmp_path / "cache.db"), size=2, ttl=60)
+    for i in range(4):
+        cache.set(f"k{i}", str(i), ttl=10 + i)
+
+    cache.prune()
+
+    assert [cache.get(f"k{i}") for i in range(4)] == [None, None, "2", "3"]
+
+def test_redis_cache_namespaces_keys(redis_server):
+    cache = RedisCache(redis_url(redis_server), prefix="lib-test")
+    cache.set("k", "v")
+
+    assert "lib-test:k" in redis_server.store
+
+def test_redis_cache_reconnects_after_server_drop(redis_server):
+    cache = RedisCache(redis_url(redis_server))
+    cache.set("k", "v")
+    cache._sock.close()  # e.g. server restarted or idle connection dropped
+
+    assert cache.get("k") == "v"
+
+def test_redis_cache_outage_is_a_miss():
+    server = socketserver.TCPServer(("127.0.0.1", 0), FakeRedisHandler)
+    port = server.server_address[1]
+    server.server_close()
+    cache = RedisCache(f"redis://127.0.0.1:{port}/0", timeout=0.1)
+
+    cache.set("k", "v")
+
+    assert cache.get("k") is None
+    assert cache.stats()["errors"] == 2
+
+@pytest.mark.parametrize("backend_name, url, expected", [
+    ("none", "", Cache),
+    ("local", "", LocalCache),
+    ("redis", "redis://cache:6379/1", RedisCache),
+])
+def test_create_cache_by_name(backend_name, url, expected):
+    assert type(create_cache(backend_name, url)) is expected
+
+def test_create_cache_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        create_cache("memcached")
+    with pytest.raises(ValueError):
+        create_cache("file", "")
+
+#---------------------------------------------------------------------------------------------------------
+# Catalog and search caching
+#---------------------------------------------------------------------------------------------------------
+
+def test_catalog_version_changes_on_book_writes():
+    version = database.get_catalog_version()
+    assert database.insert_book("Versioned", "Author", "8400000000001", 2, 2)
+    after_insert = database.get_catalog_version()
+    book_id = database.get_book_by_isbn("8400000000001")["id"]
+    assert borrow_book_by_patron("840000", book_id)[0]
+
+    assert version < after_insert < database.get_catalog_version()
+
+def test_repeated_search_is_served_from_cache(mocker):
+    assert database.insert_book("Cache Me", "Author", "8400000000011", 1, 1)
+    spy = mocker.spy(lib_service, "search_books")
+
+    first = search_books_in_catalog("cache me", "title")
+    second = search_books_in_catalog("  Cache Me ", "title")
+
+    assert first == second and first[0]["isbn"] == "8400000000011"
+    assert spy.call_count == 1
+
+def test_writes_invalidate_cached_search_and_pages():
+    assert database.insert_book("Stale Check", "Author", "8400000000021", 1, 1)
+    book_id = database.get_book_by_isbn("8400000000021")["id"]
+    assert search_books_in_catalog("stale check", "title")[0]["available_copies"] == 1
+    assert get_catalog_page()[0][0]["available_copies"] == 1
+
+    assert borrow_book_by_patron("840001", book_id)[0]
+
+    assert search_books_in_catalog("stale check", "title")[0]["available_copies"] == 0
+    assert get_catalog_page()[0][0]["available_copies"] == 0
+
+def test_write_in_one_worker_invalidates_shared_cache_for_others(tmp_path, mocker):
+    path = str(tmp_path / "shared.db")
+    assert database.insert_book("Shared", "Author", "8400000000031", 2, 2)
+    set_cache(FileCache(path))
+    assert search_books_in_catalog("shared", "title")[0]["available_copies"] == 2
+
+    # another worker process: its own cache client, same cache file and database
+    set_cache(FileCache(path))
+    spy = mocker.spy(lib_service, "search_books")
+    assert search_books_in_catalog("shared", "title")[0]["available_copies"] == 2
+    assert spy.call_count == 0
+
+    with database.db_connection() as conn:
+        conn.execute("UPDATE books SET available_copies = 1 WHERE isbn = '8400000000031'")
+        conn.commit()
+
+    assert search_books_in_catalog("shared", "title")[0]["available_copies"] == 1
+
+def test_catalog_served_through_redis_backend(client, redis_server):
+    set_cache(RedisCache(redis_url(redis_server)))
+    assert database.insert_book("Redis Backed", "Author", "8400000000041", 1, 1)
+
+    assert "Redis Backed" in client.get("/catalog").get_data(as_text=True)
+    assert "Redis Backed" in client.get("/catalog").get_data(as_text=True)
+
+    assert redis_server.commands.count("SET") == 1
+    assert redis_server.commands.count("GET") == 2
@@ -0,0 +1,55 @@
+import pytest, database
+import routes.catalog_routes as catalog_routes
+import routes.api_routes as api_routes
+from services.cache import FragmentCache
+
+#---------------------------------------------------------------------------------------------------------
+# Catalog row fragment caching
+#---------------------------------------------------------------------------------------------------------
+
+@pytest.fixture()
+def fragments(monkeypatch):
+    cache = FragmentCache(size=100, ttl=60)
+    monkeypatch.setattr(catalog_routes, "row_fragments", cache)
+    monkeypatch.setattr(api_routes, "row_fragments", cache)
+    return cache
+
+def test_rows_rendered_once_then_reused(client, fragments):
+    first = client.get("/catalog").get_data(as_text=True)
+    second = client.get("/catalog").get_data(as_text=True)
+
+    assert first == second
+    stats = fragments.stats()
+    assert (stats["misses"], stats["hits"], stats["size"]) == (3, 3, 3)
+    assert stats["render_seconds"] > 0 and stats["saved_seconds"] > 0
+
+def test_only_changed_row_is_rerendered(client, fragments):
+    client.get("/catalog")
+    book = database.get_book_by_isbn("9780743273565")
+    database.update_book_availability(book["id"], -1)
+
+    html = client.get("/catalog").get_data(as_text=True)
+
+    assert f"{book['available_copies'] - 1}/{book['total_copies']} Available" in html
+    assert (fragments.stats()["misses"], fragments.stats()["hits"]) == (4, 2)
+
+def test_cached_rows_match_fresh_render(client, fragments):
+    cached = client.get("/catalog").get_data(as_text=True)
+    fragments.clear()
+
+    assert client.get("/catalog").get_data(as_text=True) == cached
+
+def test_row_html_is_escaped(client, fragments):
+    assert database.insert_book("<b>Bold</b> & Co", "Author", "8500000000001", 1, 1)
+
+    html = client.get("/catalog").get_data(as_text=True)
+
+    assert "&lt;b&gt;Bold&lt;/b&gt; &amp; Co" in html
+
+def test_metrics_endpoint_reports_caches(client, fragments):
+    client.get("/catalog")
+
+    data = client.get("/api/metrics").get_json()
+
+    assert data["catalog_row_fragments"]["misses"] == 3
+    assert set(data) == {"book_cache", "catalog_cache", "catalog_row_fragments", "payment_gateway"}
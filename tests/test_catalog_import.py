@@ -0,0 +1,100 @@
+import io, json
+import pytest, database
+from services.catalog_import import import_books, import_books_from_file, read_book_rows
+
+#---------------------------------------------------------------------------------------------------------
+# Bulk catalog import
+#---------------------------------------------------------------------------------------------------------
+
+def write_csv(path, lines):
+    path.write_text("title,author,isbn,total_copies\n" + "\n".join(lines) + "\n")
+    return str(path)
+
+def test_import_csv_validates_and_inserts(tmp_path):
+    assert database.insert_book("Already Here", "Author", "7100000000001", 1, 1)
+    path = write_csv(tmp_path / "books.csv", [
+        "Good Book,Good Author,7100000000002,3",
+        "Duplicate Of Catalog,Author,7100000000001,1",
+        ",No Title,7100000000003,1",
+        "Bad Isbn,Author,71000,1",
+        "Bad Copies,Author,7100000000004,zero",
+        "Duplicate In File,Author,7100000000002,1",
+    ])
+
+    report = import_books_from_file(path, batch_size=2)
+
+    assert report["imported"] == 1
+    assert report["rows"] == 6
+    assert report["errors"] == [
+        (3, "A book with this ISBN already exists."),
+        (4, "Title is required."),
+        (5, "ISBN must be exactly 13 digits."),
+        (6, "Total copies must be a positive integer."),
+        (7, "A book with this ISBN already exists."),
+    ]
+    book = database.get_book_by_isbn("7100000000002")
+    assert (book["title"], book["total_copies"], book["available_copies"]) == ("Good Book", 3, 3)
+
+def test_import_jsonl(tmp_path):
+    path = tmp_path / "books.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"title": "Json Book", "author": "Author", "isbn": "7200000000001", "total_copies": 2}),
+        "{not json",
+        json.dumps({"title": "Zero", "author": "Author", "isbn": "7200000000002", "total_copies": 0}),
+    ]))
+
+    report = import_books_from_file(str(path))
+
+    assert report["imported"] == 1
+    assert [line for line, _ in report["errors"]] == [2, 3]
+    assert database.get_book_by_isbn("7200000000001")["title"] == "Json Book"
+
+def test_read_book_rows_reports_unparsable_jsonl_lines():
+    lines = io.StringIO('{"title": "Ok"}\n\n{not json\n[1, 2]\n')
+
+    assert list(read_book_rows(lines, "jsonl")) == [
+        (1, {"title": "Ok"}), (3, {"_error": "Invalid JSON."}), (4, {"_error": "Expected a JSON object."})]
+
+def test_import_jsonl_checks_value_types(tmp_path):
+    path = tmp_path / "books.jsonl"
+    path.write_text("\n".join([
+        json.dumps({"title": 123, "author": "Author", "isbn": "7200000000003", "total_copies": 1}),
+        json.dumps({"title": "Bool", "author": "Author", "isbn": "7200000000004", "total_copies": True}),
+        json.dumps({"title": "Number", "author": "Author", "isbn": 7200000000005, "total_copies": 1}),
+        json.dumps({"title": "Typed", "author": "Author", "isbn": "7200000000006", "total_copies": 1}),
+    ]))
+
+    report = import_books_from_file(str(path))
+
+    assert report["imported"] == 1
+    assert report["errors"] == [(1, "Title must be text."), (2, "Total copies must be a positive integer."),
+                                (3, "ISBN must be text.")]
+
+def test_import_batches_use_few_transactions(mocker):
+    rows = ((i + 2, {"title": f"Batch {i}", "author": "A", "isbn": f"73000000{i:05d}", "total_copies": "1"})
+            for i in range(250))
+    insert = mocker.spy(database, "insert_books")
+    import services.catalog_import as catalog_import
+    mocker.patch.object(catalog_import, "insert_books", insert)
+
+    report = import_books(rows, batch_size=100)
+
+    assert report["imported"] == 250
+    assert insert.call_count == 3
+    assert report["rows_per_second"] > 0
+
+def test_import_rejects_unknown_format(tmp_path):
+    path = tmp_path / "books.xml"
+    path.write_text("<books/>")
+
+    with pytest.raises(ValueError):
+        import_books_from_file(str(path))
+
+def test_import_books_cli(runner, tmp_path):
+    path = write_csv(tmp_path / "cli.csv", ["Cli Book,Author,7400000000001,1", "Bad,Author,1,1"])
+
+    result = runner.invoke(args=["import-books", path])
+
+    assert result.exit_code == 0
+    assert "Imported 1 of 2 rows" in result.output
+    assert "line 3: ISBN must be exactly 13 digits." in result.output
@@ -0,0 +1,83 @@
+import threading
+import database
+from services.library_service import (
+    borrow_book_by_patron, return_book_by_patron
+)
+
+#---------------------------------------------------------------------------------------------------------
+# Concurrent borrowing must never oversell a book
+#---------------------------------------------------------------------------------------------------------
+
+def run_concurrently(target, args_list):
+    results = []
+    lock = threading.Lock()
+    start = threading.Barrier(len(args_list))
+
+    def worker(args):
+        start.wait()
+        result = target(*args)
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=worker, args=(args,)) for args in args_list]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+def count_open_loans(book_id):
+    with database.db_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM borrow_records WHERE book_id = ? AND return_date IS NULL", (book_id,)
+        ).fetchone()[0]
+
+def test_concurrent_borrows_do_not_oversell():
+    copies = 5
+    assert database.insert_book("Popular Book", "Author", "5555555555555", copies, copies)
+    book = database.get_book_by_isbn("5555555555555")
+
+    patrons = [f"{i:06d}" for i in range(1, 41)]
+    results = run_concurrently(borrow_book_by_patron, [(p, book["id"]) for p in patrons])
+
+    successes = [r for r in results if r[0]]
+    assert len(successes) == copies
+    assert all("not available" in msg for ok, msg in results if not ok)
+    assert database.get_book_by_id(book["id"])["available_copies"] == 0
+    assert count_open_loans(book["id"]) == copies
+
+def test_concurrent_borrows_respect_patron_limit():
+    assert database.insert_book("Stocked Book", "Author", "5555555555556", 20, 20)
+    book = database.get_book_by_isbn("5555555555556")
+
+    results = run_concurrently(borrow_book_by_patron, [("123456", book["id"])] * 12)
+
+    assert sum(1 for ok, _ in results if ok) == 5
+    assert database.get_patron_borrow_count("123456") == 5
+    assert database.get_book_by_id(book["id"])["available_copies"] == 15
+
+def test_concurrent_borrow_and_return_keep_counts_consistent():
+    copies = 3
+    assert database.insert_book("Busy Book", "Author", "5555555555557", copies, copies)
+    book = database.get_book_by_isbn("5555555555557")
+    holders = ["100001", "100002", "100003"]
+    for p in holders:
+        assert borrow_book_by_patron(p, book["id"])[0]
+
+    calls = [(return_book_by_patron, p) for p in holders] + [(borrow_book_by_patron, f"2000{i:02d}") for i in range(10)]
+    run_concurrently(lambda fn, p: fn(p, book["id"]), calls)
+
+    available = database.get_book_by_id(book["id"])["available_copies"]
+    assert 0 <= available <= copies
+    assert available + count_open_loans(book["id"]) == copies
+
+def test_return_closes_single_loan():
+    assert database.insert_book("Twice Borrowed", "Author", "5555555555558", 2, 2)
+    book = database.get_book_by_isbn("5555555555558")
+    assert borrow_book_by_patron("300000", book["id"])[0]
+    assert borrow_book_by_patron("300000", book["id"])[0]
+
+    assert return_book_by_patron("300000", book["id"])[0]
+
+    assert database.get_patron_borrow_count("300000") == 1
+    assert database.get_book_by_id(book["id"])["available_copies"] == 1
@@ -0,0 +1,114 @@
+import threading
+import pytest, database
+from flask import Flask
+
+#---------------------------------------------------------------------------------------------------------
+# Connection pool
+#---------------------------------------------------------------------------------------------------------
+
+def test_pool_reuses_released_connection():
+    pool = database.get_pool()
+    conn = pool.acquire()
+    pool.release(conn)
+
+    assert pool.acquire() is conn
+
+def test_pool_replaces_unhealthy_connection():
+    pool = database.get_pool()
+    conn = pool.acquire()
+    conn.close()
+    pool.release(conn)
+
+    fresh = pool.acquire()
+    assert fresh is not conn
+    assert fresh.execute("SELECT 1").fetchone()[0] == 1
+
+def test_pool_keeps_at_most_size_idle_connections():
+    pool = database.ConnectionPool(database.DATABASE, size=2)
+    conns = [pool.acquire() for _ in range(4)]
+    for conn in conns:
+        pool.release(conn)
+
+    assert pool._idle.qsize() == 2
+
+def test_pool_rolls_back_uncommitted_work_on_release():
+    pool = database.get_pool()
+    conn = pool.acquire()
+    conn.execute("INSERT INTO books (title, author, isbn, total_copies, available_copies) VALUES ('T', 'A', '1111111111111', 1, 1)")
+    pool.release(conn)
+
+    assert database.get_book_by_isbn("1111111111111") is None
+
+def test_pool_follows_database_path(tmp_path):
+    first = database.get_pool()
+    database.DATABASE = str(tmp_path / "other.db")
+
+    assert database.get_pool() is not first
+    assert database.get_pool().database == database.DATABASE
+
+def test_helpers_share_connections_across_threads():
+    assert database.insert_book("Pool Book", "Author", "2222222222222", 3, 3)
+    errors = []
+
+    def worker():
+        try:
+            for _ in range(20):
+                assert database.get_book_by_isbn("2222222222222")["title"] == "Pool Book"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    assert database.get_pool()._idle.qsize() <= database.POOL_SIZE
+
+#---------------------------------------------------------------------------------------------------------
+# Request-scoped connection
+#---------------------------------------------------------------------------------------------------------
+
+def test_request_uses_single_connection():
+    app = Flask(__name__)
+    app.teardown_appcontext(database.close_request_connection)
+
+    with app.app_context():
+        with database.db_connection() as first:
+            pass
+        with database.db_connection() as second:
+            pass
+        assert first is second
+
+    # handed back to the pool on teardown
+    assert database.get_pool().acquire() is first
+
+#---------------------------------------------------------------------------------------------------------
+# PRAGMA profiles
+#---------------------------------------------------------------------------------------------------------
+
+def test_performance_profile_applied_to_connections(monkeypatch):
+    monkeypatch.setattr(database, "DB_PROFILE", "performance")
+    conn = database.get_db_connection()
+
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    conn.close()
+
+def test_pragma_overrides_replace_profile_values():
+    pragmas = database.get_pragmas("performance", "cache_size=-2000, mmap_size=0")
+
+    assert pragmas["cache_size"] == "-2000"
+    assert pragmas["mmap_size"] == "0"
+    assert pragmas["journal_mode"] == "WAL"
+
+@pytest.mark.parametrize("profile, overrides", [
+    ("turbo", ""),
+    ("default", "cache_size"),
+    ("default", "cache_size=1; DROP TABLE books"),
+])
+def test_invalid_profile_or_override_rejected(profile, overrides):
+    with pytest.raises(ValueError):
+        database.get_pragmas(profile, overrides)
@@ -0,0 +1,55 @@
+import csv, io, json
+from datetime import datetime, timedelta
+import pytest, database
+import routes.api_routes as api_routes
+
+#---------------------------------------------------------------------------------------------------------
+# Streaming exports
+#---------------------------------------------------------------------------------------------------------
+
+def test_export_books_csv(client):
+    assert database.insert_book("Export, With Comma", "Author", "6100000000001", 2, 2)
+
+    response = client.get("/api/export/books")
+
+    assert response.status_code == 200
+    assert response.mimetype == "text/csv"
+    assert response.is_streamed
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert {"title": "Export, With Comma", "isbn": "6100000000001"}.items() <= rows[-1].items()
+    assert len(rows) == len(database.get_all_books())
+
+def test_export_open_loans_ndjson(client):
+    assert database.insert_book("Loaned", "Author", "6100000000002", 2, 2)
+    book = database.get_book_by_isbn("6100000000002")
+    now = datetime.now()
+    assert database.insert_borrow_record("610000", book["id"], now, now + timedelta(days=14))
+    assert database.insert_borrow_record("610001", book["id"], now, now + timedelta(days=14))
+    assert database.update_borrow_record_return_date("610001", book["id"], now)
+
+    response = client.get("/api/export/loans?format=ndjson")
+
+    assert response.mimetype == "application/x-ndjson"
+    loans = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    ours = [loan for loan in loans if loan["book_id"] == book["id"]]
+    assert [loan["patron_id"] for loan in ours] == ["610000"]
+    assert ours[0]["title"] == "Loaned"
+
+def test_export_streams_in_chunks(client, monkeypatch):
+    monkeypatch.setattr(api_routes, "EXPORT_CHUNK_ROWS", 2)
+    for i in range(5):
+        assert database.insert_book(f"Chunk {i}", "Author", f"610000000010{i}", 1, 1)
+
+    response = client.get("/api/export/books?format=ndjson")
+    chunks = list(response.response)
+
+    total = len(database.get_all_books())
+    assert len(chunks) == (total + 1) // 2
+    assert sum(chunk.count(b"\n") for chunk in chunks) == total
+
+@pytest.mark.parametrize("url, status", [
+    ("/api/export/patrons", 404),
+    ("/api/export/books?format=xml", 400),
+])
+def test_export_rejects_unknown_source_or_format(client, url, status):
+    assert client.get(url).status_code == status
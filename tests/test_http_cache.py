@@ -0,0 +1,59 @@
+import pytest, database
+from services import library_service as lib_service
+
+#---------------------------------------------------------------------------------------------------------
+# Conditional GET for /catalog and /api/search
+#---------------------------------------------------------------------------------------------------------
+
+URLS = ["/catalog", "/api/search?q=gatsby&type=title"]
+
+@pytest.mark.parametrize("url", URLS)
+def test_full_response_carries_validators(client, url):
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] == f'"catalog-{database.get_catalog_version()}"'
+    assert response.headers["Last-Modified"]
+    assert "no-cache" in response.headers["Cache-Control"]
+
+@pytest.mark.parametrize("url", URLS)
+def test_matching_etag_gets_304_without_running_view(client, mocker, url):
+    etag = client.get(url).headers["ETag"]
+    page = mocker.spy(lib_service, "get_books_page")
+    search = mocker.spy(lib_service, "search_books")
+
+    response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.data == b""
+    assert response.headers["ETag"] == etag
+    assert page.call_count == search.call_count == 0
+
+@pytest.mark.parametrize("url", URLS)
+def test_catalog_write_changes_etag(client, url):
+    etag = client.get(url).headers["ETag"]
+    with database.db_connection() as conn:
+        conn.execute("UPDATE books SET available_copies = 0 WHERE isbn = '9780743273565'")
+        conn.commit()
+
+    response = client.get(url, headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_if_modified_since(client):
+    last_modified = client.get("/catalog").headers["Last-Modified"]
+
+    assert client.get("/catalog", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get("/catalog", headers={"If-Modified-Since": "Thu, 01 Jan 1970 00:00:00 GMT"}).status_code == 200
+
+def test_pending_flash_is_never_answered_with_304(client):
+    etag = client.get("/catalog").headers["ETag"]
+    client.post("/borrow", data={"patron_id": "bad", "book_id": "1"})
+
+    response = client.get("/catalog", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert "Invalid patron ID" in response.get_data(as_text=True)
+    assert "ETag" not in response.headers
+    assert "no-store" in response.headers["Cache-Control"]
@@ -0,0 +1,58 @@
+import pytest
+import database
+from benchmarks.datagen import generate_dataset
+from benchmarks.load_test import run_load, percentile, parse_mix, DEFAULT_MIX, TRANSPORTS, VirtualClient
+
+def open_loans():
+    with database.db_connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM borrow_records WHERE return_date IS NULL").fetchone()[0]
+
+@pytest.mark.parametrize("transport", ["wsgi", "http"])
+def test_load_reports_every_route(app, transport):
+    generate_dataset(books=100, patrons=20, loans=300)
+    before = open_loans()
+
+    report = run_load(app, clients=4, duration=0.5, mix={**DEFAULT_MIX, "borrow": 30, "return": 30},
+                      transport=transport)
+
+    assert set(report["routes"]) == {"GET /catalog", "GET /catalog?after_title", "GET /search", "GET /api/search",
+                                     "GET /api/late_fee", "POST /borrow", "POST /return"}
+    assert report["errors"] == 0 and report["requests"] > 20
+    route = report["routes"]["GET /catalog"]
+    assert 0 < route["p50_ms"] <= route["p90_ms"] <= route["p99_ms"] <= route["max_ms"]
+    assert open_loans() == before  # clients hand back what they borrowed
+
+@pytest.mark.parametrize("transport", ["wsgi", "http"])
+def test_refused_borrows_are_not_tracked(app, add_book, transport):
+    book_id = add_book("9990000000001", copies=1)
+    server = TRANSPORTS[transport](app)
+    try:
+        user = VirtualClient(server.session(), "999999", books=1, seed=0)
+        user.random_book = lambda: book_id
+
+        user.borrow()
+        user.borrow()  # no copies left: the app redirects with an error flash
+        assert user.borrowed == [book_id]
+        user.return_()
+    finally:
+        server.close()
+
+    assert user.borrowed == [] and not user.errors
+    assert database.get_book_by_id(book_id)["available_copies"] == 1
+
+def test_load_with_custom_mix(app):
+    generate_dataset(books=20, patrons=5, loans=20)
+
+    report = run_load(app, clients=2, duration=0.2, mix={"late_fee": 1})
+
+    assert list(report["routes"]) == ["GET /api/late_fee"]
+    with pytest.raises(ValueError):
+        run_load(app, clients=1, duration=0.1, mix={"checkout": 1})
+
+def test_percentile_and_mix_parsing():
+    values = [float(i) for i in range(1, 101)]
+
+    assert (percentile(values, 0.5), percentile(values, 0.99), percentile(values, 1.0)) == (50.0, 99.0, 100.0)
+    assert percentile([], 0.5) == 0.0
+    assert parse_mix("catalog=3, borrow=1") == {"catalog": 3, "borrow": 1}
+    assert set(DEFAULT_MIX) >= {"catalog", "search", "late_fee", "borrow", "return"}
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import database
+import app as app_module
+from services.overdue_sweep import run_overdue_sweep, OverdueSweepScheduler
+from services.library_service import find_late_fee, return_book_by_patron
+
+#---------------------------------------------------------------------------------------------------------
+# Overdue sweep
+#---------------------------------------------------------------------------------------------------------
+
+TODAY = datetime(2025, 3, 20, 12, 0)
+
+def test_sweep_materializes_overdue_loans(add_loan):
+    add_loan("800000", "8100000000001", TODAY - timedelta(days=3))
+    add_loan("800000", "8100000000002", TODAY - timedelta(days=30))
+    add_loan("800000", "8100000000003", TODAY + timedelta(days=2))
+
+    result = run_overdue_sweep(TODAY.date())
+
+    assert result["added"] == 2
+    loans = database.get_overdue_loans("800000")
+    assert [(l["days_overdue"], l["fee_amount"]) for l in loans] == [(30, 15.0), (3, 1.5)]
+
+def test_sweep_is_incremental(mocker, add_loan):
+    add_loan("800001", "8100000000011", TODAY - timedelta(days=1))
+    add_loan("800001", "8100000000012", TODAY + timedelta(days=1, hours=1))
+    run_overdue_sweep(TODAY.date())
+
+    # Two days later: the second loan fell due, the first one accrued more fees
+    result = run_overdue_sweep(TODAY.date() + timedelta(days=2))
+
+    assert (result["added"], result["updated"]) == (1, 1)
+    loans = database.get_overdue_loans("800001")
+    assert [l["fee_amount"] for l in loans] == [find_late_fee(3), find_late_fee(1)]
+
+def test_sweep_drops_returned_loans(add_loan):
+    book_id = add_loan("800002", "8100000000021", TODAY - timedelta(days=5))
+    run_overdue_sweep(TODAY.date())
+    assert return_book_by_patron("800002", book_id)[0]
+
+    result = run_overdue_sweep(TODAY.date())
+
+    assert result["removed"] == 1
+    assert database.get_overdue_loans("800002") == []
+
+def test_full_sweep_picks_up_backdated_loans(add_loan):
+    run_overdue_sweep(TODAY.date())
+    add_loan("800003", "8100000000031", TODAY - timedelta(days=10))
+
+    assert run_overdue_sweep(TODAY.date())["added"] == 0
+    assert run_overdue_sweep(TODAY.date(), full=True)["added"] == 1
+
+def test_overdue_api_reads_materialized_fees(client, add_loan):
+    add_loan("800004", "8100000000041", datetime.now() - timedelta(days=4))
+    run_overdue_sweep()
+
+    data = client.get("/api/overdue/800004").get_json()
+
+    assert data["total_late_fees"] == 2.0
+    assert data["loans"][0]["days_overdue"] == 4
+
+def test_scheduler_runs_sweep_until_stopped(add_loan):
+    add_loan("800005", "8100000000051", datetime.now() - timedelta(days=2))
+    scheduler = OverdueSweepScheduler(interval=3600)
+
+    scheduler.start()
+    scheduler.stop(timeout=5)
+
+    assert scheduler.last_result["added"] == 1
+    assert database.get_overdue_loans("800005")[0]["fee_amount"] == 1.0
+
+def test_sweep_overdue_cli(runner, add_loan):
+    add_loan("800006", "8100000000061", TODAY - timedelta(days=1))
+
+    result = runner.invoke(args=["sweep-overdue", "--as-of", "2025-03-20"])
+
+    assert result.exit_code == 0
+    assert "1 added" in result.output
+
+def test_scheduler_starts_with_requests_not_commands(monkeypatch):
+    start = Mock()
+    monkeypatch.setattr(app_module, "start_overdue_scheduler", start)
+    app = app_module.create_app()
+
+    assert app.test_cli_runner().invoke(args=["reconcile-patrons"]).exit_code == 0
+    start.assert_not_called()
+    app.test_client().get("/catalog")
+    start.assert_called()
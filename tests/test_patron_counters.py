@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta
+import database
+from services.library_service import borrow_book_by_patron, return_book_by_patron
+
+#---------------------------------------------------------------------------------------------------------
+# Patron open-loan counters
+#---------------------------------------------------------------------------------------------------------
+
+def set_counter(patron_id, value):
+    with database.db_connection() as conn:
+        conn.execute("UPDATE patrons SET open_loans = ? WHERE patron_id = ?", (value, patron_id))
+        conn.commit()
+
+def test_counter_follows_borrow_and_return(add_book):
+    book_id = add_book("8200000000001")
+
+    assert borrow_book_by_patron("820000", book_id)[0]
+    assert borrow_book_by_patron("820000", book_id)[0]
+    assert database.get_patron_borrow_count("820000") == 2
+
+    assert return_book_by_patron("820000", book_id)[0]
+    assert database.get_patron_borrow_count("820000") == 1
+
+def test_unknown_patron_has_no_loans():
+    assert database.get_patron_borrow_count("820001") == 0
+
+def test_limit_check_reads_counter(add_book):
+    book_id = add_book("8200000000011")
+    assert borrow_book_by_patron("820002", book_id)[0]
+    set_counter("820002", 5)
+
+    success, message = borrow_book_by_patron("820002", book_id)
+
+    assert success is False
+    assert "maximum borrowing limit" in message
+
+def test_counters_backfilled_when_table_created(add_book):
+    book_id = add_book("8200000000021")
+    now = datetime.now()
+    database.insert_borrow_record("820003", book_id, now, now + timedelta(days=14))
+    database.insert_borrow_record("820003", book_id, now, now + timedelta(days=14))
+    with database.db_connection() as conn:
+        conn.execute("DROP TABLE patrons")
+        conn.commit()
+
+    database.init_database()
+
+    assert database.get_patron_borrow_count("820003") == 2
+
+def test_reconcile_reports_and_fixes_drift(add_book):
+    book_id = add_book("8200000000031")
+    assert borrow_book_by_patron("820004", book_id)[0]
+    assert borrow_book_by_patron("820006", book_id)[0]
+    set_counter("820004", 4)
+    with database.db_connection() as conn:
+        conn.execute("DELETE FROM patrons WHERE patron_id = '820006'")
+        conn.commit()
+
+    mismatches = database.reconcile_patron_counters()
+    assert {m["patron_id"]: (m["counter"], m["actual"]) for m in mismatches} == {
+        "820004": (4, 1), "820006": (0, 1)}
+    assert database.get_patron_borrow_count("820004") == 4
+
+    database.reconcile_patron_counters(fix=True)
+    assert database.reconcile_patron_counters() == []
+    assert database.get_patron_borrow_count("820004") == 1
+    assert database.get_patron_borrow_count("820006") == 1
+
+def test_reconcile_patrons_cli(runner, add_book):
+    book_id = add_book("8200000000041")
+    assert borrow_book_by_patron("820005", book_id)[0]
+    set_counter("820005", 0)
+
+    result = runner.invoke(args=["reconcile-patrons"])
+    assert result.exit_code == 1
+    assert "patron 820005: counter 0, open loans 1" in result.output
+
+    result = runner.invoke(args=["reconcile-patrons", "--fix"])
+    assert result.exit_code == 0
+    assert "Fixed 1 patron counters." in result.output
+    assert "All patron counters match" in runner.invoke(args=["reconcile-patrons"]).output
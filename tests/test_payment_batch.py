@@ -0,0 +1,86 @@
+import threading, time
+from services.library_service import pay_late_fees_batch
+
+#---------------------------------------------------------------------------------------------------------
+# pay_late_fees_batch()
+#---------------------------------------------------------------------------------------------------------
+
+def test_fees_grouped_into_one_charge_per_patron(add_overdue_loan, mock_gateway):
+    dune = add_overdue_loan("870000", "8700000000001", 3, "Dune")       # $1.50
+    emma = add_overdue_loan("870000", "8700000000002", 10, "Emma")      # $6.50
+    solo = add_overdue_loan("870001", "8700000000003", 2, "Solaris")    # $1.00
+    gateway = mock_gateway()
+
+    report = pay_late_fees_batch([("870000", dune), ("870001", solo), ("870000", emma)], gateway)
+
+    assert (report["charges"], report["succeeded"], report["failed"]) == (2, 3, 0)
+    assert report["total_charged"] == 9.0
+    assert [item["fee_amount"] for item in report["items"]] == [1.5, 1.0, 6.5]
+    assert [item["transaction_id"] for item in report["items"]] == ["txn_870000_1", "txn_870001_1", "txn_870000_1"]
+    gateway.process_payment.assert_any_call(
+        patron_id="870000", amount=8.0, description="Late fees for 2 books: 'Dune', 'Emma'")
+    gateway.process_payment.assert_any_call(
+        patron_id="870001", amount=1.0, description="Late fees for 'Solaris'")
+    assert report["items_per_second"] > 0
+
+def test_items_without_fees_are_reported_not_charged(add_overdue_loan, mock_gateway):
+    overdue = add_overdue_loan("870002", "8700000000011", 4, "Overdue")
+    on_time = add_overdue_loan("870002", "8700000000012", -3, "On Time")
+    gateway = mock_gateway()
+
+    report = pay_late_fees_batch([("12ab56", overdue), ("870002", on_time), ("870002", 9999),
+                                  ("870002", overdue), ("870002", overdue)], gateway)
+
+    messages = [item["message"] for item in report["items"]]
+    assert "Invalid patron ID" in messages[0]
+    assert messages[1] == messages[2] == "No late fees to pay for this book."
+    assert "Payment successful!" in messages[3]
+    assert "Duplicate item" in messages[4]
+    assert (report["succeeded"], report["failed"]) == (1, 4)
+    gateway.process_payment.assert_called_once()
+
+def test_declines_and_errors_fail_only_that_patron(add_overdue_loan, mock_gateway):
+    ok = add_overdue_loan("870003", "8700000000021", 1, "Paid")
+    declined = add_overdue_loan("870004", "8700000000022", 1, "Declined")
+    broken = add_overdue_loan("870005", "8700000000023", 1, "Broken")
+
+    def process_payment(patron_id, amount, description):
+        if patron_id == "870004":
+            return False, "", "Payment declined"
+        if patron_id == "870005":
+            raise ConnectionError("Network Error")
+        return True, "txn_870003_1", "ok"
+
+    gateway = mock_gateway()
+    gateway.process_payment.side_effect = process_payment
+
+    items = pay_late_fees_batch([("870003", ok), ("870004", declined), ("870005", broken)], gateway)["items"]
+
+    assert [item["success"] for item in items] == [True, False, False]
+    assert items[1]["message"] == "Payment failed: Payment declined"
+    assert items[2]["message"] == "Payment processing error: Network Error"
+    assert items[2]["transaction_id"] is None
+
+def test_gateway_calls_run_with_bounded_concurrency(add_overdue_loan, mock_gateway):
+    items = [("87010" + str(i), add_overdue_loan("87010" + str(i), f"870000000010{i}", 5, f"Book {i}"))
+             for i in range(8)]
+    in_flight, peak, lock = 0, 0, threading.Lock()
+
+    def slow_payment(patron_id, amount, description):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.1)
+        with lock:
+            in_flight -= 1
+        return True, f"txn_{patron_id}_1", "ok"
+
+    gateway = mock_gateway()
+    gateway.process_payment.side_effect = slow_payment
+
+    report = pay_late_fees_batch(items, gateway, max_workers=4)
+
+    assert report["succeeded"] == 8
+    assert peak == 4
+    assert report["seconds"] < 0.6  # 8 sequential calls take 0.8 s
@@ -0,0 +1,230 @@
+import asyncio, json, threading, time
+from unittest.mock import Mock
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest, requests
+from services import payment_service
+from services import library_service as lib_service
+from services.payment_service import HttpPaymentGateway, AsyncPaymentGateway, PaymentGateway, PaymentUnavailableError
+
+#---------------------------------------------------------------------------------------------------------
+# Local stand-in for the payment gateway API
+#---------------------------------------------------------------------------------------------------------
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        return json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def do_POST(self):
+        body = self.read_json()
+        self.server.requests.append((self.path, body, self.headers["Authorization"]))
+        time.sleep(self.server.delay)
+        if self.server.fail:
+            return self.send_json(self.server.fail, {"error": {"message": "maintenance"}})
+        if self.path == "/charges":
+            if body["amount"] > 1000:
+                return self.send_json(402, {"error": {"message": "Payment declined: amount exceeds limit"}})
+            key = self.headers["Idempotency-Key"]
+            charge = self.server.charges.get(key) or {
+                "id": f"txn_{body['customer_id']}_{len(self.server.charges) + 1}", "status": "succeeded",
+                "message": f"Payment of ${body['amount']:.2f} processed successfully"}
+            if key:
+                self.server.charges[key] = charge
+            return self.send_json(200, charge)
+        if self.path == "/refunds":
+            return self.send_json(200, {"id": f"refund_{body['transaction_id']}", "status": "succeeded"})
+        self.send_json(404, {"error": {"message": "not found"}})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        key = parse_qs(url.query).get("idempotency_key", [None])[0]
+        if url.path == "/charges" and key in self.server.charges:
+            charge = self.server.charges[key]
+            return self.send_json(200, {"transaction_id": charge["id"], "status": "completed"})
+        if self.path == "/charges/txn_123456_1":
+            return self.send_json(200, {"transaction_id": "txn_123456_1", "status": "completed", "amount": 3.0})
+        self.send_json(404, {"error": {"message": "No such charge"}})
+
+@pytest.fixture()
+def fake_gateway():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeGatewayHandler)
+    server.daemon_threads = True
+    server.connections, server.requests, server.delay, server.fail = 0, [], 0.0, None
+    server.charges = {}  # by Idempotency-Key
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield server
+    payment_service.close_http_session()
+    server.shutdown()
+    server.server_close()
+
+#---------------------------------------------------------------------------------------------------------
+# HttpPaymentGateway
+#---------------------------------------------------------------------------------------------------------
+
+def test_http_payment_success(fake_gateway):
+    gateway = HttpPaymentGateway(fake_gateway.url, api_key="secret")
+
+    success, txn, message = gateway.process_payment("123456", 3.5, "Late fees")
+
+    assert (success, txn) == (True, "txn_123456_1")
+    assert "3.50" in message
+    path, body, auth = fake_gateway.requests[0]
+    assert path == "/charges" and body["amount"] == 3.5 and auth == "Bearer secret"
+
+def test_http_payment_declined(fake_gateway):
+    success, txn, message = HttpPaymentGateway(fake_gateway.url).process_payment("123456", 1001.0)
+
+    assert (success, txn) == (False, "")
+    assert "declined" in message
+
+def test_http_refund_and_status(fake_gateway):
+    gateway = HttpPaymentGateway(fake_gateway.url)
+
+    success, message = gateway.refund_payment("txn_123456_1", 2.0)
+    assert success and "refund_txn_123456_1" in message
+    assert gateway.verify_payment_status("txn_123456_1")["status"] == "completed"
+    assert gateway.verify_payment_status("txn_unknown")["status"] == "not_found"
+
+def test_http_refund_message_without_refund_id():
+    session = Mock()
+    session.request.return_value = Mock(status_code=200, json=lambda: {"message": "Refunded"})
+
+    assert HttpPaymentGateway("https://pay.example.com", session=session).refund_payment("txn_1", 2.0) == (
+        True, "Refunded")
+
+@pytest.mark.parametrize("status", [408, 429])
+def test_http_throttling_is_not_a_decline(fake_gateway, status):
+    fake_gateway.fail = status
+    gateway = HttpPaymentGateway(fake_gateway.url)
+
+    with pytest.raises(PaymentUnavailableError):
+        gateway.process_payment("123456", 1.0)
+    with pytest.raises(PaymentUnavailableError):
+        gateway.refund_payment("txn_123456_1", 1.0)
+
+def test_http_charge_sends_idempotency_key(fake_gateway):
+    gateway = HttpPaymentGateway(fake_gateway.url)
+
+    with payment_service.idempotency_key("late_fee:123456:1:1"):
+        first = gateway.process_payment("123456", 1.0)
+        retry = gateway.process_payment("123456", 1.0)
+
+    assert first == retry
+    assert gateway.verify_payment_status(idempotency_key="late_fee:123456:1:1")["transaction_id"] == first[1]
+    assert gateway.verify_payment_status(idempotency_key="late_fee:123456:1:2")["status"] == "not_found"
+
+def test_timed_out_charge_is_verified_not_repeated(fake_gateway, monkeypatch, add_overdue_loan):
+    book_id = add_overdue_loan("123456", "8800000000991")
+    fake_gateway.delay = 0.3
+    gateway = HttpPaymentGateway(fake_gateway.url, timeout=(1, 0.1))
+
+    assert "Payment processing error" in lib_service.pay_late_fees("123456", book_id, gateway)[1]
+    monkeypatch.setattr(lib_service, "PAYMENT_PENDING_TIMEOUT", 0)
+    time.sleep(0.3)  # the charge went through after the client gave up
+    success, message, txn = lib_service.pay_late_fees("123456", book_id, gateway)
+
+    assert (success, txn) == (True, "txn_123456_1")
+    assert len(fake_gateway.requests) == 1
+
+def test_http_connections_are_reused(fake_gateway):
+    gateway = HttpPaymentGateway(fake_gateway.url)
+    for _ in range(5):
+        assert gateway.process_payment("123456", 1.0)[0]
+
+    # a second client instance shares the process-wide session
+    assert HttpPaymentGateway(fake_gateway.url).process_payment("123456", 1.0)[0]
+
+    assert fake_gateway.connections == 1
+
+def test_http_timeout_raises(fake_gateway):
+    fake_gateway.delay = 0.5
+    gateway = HttpPaymentGateway(fake_gateway.url, timeout=(1, 0.1))
+
+    with pytest.raises(requests.Timeout):
+        gateway.process_payment("123456", 1.0)
+
+def test_http_server_error_surfaces_as_payment_error(fake_gateway, mocker):
+    fake_gateway.fail = 503
+    mocker.patch.object(lib_service, "calculate_late_fee_for_book", return_value={"fee_amount": 3.0})
+    mocker.patch.object(lib_service, "get_book_by_id", return_value={"id": 1, "title": "Dune"})
+
+    success, message, txn = lib_service.pay_late_fees("123456", 1, HttpPaymentGateway(fake_gateway.url))
+
+    assert (success, txn) == (False, None)
+    assert "Payment processing error" in message and "503" in message
+
+def test_configured_gateway(monkeypatch):
+    monkeypatch.setattr(payment_service, "_gateway", None)
+    assert type(payment_service.get_payment_gateway().gateway) is PaymentGateway
+
+    monkeypatch.setattr(payment_service, "_gateway", None)
+    monkeypatch.setattr(payment_service, "PAYMENT_GATEWAY_URL", "https://pay.example.com")
+    assert isinstance(payment_service.get_payment_gateway().gateway, HttpPaymentGateway)
+
+#---------------------------------------------------------------------------------------------------------
+# AsyncPaymentGateway
+#---------------------------------------------------------------------------------------------------------
+
+def test_async_payments_run_concurrently(fake_gateway):
+    fake_gateway.delay = 0.2
+    gateway = AsyncPaymentGateway(HttpPaymentGateway(fake_gateway.url), max_concurrency=10)
+
+    async def pay_all():
+        return await asyncio.gather(*(gateway.process_payment(f"12345{i}", 1.0) for i in range(10)))
+
+    start = time.perf_counter()
+    results = asyncio.run(pay_all())
+    elapsed = time.perf_counter() - start
+
+    assert all(success for success, _, _ in results)
+    assert elapsed < 1.0  # sequentially this takes 2 s
+    assert fake_gateway.connections <= 10
+
+def test_async_concurrency_is_bounded(fake_gateway):
+    fake_gateway.delay = 0.1
+    gateway = AsyncPaymentGateway(HttpPaymentGateway(fake_gateway.url), max_concurrency=2)
+
+    async def pay_all():
+        return await asyncio.gather(*(gateway.refund_payment("txn_123456_1", 1.0) for _ in range(6)))
+
+    start = time.perf_counter()
+    asyncio.run(pay_all())
+
+    assert time.perf_counter() - start >= 0.3
+    assert fake_gateway.connections <= 2
+
+def test_pay_late_fees_async(fake_gateway, mocker):
+    mocker.patch.object(lib_service, "calculate_late_fee_for_book", return_value={"fee_amount": 4.5})
+    mocker.patch.object(lib_service, "get_book_by_id", return_value={"id": 1, "title": "Dune"})
+    gateway = AsyncPaymentGateway(HttpPaymentGateway(fake_gateway.url))
+
+    success, message, txn = asyncio.run(lib_service.pay_late_fees_async("123456", 1, gateway))
+
+    assert (success, txn) == (True, "txn_123456_1")
+    assert fake_gateway.requests[0][1]["description"] == "Late fees for 'Dune'"
+
+def test_pay_late_fees_async_validates_first():
+    gateway = AsyncPaymentGateway(PaymentGateway())
+
+    success, message, txn = asyncio.run(lib_service.pay_late_fees_async("12ab56", 1, gateway))
+
+    assert (success, txn) == (False, None)
+    assert "Invalid patron ID" in message
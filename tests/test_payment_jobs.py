@@ -0,0 +1,239 @@
+import threading, time
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+import pytest, requests, database
+import app as app_module
+from services import library_service as lib_service
+from services import payment_jobs
+from services.payment_service import CircuitOpenError, BulkheadFullError, PaymentTimeoutError
+from services.payment_jobs import (
+    enqueue_late_fee_payment, enqueue_refund, process_next_job, get_job_status, PaymentWorkerPool
+)
+
+@pytest.fixture()
+def gateway(monkeypatch, mock_gateway):
+    gateway = mock_gateway("txn_890000_1")
+    monkeypatch.setattr(lib_service, "get_payment_gateway", lambda: gateway)
+    monkeypatch.setattr(payment_jobs, "backoff_delay", lambda attempts: 0)
+    return gateway
+
+#---------------------------------------------------------------------------------------------------------
+# Queue and retries
+#---------------------------------------------------------------------------------------------------------
+
+def test_enqueue_does_not_call_gateway(gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890000", "8900000000001")
+
+    success, message, job_id = enqueue_late_fee_payment("890000", book_id)
+
+    assert success and message == "Payment queued."
+    assert get_job_status(job_id)["status"] == "queued"
+    gateway.process_payment.assert_not_called()
+
+def test_enqueue_rejects_malformed_requests():
+    assert enqueue_late_fee_payment("12ab56", 1) == (False, "Invalid patron ID. Must be exactly 6 digits.", None)
+    assert enqueue_late_fee_payment("123456", "1") == (False, "Invalid book ID.", None)
+    assert enqueue_refund("abc", 1.0) == (False, "Invalid transaction ID.", None)
+    assert enqueue_refund("txn_1", 0) == (False, "Refund amount must be greater than 0.", None)
+
+def test_worker_runs_payment_job(gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890000", "8900000000011")
+    job_id = enqueue_late_fee_payment("890000", book_id)[2]
+
+    assert process_next_job("test")["id"] == job_id
+    assert process_next_job("test") is None
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["attempts"]) == ("succeeded", 1)
+    assert job["result"] == {"success": True, "transaction_id": "txn_890000_1",
+                             "message": "Payment successful! Payment of $2.00 processed successfully"}
+
+def test_unavailable_gateway_is_retried_with_backoff(gateway, monkeypatch, add_overdue_loan):
+    book_id = add_overdue_loan("890001", "8900000000021")
+    gateway.process_payment.side_effect = [CircuitOpenError("circuit open"), (True, "txn_890001_1", "ok")]
+    job_id = enqueue_late_fee_payment("890001", book_id)[2]
+
+    monkeypatch.setattr(payment_jobs, "backoff_delay", lambda attempts: 60)
+    process_next_job("test")
+    job = get_job_status(job_id)
+    assert (job["status"], job["error"]) == ("queued", "Payment processing error: circuit open")
+    assert process_next_job("test") is None  # not due for another minute
+
+    database.retry_payment_job(job_id, datetime.now(), job["error"])
+    process_next_job("test")
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["attempts"], job["result"]["transaction_id"]) == ("succeeded", 2, "txn_890001_1")
+
+def test_job_fails_after_max_attempts(gateway, monkeypatch, add_overdue_loan):
+    monkeypatch.setattr(payment_jobs, "PAYMENT_JOB_MAX_ATTEMPTS", 3)
+    book_id = add_overdue_loan("890002", "8900000000031")
+    gateway.process_payment.side_effect = BulkheadFullError("Too many payments in progress")
+    job_id = enqueue_late_fee_payment("890002", book_id)[2]
+
+    while process_next_job("test"):
+        pass
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 3)
+    assert gateway.process_payment.call_count == 3
+
+@pytest.mark.parametrize("error", [PaymentTimeoutError("Payment gateway did not answer within 15s"),
+                                   requests.ReadTimeout("Read timed out")])
+def test_errors_that_may_have_charged_are_not_retried(gateway, error, add_overdue_loan):
+    book_id = add_overdue_loan("890007", "8900000000081")
+    gateway.process_payment.side_effect = error
+    job_id = enqueue_late_fee_payment("890007", book_id)[2]
+
+    while process_next_job("test"):
+        pass
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["attempts"]) == ("failed", 1)
+    gateway.process_payment.assert_called_once()
+
+@pytest.mark.parametrize("error", [ConnectionError("Network Error"), requests.ConnectTimeout("Connect timed out")])
+def test_errors_that_charged_nothing_are_retried(gateway, monkeypatch, error, add_overdue_loan):
+    monkeypatch.setattr(payment_jobs, "backoff_delay", lambda attempts: 0)
+    book_id = add_overdue_loan("890009", "8900000000101")
+    gateway.process_payment.side_effect = [error, (True, "txn_890009_1", "ok")]
+    job_id = enqueue_late_fee_payment("890009", book_id)[2]
+
+    while process_next_job("test"):
+        pass
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["attempts"], job["result"]["transaction_id"]) == ("succeeded", 2, "txn_890009_1")
+
+def test_payment_in_progress_is_retried(gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890008", "8900000000091")
+    loan_id = database.get_open_loan("890008", book_id)["id"]
+    key = lib_service.late_fee_payment_key("890008", book_id, loan_id)
+    database.claim_payment(key, "890008", book_id, loan_id, 2.0, stale_after=300)
+    job_id = enqueue_late_fee_payment("890008", book_id)[2]
+
+    process_next_job("test")
+    assert get_job_status(job_id)["status"] == "queued"
+    database.finish_payment([key], True, "txn_890008_1", "ok")
+    process_next_job("test")
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["result"]["transaction_id"]) == ("succeeded", "txn_890008_1")
+    gateway.process_payment.assert_not_called()
+
+def test_declined_payment_is_not_retried(gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890003", "8900000000041")
+    gateway.process_payment.return_value = (False, "", "Payment declined")
+    job_id = enqueue_late_fee_payment("890003", book_id)[2]
+
+    process_next_job("test")
+
+    job = get_job_status(job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 1, "Payment failed: Payment declined")
+
+def test_refund_job(gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890004", "8900000000051")
+    gateway.process_payment.return_value = (True, "txn_890004_1", "ok")
+    lib_service.pay_late_fees("890004", book_id)
+    job_id = enqueue_refund("txn_890004_1", 1.0)[2]
+
+    process_next_job("test")
+
+    assert get_job_status(job_id)["result"] == {"success": True, "message": "Refund processed"}
+    gateway.refund_payment.assert_called_once_with("txn_890004_1", 1.0)
+
+def test_stale_running_jobs_are_requeued(gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890005", "8900000000061")
+    job_id = enqueue_late_fee_payment("890005", book_id)[2]
+    database.claim_payment_job("crashed-worker")
+
+    assert database.requeue_stale_payment_jobs(datetime.now() - timedelta(minutes=10)) == 0
+    assert database.requeue_stale_payment_jobs(datetime.now() + timedelta(seconds=1)) == 1
+    assert get_job_status(job_id)["status"] == "queued"
+
+def test_each_job_is_claimed_once():
+    for i in range(20):
+        database.enqueue_payment_job("payment", {"n": i}, 5)
+
+    claimed, lock = [], threading.Lock()
+    def worker(name):
+        while (job := database.claim_payment_job(name)) is not None:
+            with lock:
+                claimed.append(job["id"])
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(claimed) == list(range(1, 21))
+
+def test_worker_pool_drains_queue(gateway, add_overdue_loan):
+    # each charge waits until three are in flight, so the jobs only finish if the workers run them together
+    together, workers = threading.Barrier(3, timeout=5), set()
+    def charge(**kwargs):
+        workers.add(threading.current_thread().name)
+        together.wait()
+        return True, f"txn_{kwargs['patron_id']}_1", "ok"
+    gateway.process_payment.side_effect = charge
+    job_ids = [enqueue_late_fee_payment(f"89100{i}", add_overdue_loan(f"89100{i}", f"891000000000{i}"))[2]
+               for i in range(6)]
+    pool = PaymentWorkerPool(workers=3, poll_interval=0.05)
+
+    start = time.perf_counter()
+    pool.start()
+    while any(get_job_status(job_id)["status"] not in ("succeeded", "failed") for job_id in job_ids):
+        assert time.perf_counter() - start < 10
+        time.sleep(0.02)
+    pool.stop(timeout=1)
+
+    assert [get_job_status(job_id)["status"] for job_id in job_ids] == ["succeeded"] * 6
+    assert pool.processed == 6
+    assert workers == {"payment-worker-0", "payment-worker-1", "payment-worker-2"}
+
+def test_pool_checks_for_abandoned_jobs_on_a_timer(monkeypatch):
+    requeue = Mock(return_value=0)
+    monkeypatch.setattr(payment_jobs, "requeue_stale_payment_jobs", requeue)
+    pool = PaymentWorkerPool(workers=2, poll_interval=0.01, requeue_interval=60)
+
+    pool.start()
+    time.sleep(0.2)
+    pool.stop(timeout=1)
+
+    requeue.assert_called_once()
+
+def test_workers_start_with_requests_not_commands(monkeypatch):
+    start = Mock()
+    monkeypatch.setattr(app_module, "start_payment_workers", start)
+    app = app_module.create_app()
+
+    assert app.test_cli_runner().invoke(args=["reconcile-patrons"]).exit_code == 0
+    start.assert_not_called()
+    app.test_client().get("/catalog")
+    start.assert_called()
+
+#---------------------------------------------------------------------------------------------------------
+# API
+#---------------------------------------------------------------------------------------------------------
+
+def test_api_payment_returns_job_immediately(client, gateway, add_overdue_loan):
+    book_id = add_overdue_loan("890006", "8900000000071")
+
+    response = client.post("/api/payments", json={"patron_id": "890006", "book_id": book_id})
+
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["status"] == "queued" and body["status_url"] == f"/api/jobs/{body['job_id']}"
+    gateway.process_payment.assert_not_called()
+
+    process_next_job("test")
+    job = client.get(body["status_url"]).get_json()
+    assert job["status"] == "succeeded" and job["result"]["success"]
+
+def test_api_refund_validation_and_unknown_job(client):
+    response = client.post("/api/refunds", json={"transaction_id": "txn_1", "amount": -1})
+
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Refund amount must be greater than 0."
+    assert client.post("/api/payments", data="not json").status_code == 400
+    assert client.get("/api/jobs/999").status_code == 404
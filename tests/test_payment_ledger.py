@@ -0,0 +1,247 @@
+import threading, time
+import requests
+from datetime import datetime, timedelta
+import database
+from services import library_service as lib_service
+from services.payment_service import ResilientPaymentGateway
+from services.library_service import (
+    pay_late_fees, pay_late_fees_batch, refund_late_fee_payment, get_payment_status
+)
+
+#---------------------------------------------------------------------------------------------------------
+# Payments ledger
+#---------------------------------------------------------------------------------------------------------
+
+def slow_gateway(gateway, release):
+    """gateway behind a 50 ms deadline whose process and refund calls wait for ``release``."""
+    answers = gateway.process_payment.return_value, gateway.refund_payment.return_value
+    gateway.process_payment.side_effect = lambda **kw: release.wait(5) and answers[0]
+    gateway.refund_payment.side_effect = lambda txn, amount: release.wait(5) and answers[1]
+    return ResilientPaymentGateway(gateway, deadline=0.05)
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+def test_retried_payment_is_not_charged_twice(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880000", "8800000000001")
+    gateway = mock_gateway()
+
+    first = pay_late_fees("880000", book_id, gateway)
+    retry = pay_late_fees("880000", book_id, gateway)
+
+    assert first == retry == (True, "Payment successful! Payment of $2.00 processed successfully", "txn_880000_1")
+    gateway.process_payment.assert_called_once()
+
+def test_grown_fee_charges_only_the_unpaid_part(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880011", "8800000000111")  # $2.00 due
+    gateway = mock_gateway("txn_880011_1")
+    assert pay_late_fees("880011", book_id, gateway)[0]
+    with database.db_connection() as conn:  # six more days overdue: $6.50 in all
+        conn.execute("UPDATE borrow_records SET due_date = ? WHERE book_id = ?",
+                     ((datetime.now() - timedelta(days=10)).isoformat(), book_id))
+        conn.commit()
+    gateway.process_payment.return_value = (True, "txn_880011_2", "Payment of $4.50 processed successfully")
+
+    second = pay_late_fees("880011", book_id, gateway)
+    retry = pay_late_fees("880011", book_id, gateway)
+
+    assert second == retry == (True, "Payment successful! Payment of $4.50 processed successfully", "txn_880011_2")
+    assert gateway.process_payment.call_count == 2
+    assert gateway.process_payment.call_args.kwargs["amount"] == 4.5
+
+def test_failed_payment_can_be_retried(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880001", "8800000000011")
+    gateway = mock_gateway("txn_880001_1")
+    gateway.process_payment.side_effect = [(False, "", "Payment declined"), ConnectionError("Network Error"),
+                                           (True, "txn_880001_1", "ok")]
+
+    assert pay_late_fees("880001", book_id, gateway)[0] is False
+    assert pay_late_fees("880001", book_id, gateway)[0] is False
+    assert pay_late_fees("880001", book_id, gateway) == (True, "Payment successful! ok", "txn_880001_1")
+    assert gateway.process_payment.call_count == 3
+
+def test_concurrent_duplicate_requests_charge_once(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880002", "8800000000021")
+    charging, release = threading.Event(), threading.Event()
+    gateway = mock_gateway("txn_880002_1")
+    gateway.process_payment.side_effect = lambda **kwargs: (
+        charging.set() or release.wait(5)) and (True, "txn_880002_1", "ok")
+
+    results = []
+    first = threading.Thread(target=lambda: results.append(pay_late_fees("880002", book_id, gateway)))
+    first.start()
+    assert charging.wait(5)
+    duplicate = pay_late_fees("880002", book_id, gateway)
+    release.set()
+    first.join()
+
+    assert duplicate == (False, "A payment for these late fees is already in progress.", None)
+    assert results[0][0] is True
+    gateway.process_payment.assert_called_once()
+
+def stale_claim(monkeypatch, patron_id, book_id):
+    """Ledger key of a payment claimed, never finished, and now past PAYMENT_PENDING_TIMEOUT."""
+    loan_id = database.get_open_loan(patron_id, book_id)["id"]
+    key = lib_service.late_fee_payment_key(patron_id, book_id, loan_id)
+    assert database.claim_payment(key, patron_id, book_id, loan_id, 2.0, stale_after=300)[0]
+    monkeypatch.setattr(lib_service, "PAYMENT_PENDING_TIMEOUT", 0)
+    return key
+
+def test_stale_pending_payment_is_retried_if_gateway_has_no_charge(monkeypatch, add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880003", "8800000000031")
+    key = stale_claim(monkeypatch, "880003", book_id)
+    gateway = mock_gateway("txn_880003_1")
+    gateway.verify_payment_status.return_value = {"status": "not_found", "message": "Transaction not found"}
+
+    assert pay_late_fees("880003", book_id, gateway)[0] is True
+    gateway.verify_payment_status.assert_called_once_with(idempotency_key=key)
+    gateway.process_payment.assert_called_once()
+
+def test_stale_pending_payment_charged_by_gateway_is_recorded(monkeypatch, add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880014", "8800000000141")
+    key = stale_claim(monkeypatch, "880014", book_id)
+    gateway = mock_gateway("txn_880014_1")
+
+    assert pay_late_fees("880014", book_id, gateway)[2] == "txn_880014_1"
+    gateway.process_payment.assert_not_called()
+    assert database.get_payment(key)["status"] == "succeeded"
+
+def test_stale_pending_payment_is_not_charged_while_gateway_cannot_tell(monkeypatch, add_overdue_loan,
+                                                                        mock_gateway):
+    book_id = add_overdue_loan("880015", "8800000000151")
+    stale_claim(monkeypatch, "880015", book_id)
+    gateway = mock_gateway("txn_880015_1")
+    gateway.verify_payment_status.return_value = {"status": "processing"}
+
+    assert pay_late_fees("880015", book_id, gateway) == (
+        False, "A payment for these late fees is already in progress.", None)
+    gateway.verify_payment_status.side_effect = ConnectionError("Network Error")
+    assert pay_late_fees("880015", book_id, gateway)[0] is False
+    gateway.process_payment.assert_not_called()
+
+def test_batch_skips_loans_already_paid(add_overdue_loan, mock_gateway):
+    paid = add_overdue_loan("880004", "8800000000041")
+    unpaid = add_overdue_loan("880004", "8800000000042")
+    assert pay_late_fees("880004", paid, mock_gateway("txn_880004_1"))[0]
+    gateway = mock_gateway("txn_880004_2")
+
+    report = pay_late_fees_batch([("880004", paid), ("880004", unpaid)], gateway)
+
+    assert [item["transaction_id"] for item in report["items"]] == ["txn_880004_1", "txn_880004_2"]
+    assert report["total_charged"] == 2.0
+    gateway.process_payment.assert_called_once_with(
+        patron_id="880004", amount=2.0, description="Late fees for 'Book 8800000000042'")
+
+def test_final_status_is_cached(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880005", "8800000000051")
+    gateway = mock_gateway("txn_880005_1")
+    pay_late_fees("880005", book_id, gateway)
+
+    assert get_payment_status("txn_880005_1", gateway)["status"] == "completed"
+    assert get_payment_status("txn_880005_1", gateway)["status"] == "completed"
+    gateway.verify_payment_status.assert_called_once()
+
+def test_pending_and_unknown_statuses_are_not_cached(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880006", "8800000000061")
+    gateway = mock_gateway("txn_880006_1")
+    pay_late_fees("880006", book_id, gateway)
+    gateway.verify_payment_status.return_value = {"status": "processing"}
+
+    get_payment_status("txn_880006_1", gateway)
+    get_payment_status("txn_880006_1", gateway)
+    get_payment_status("txn_unknown_1", gateway)
+    get_payment_status("txn_unknown_1", gateway)
+
+    assert gateway.verify_payment_status.call_count == 4
+
+def test_refunds_limited_to_amount_paid(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880007", "8800000000071")
+    gateway = mock_gateway("txn_880007_1")
+    pay_late_fees("880007", book_id, gateway)
+
+    assert refund_late_fee_payment("txn_880007_1", 1.5, gateway)[0] is True
+    success, message = refund_late_fee_payment("txn_880007_1", 1.0, gateway)
+
+    assert success is False
+    assert message == "Refund amount exceeds the amount paid."
+    gateway.refund_payment.assert_called_once_with("txn_880007_1", 1.5)
+    assert refund_late_fee_payment("txn_880007_1", 0.5, gateway)[0] is True
+
+def test_declined_refund_releases_reservation(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880008", "8800000000081")
+    gateway = mock_gateway("txn_880008_1")
+    pay_late_fees("880008", book_id, gateway)
+    gateway.refund_payment.return_value = (False, "Gateway unavailable")
+
+    assert refund_late_fee_payment("txn_880008_1", 2.0, gateway)[0] is False
+    gateway.refund_payment.return_value = (True, "Refund processed")
+    assert refund_late_fee_payment("txn_880008_1", 2.0, gateway)[0] is True
+
+def test_refund_clears_cached_status(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880009", "8800000000091")
+    gateway = mock_gateway("txn_880009_1")
+    pay_late_fees("880009", book_id, gateway)
+    get_payment_status("txn_880009_1", gateway)
+
+    refund_late_fee_payment("txn_880009_1", 2.0, gateway)
+    gateway.verify_payment_status.return_value = {"status": "refunded"}
+
+    assert get_payment_status("txn_880009_1", gateway)["status"] == "refunded"
+
+def test_grouped_batch_charge_refundable_up_to_its_total(add_overdue_loan, mock_gateway):
+    first = add_overdue_loan("880010", "8800000000101")
+    second = add_overdue_loan("880010", "8800000000102")
+    gateway = mock_gateway("txn_880010_1")
+    pay_late_fees_batch([("880010", first), ("880010", second)], gateway)
+
+    assert refund_late_fee_payment("txn_880010_1", 3.0, gateway)[0] is True
+    assert refund_late_fee_payment("txn_880010_1", 1.5, gateway)[1] == "Refund amount exceeds the amount paid."
+    assert refund_late_fee_payment("txn_880010_1", 1.0, gateway)[0] is True
+
+def test_timed_out_payment_is_not_charged_again(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880012", "8800000000121")
+    inner, release = mock_gateway("txn_880012_1"), threading.Event()
+    gateway = slow_gateway(inner, release)
+
+    first = pay_late_fees("880012", book_id, gateway)
+    retry = pay_late_fees("880012", book_id, gateway)
+    release.set()
+    wait_until(lambda: database.get_transaction_payments("txn_880012_1"))
+
+    assert "did not answer" in first[1]
+    assert retry == (False, "A payment for these late fees is already in progress.", None)
+    assert pay_late_fees("880012", book_id, gateway)[2] == "txn_880012_1"
+    inner.process_payment.assert_called_once()
+
+def test_timed_out_refund_keeps_its_reservation_until_answered(add_overdue_loan, mock_gateway):
+    book_id = add_overdue_loan("880013", "8800000000131")
+    inner, release = mock_gateway("txn_880013_1"), threading.Event()
+    pay_late_fees("880013", book_id, inner)
+    inner.refund_payment.return_value = (False, "Refund declined")
+    gateway = slow_gateway(inner, release)
+
+    assert "did not answer" in refund_late_fee_payment("txn_880013_1", 2.0, gateway)[1]
+    assert refund_late_fee_payment("txn_880013_1", 2.0, gateway)[1] == "Refund amount exceeds the amount paid."
+    release.set()
+    wait_until(lambda: database.get_transaction_payments("txn_880013_1")[0]["refunded_amount"] == 0)
+
+    inner.refund_payment.side_effect, inner.refund_payment.return_value = None, (True, "Refund processed")
+    assert refund_late_fee_payment("txn_880013_1", 2.0, inner)[0] is True
+
+def test_grouped_batch_charge_is_checked_by_its_own_key(monkeypatch, add_overdue_loan, mock_gateway):
+    first = add_overdue_loan("880016", "8800000000161")
+    second = add_overdue_loan("880016", "8800000000162")
+    gateway = mock_gateway("txn_880016_1")
+    gateway.process_payment.side_effect = requests.ReadTimeout("read timed out")  # rows stay pending
+    pay_late_fees_batch([("880016", first), ("880016", second)], gateway)
+    monkeypatch.setattr(lib_service, "PAYMENT_PENDING_TIMEOUT", 0)
+
+    report = pay_late_fees_batch([("880016", first), ("880016", second)], gateway)
+
+    charge_keys = {call.kwargs["idempotency_key"] for call in gateway.verify_payment_status.call_args_list}
+    assert len(charge_keys) == 1 and charge_keys.pop().startswith("late_fees:880016:")
+    assert [item["transaction_id"] for item in report["items"]] == ["txn_880016_1", "txn_880016_1"]
+    gateway.process_payment.assert_called_once()
@@ -0,0 +1,144 @@
+import threading, time
+import pytest
+from services import payment_service
+from services import library_service as lib_service
+from services.payment_service import (
+    ResilientPaymentGateway, CircuitOpenError, BulkheadFullError, PaymentTimeoutError
+)
+
+#---------------------------------------------------------------------------------------------------------
+# ResilientPaymentGateway
+#---------------------------------------------------------------------------------------------------------
+
+@pytest.fixture()
+def inner_gateway(mock_gateway):
+    """inner_gateway(**behaviour): mock_gateway whose named methods get the given side effects."""
+    def make(**behaviour):
+        gateway = mock_gateway("txn_123456_1")
+        for name, value in behaviour.items():
+            setattr(getattr(gateway, name), "side_effect", value)
+        return gateway
+    return make
+
+def test_passes_results_through(inner_gateway):
+    inner = inner_gateway()
+    gateway = ResilientPaymentGateway(inner)
+
+    assert gateway.process_payment("123456", 2.0, "Late fees") == (
+        True, "txn_123456_1", "Payment of $2.00 processed successfully")
+    inner.process_payment.assert_called_once_with(patron_id="123456", amount=2.0, description="Late fees")
+    assert gateway.stats()["successes"] == 1
+
+def test_deadline_frees_the_caller(inner_gateway):
+    release = threading.Event()
+    gateway = ResilientPaymentGateway(inner_gateway(process_payment=lambda **kw: release.wait(5)), deadline=0.1)
+
+    start = time.perf_counter()
+    with pytest.raises(PaymentTimeoutError):
+        gateway.process_payment("123456", 2.0)
+
+    assert time.perf_counter() - start < 0.5
+    assert gateway.stats()["timeouts"] == 1
+    assert gateway.stats()["in_flight"] == 1  # the slow call still holds its slot
+    release.set()
+
+def test_circuit_opens_after_consecutive_failures(inner_gateway):
+    inner = inner_gateway(process_payment=ConnectionError("down"))
+    gateway = ResilientPaymentGateway(inner, failure_threshold=3, reset_timeout=60)
+
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            gateway.process_payment("123456", 2.0)
+    with pytest.raises(CircuitOpenError):
+        gateway.process_payment("123456", 2.0)
+
+    assert inner.process_payment.call_count == 3
+    stats = gateway.stats()
+    assert (stats["state"], stats["rejected_open"], stats["times_opened"]) == ("open", 1, 1)
+
+def test_declines_do_not_trip_the_circuit(inner_gateway):
+    inner = inner_gateway()
+    inner.process_payment.return_value = (False, "", "Payment declined")
+    gateway = ResilientPaymentGateway(inner, failure_threshold=2)
+
+    for _ in range(5):
+        assert gateway.process_payment("123456", 2000.0)[0] is False
+
+    assert gateway.state == "closed"
+
+def test_half_open_trial_closes_or_reopens(inner_gateway):
+    inner = inner_gateway(process_payment=[ConnectionError("down"), ConnectionError("still down"),
+                                           (True, "txn_123456_1", "ok")])
+    gateway = ResilientPaymentGateway(inner, failure_threshold=1, reset_timeout=0.05)
+
+    with pytest.raises(ConnectionError):
+        gateway.process_payment("123456", 2.0)
+    time.sleep(0.06)
+    assert gateway.state == "half_open"
+    with pytest.raises(ConnectionError):
+        gateway.process_payment("123456", 2.0)
+    assert gateway.state == "open"
+
+    time.sleep(0.06)
+    assert gateway.process_payment("123456", 2.0)[0] is True
+    assert gateway.state == "closed"
+
+def test_half_open_allows_a_single_trial(inner_gateway):
+    release = threading.Event()
+    inner = inner_gateway(refund_payment=lambda txn, amount: release.wait(5) and (True, "ok"))
+    gateway = ResilientPaymentGateway(inner, failure_threshold=1, reset_timeout=0)
+    gateway._after_call(failed=True)
+
+    trial = threading.Thread(target=gateway.refund_payment, args=("txn_1", 1.0))
+    trial.start()
+    while gateway.stats()["in_flight"] == 0:
+        time.sleep(0.001)
+    with pytest.raises(CircuitOpenError):
+        gateway.refund_payment("txn_1", 1.0)
+    release.set()
+    trial.join()
+
+    assert gateway.state == "closed"
+
+def test_bulkhead_rejects_excess_calls(inner_gateway):
+    release = threading.Event()
+    inner = inner_gateway(verify_payment_status=lambda txn: release.wait(5) and {"status": "completed"})
+    gateway = ResilientPaymentGateway(inner, max_concurrent=2, bulkhead_wait=0.01)
+    callers = [threading.Thread(target=gateway.verify_payment_status, args=("txn_1",)) for _ in range(2)]
+    for caller in callers:
+        caller.start()
+    while gateway.stats()["in_flight"] < 2:
+        time.sleep(0.001)
+
+    with pytest.raises(BulkheadFullError):
+        gateway.verify_payment_status("txn_1")
+
+    release.set()
+    for caller in callers:
+        caller.join()
+    assert gateway.verify_payment_status("txn_1") == {"status": "completed"}
+    assert gateway.stats()["rejected_bulkhead"] == 1
+
+def test_pay_late_fees_fails_fast_when_circuit_open(mocker, inner_gateway):
+    mocker.patch.object(lib_service, "calculate_late_fee_for_book", return_value={"fee_amount": 3.0})
+    mocker.patch.object(lib_service, "get_book_by_id", return_value={"id": 1, "title": "Dune"})
+    inner = inner_gateway(process_payment=ConnectionError("down"))
+    gateway = ResilientPaymentGateway(inner, failure_threshold=1, reset_timeout=60)
+    lib_service.pay_late_fees("123456", 1, gateway)
+
+    success, message, txn = lib_service.pay_late_fees("123456", 1, gateway)
+
+    assert (success, txn) == (False, None)
+    assert "circuit open" in message
+    assert inner.process_payment.call_count == 1
+
+def test_metrics_expose_breaker_state(client, monkeypatch, inner_gateway):
+    gateway = ResilientPaymentGateway(inner_gateway(process_payment=ConnectionError("down")), failure_threshold=1)
+    monkeypatch.setattr(payment_service, "_gateway", gateway)
+    with pytest.raises(ConnectionError):
+        gateway.process_payment("123456", 1.0)
+
+    data = client.get("/api/metrics").get_json()["payment_gateway"]
+
+    assert data["state"] == "open"
+    assert data["failures"] == 1
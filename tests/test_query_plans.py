@@ -0,0 +1,101 @@
+import re
+from datetime import datetime, timedelta
+import pytest, database
+
+#---------------------------------------------------------------------------------------------------------
+# Every query issued by the database helpers must be answered from an index
+#---------------------------------------------------------------------------------------------------------
+
+# A plan step like "SCAN br" reads a whole table (or index); "SEARCH ... USING INDEX" does not.
+# Virtual table steps ("SCAN f VIRTUAL TABLE INDEX ...") are answered by the full-text index.
+FULL_SCAN = re.compile(r"^SCAN (?!CONSTANT ROW)(?!\w+ VIRTUAL TABLE)")
+
+def seed():
+    now = datetime.now()
+    for i in range(1, 4):
+        assert database.insert_book(f"Plan Book {i}", "Author", f"900000000000{i}", 2, 2)
+        assert database.insert_borrow_record("500000", i, now, now + timedelta(days=14))
+    # a paid late fee for loan 1 and a queued payment job
+    assert database.claim_payment("late_fee:500000:1:1", "500000", 1, 1, 2.0, 300)[0]
+    database.finish_payment(["late_fee:500000:1:1"], True, "txn_500000_1", "ok")
+    database.enqueue_payment_job("payment", {"patron_id": "500000", "book_id": 1}, 5)
+
+# get_all_books() and add_sample_data() read the whole catalog by design and are not listed
+HELPER_CALLS = {
+    "get_book_by_id": lambda: database.get_book_by_id(1),
+    "get_book_by_isbn": lambda: database.get_book_by_isbn("9000000000001"),
+    "get_patron_borrowed_books": lambda: database.get_patron_borrowed_books("500000"),
+    "get_patron_borrow_count": lambda: database.get_patron_borrow_count("500000"),
+    "insert_book": lambda: database.insert_book("New", "Author", "9000000000009", 1, 1),
+    "insert_borrow_record": lambda: database.insert_borrow_record("500001", 1, datetime.now(), datetime.now()),
+    "update_book_availability": lambda: database.update_book_availability(1, -1),
+    "update_borrow_record_return_date": lambda: database.update_borrow_record_return_date("500000", 1, datetime.now()),
+    "borrow_book_transaction": lambda: database.borrow_book_transaction("500002", 2, datetime.now(), datetime.now(), 5),
+    "return_book_transaction": lambda: database.return_book_transaction("500000", 2, datetime.now()),
+    "get_patron_loan_records": lambda: database.get_patron_loan_records(["500000", "500001"]),
+    "search_books": lambda: database.search_books("plan", "title", 10),
+    "get_books_by_isbn_prefix": lambda: database.get_books_by_isbn_prefix("90000", 10),
+    "get_late_fee_totals (patrons)": lambda: database.get_late_fee_totals(datetime.now().date(), 0.5, 1.0, 15.0, ["500000"]),
+    "get_catalog_version": database.get_catalog_version,
+    "get_catalog_state": database.get_catalog_state,
+    "get_overdue_loans": lambda: database.get_overdue_loans("500000"),
+    "get_open_loan_fees (patrons)": lambda: database.get_open_loan_fees(datetime.now().date(), 0.5, 1.0, 15.0, ["500000"]),
+    "get_existing_isbns": lambda: database.get_existing_isbns(["9000000000001", "9000000000009"]),
+    "insert_books": lambda: database.insert_books([("New", "Author", "9000000000009", 1, 1)]),
+    "get_open_loan": lambda: database.get_open_loan("500000", 1),
+    "claim_payment (new)": lambda: database.claim_payment("late_fee:500000:2:2", "500000", 2, 2, 2.0, 300),
+    "claim_payment (paid)": lambda: database.claim_payment("late_fee:500000:1:1", "500000", 1, 1, 2.0, 300),
+    "get_payment": lambda: database.get_payment("late_fee:500000:1:1"),
+    "set_charge_key": lambda: database.set_charge_key(["late_fee:500000:1:1"], "late_fees:500000:abc"),
+    "finish_payment": lambda: database.finish_payment(["late_fee:500000:1:1"], True, "txn_500000_1", "ok"),
+    "get_transaction_payments": lambda: database.get_transaction_payments("txn_500000_1"),
+    "get_loan_payments": lambda: database.get_loan_payments(1),
+    "record_gateway_status": lambda: database.record_gateway_status("txn_500000_1", {"status": "completed"}),
+    "reserve_refund": lambda: database.reserve_refund("txn_500000_1", 1.0),
+    "enqueue_payment_job": lambda: database.enqueue_payment_job("refund", {"transaction_id": "txn_500000_1"}, 5),
+    "claim_payment_job": lambda: database.claim_payment_job("worker"),
+    "finish_payment_job": lambda: database.finish_payment_job(1, True, {"success": True}),
+    "retry_payment_job": lambda: database.retry_payment_job(1, datetime.now(), "circuit open"),
+    "get_payment_job": lambda: database.get_payment_job(1),
+    "requeue_stale_payment_jobs": lambda: database.requeue_stale_payment_jobs(datetime.now()),
+    # the first page is a LIMIT-bounded walk of idx_books_title; later pages seek into it
+    "get_books_page (next)": lambda: database.get_books_page("Plan Book 1", 1, 2),
+    "get_books_page (previous)": lambda: database.get_books_page(limit=2, before_title="Plan Book 3", before_id=3),
+}
+
+def capture_statements(monkeypatch, call):
+    """Run call() on fresh pooled connections, returning every SQL statement it executed."""
+    statements = []
+    open_connection = database.get_db_connection
+
+    def traced_connection():
+        conn = open_connection()
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    database.close_all_connections()
+    monkeypatch.setattr(database, "get_db_connection", traced_connection)
+    call()
+    monkeypatch.undo()
+    database.close_all_connections()
+    # FTS5 bookkeeping statements run by triggers address their shadow tables as 'main'.'...'
+    return [s for s in statements
+            if re.match(r"\s*(SELECT|UPDATE|DELETE|INSERT)", s, re.I) and "'main'." not in s]
+
+@pytest.mark.parametrize("name", sorted(HELPER_CALLS))
+def test_helper_queries_do_not_scan_tables(monkeypatch, name):
+    seed()
+    statements = capture_statements(monkeypatch, HELPER_CALLS[name])
+    assert statements, f"{name} issued no queries"
+
+    with database.db_connection() as conn:
+        for sql in statements:
+            plan = [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+            scans = [step for step in plan if FULL_SCAN.match(step)]
+            assert not scans, f"{name} scans a table: {sql.strip()} -> {plan}"
+
+def test_init_database_creates_managed_indexes():
+    with database.db_connection() as conn:
+        names = {row["name"] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+    assert set(database.INDEXES) <= names
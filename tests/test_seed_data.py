@@ -0,0 +1,100 @@
+from datetime import datetime
+import pytest, database
+from services.library_service import MAX_BORROWED_BOOKS, search_books_in_catalog, borrow_book_by_patron
+from services.seed_data import seed_library, zipf_cum_weights
+
+AS_OF = datetime(2026, 3, 1, 12, 0)
+
+def scalar(sql, params=()):
+    with database.db_connection() as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+def test_seed_replaces_sample_data(client):
+    assert database.get_book_by_isbn("9780743273565")  # sample data from create_app
+
+    report = seed_library(books=500, patrons=50, loans=3000, as_of=AS_OF)
+
+    assert database.get_book_by_isbn("9780743273565") is None
+    assert (scalar("SELECT COUNT(*) FROM books"), scalar("SELECT COUNT(*) FROM borrow_records")) == (500, 3000)
+    assert (scalar("SELECT MIN(id) FROM books"), scalar("SELECT MAX(id) FROM books")) == (1, 500)
+    assert report["open_loans"] == scalar("SELECT COUNT(*) FROM borrow_records WHERE return_date IS NULL") > 0
+    assert "The " in client.get("/catalog").get_data(as_text=True)
+
+def test_seeded_data_is_consistent():
+    seed_library(books=300, patrons=40, loans=3000, as_of=AS_OF)
+
+    assert database.reconcile_patron_counters() == []
+    assert scalar('''
+        SELECT COUNT(*) FROM books WHERE available_copies != total_copies - (
+            SELECT COUNT(*) FROM borrow_records WHERE book_id = books.id AND return_date IS NULL)
+    ''') == 0
+    assert scalar('''
+        SELECT MAX(n) FROM (SELECT COUNT(*) AS n FROM borrow_records WHERE return_date IS NULL GROUP BY patron_id)
+    ''') <= MAX_BORROWED_BOOKS
+    assert scalar("SELECT COUNT(*) FROM borrow_records WHERE return_date > ?", (AS_OF.isoformat(),)) == 0
+
+def test_seeded_library_works_through_the_service_layer():
+    version = database.get_catalog_version()
+    seed_library(books=200, patrons=20, loans=500, as_of=AS_OF)
+
+    assert database.get_catalog_version() > version
+    title_word = database.get_book_by_id(7)["title"].split()[1]
+    assert any(book["id"] == 7 for book in search_books_in_catalog(title_word, "title", 200))
+
+    book = next(b for b in database.get_all_books() if b["available_copies"] > 0)
+    assert borrow_book_by_patron("999999", book["id"])[0]
+    assert database.get_patron_borrow_count("999999") == 1
+
+def test_seed_is_deterministic():
+    def snapshot():
+        with database.db_connection() as conn:
+            return ([tuple(row) for row in conn.execute("SELECT * FROM books")],
+                    [tuple(row) for row in conn.execute("SELECT * FROM borrow_records")])
+
+    seed_library(books=100, patrons=10, loans=400, seed=5, as_of=AS_OF)
+    first = snapshot()
+    seed_library(books=100, patrons=10, loans=400, seed=5, as_of=AS_OF)
+    assert snapshot() == first
+
+    seed_library(books=100, patrons=10, loans=400, seed=6, as_of=AS_OF)
+    assert snapshot() != first
+
+def test_popular_titles_take_most_loans():
+    seed_library(books=1000, patrons=100, loans=5000, as_of=AS_OF)
+
+    top_10 = scalar('''
+        SELECT SUM(n) FROM (SELECT COUNT(*) AS n FROM borrow_records GROUP BY book_id ORDER BY n DESC LIMIT 10)
+    ''')
+    assert top_10 > 5000 * 0.25  # 1% of titles; uniform popularity would give them about 1%
+    assert scalar("SELECT MAX(total_copies) FROM books") > 3
+
+def test_overdue_rate_shapes_open_loans():
+    few = seed_library(books=2000, patrons=2000, loans=4000, overdue_rate=0.02, as_of=AS_OF)
+    many = seed_library(books=2000, patrons=2000, loans=4000, overdue_rate=0.2, as_of=AS_OF)
+
+    assert few["overdue_loans"] < many["overdue_loans"]
+    assert 0.1 < many["overdue_loans"] / 4000 < 0.3
+
+def test_zipf_weights():
+    weights = zipf_cum_weights(4, 1.0)
+
+    assert weights == pytest.approx([1, 1.5, 1.5 + 1 / 3, 1.5 + 1 / 3 + 0.25])
+
+def test_seed_command(runner):
+    result = runner.invoke(args=["seed", "--books", "100", "--patrons", "10", "--loans", "500", "--yes"])
+
+    assert result.exit_code == 0, result.output
+    assert "Seeded 100 books and 500 loans for 10 patrons" in result.output
+    assert scalar("SELECT COUNT(*) FROM overdue_loans") > 0
+
+def test_seed_command_asks_before_replacing(runner):
+    result = runner.invoke(args=["seed", "--books", "10", "--loans", "0"], input="n\n")
+
+    assert result.exit_code == 1
+    assert scalar("SELECT COUNT(*) FROM books") == 3
+
+def test_seed_command_rejects_bad_counts(runner):
+    result = runner.invoke(args=["seed", "--patrons", "950000", "--yes"])
+
+    assert result.exit_code == 2
+    assert "900000" in result.output